@@ -0,0 +1,515 @@
+"""Fałszywy demon Dockera działający w procesie benchmarku.
+
+Serwer HTTP obsługuje podzbiór Docker Engine API, którego używa panel
+(kontenery, sieci, stats, info, events), więc kod panelu i docker-py działają
+bez zmian - wystarczy ustawić ``DOCKER_HOST`` na adres z ``start()``.
+Opóźnienia rodzajów wywołań ustawia się w ms, np. ``stats=50,run=200``:
+
+    stats     - GET /containers/{id}/stats
+    inspect   - GET /containers/json i /containers/{id}/json
+    run       - POST /containers/create i /containers/{id}/start
+    networks  - wszystkie wywołania /networks
+"""
+
+import ipaddress
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+API_VERSION = "1.43"
+LATENCY_KINDS = ('stats', 'inspect', 'run', 'networks')
+
+SITE_IMAGE = "nginx:latest"
+TRAEFIK_NAME = "traefik_proxy"
+
+
+def parse_latency(spec):
+    """``"stats=50,run=200"`` (ms) -> ``{'stats': 0.05, 'run': 0.2}`` (s)."""
+    latency = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        kind, _, value = item.partition('=')
+        if kind not in LATENCY_KINDS:
+            raise ValueError(f"Nieznany rodzaj wywołania: {kind} (dostępne: {', '.join(LATENCY_KINDS)})")
+        latency[kind] = float(value) / 1000
+    return latency
+
+
+def _new_id():
+    return uuid.uuid4().hex + uuid.uuid4().hex
+
+
+def _matches(labels, name, status, filters):
+    """Filtry listowania Dockera: label (klucz lub klucz=wartość), name, status."""
+    for expected in filters.get('label', []):
+        key, sep, value = expected.partition('=')
+        if key not in labels or (sep and labels[key] != value):
+            return False
+    if filters.get('name') and not any(re.search(n, name) for n in filters['name']):
+        return False
+    if filters.get('status') and status not in filters['status']:
+        return False
+    return True
+
+
+def _parse_filters(query):
+    raw = query.get('filters', ['{}'])[0]
+    filters = json.loads(raw) if raw else {}
+    # docker-py wysyła listy, starsze klienty - słowniki {wartość: true}
+    return {key: list(value) for key, value in filters.items()}
+
+
+class FakeDockerDaemon:
+    """Stan kontenerów i sieci w pamięci oraz serwer HTTP z opóźnieniami."""
+
+    def __init__(self, latency=None, jitter=0.2):
+        self.latency = dict(latency or {})
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self._containers = {}
+        self._networks = {}
+        # Nazwa -> Id (wyszukiwanie po nazwie bez przeglądania wszystkich obiektów)
+        self._container_names = {}
+        self._network_names = {}
+        self._server = None
+        self._stopped = threading.Event()
+        self._ip = 0
+
+    # Serwer
+
+    def start(self):
+        """Uruchamia serwer na wolnym porcie i zwraca adres dla ``DOCKER_HOST``."""
+        handler = type('Handler', (_Handler,), {'daemon': self})
+        self._server = _Server(('127.0.0.1', 0), handler)
+        threading.Thread(target=self._server.serve_forever, name="fake-docker", daemon=True).start()
+        return f"tcp://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def delay(self, kind):
+        seconds = self.latency.get(kind, 0.0)
+        if seconds > 0:
+            time.sleep(seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    # Stan
+
+    def add_network(self, name, labels=None, subnet=None, options=None):
+        with self._lock:
+            network = {
+                'Id': _new_id(), 'Name': name, 'Labels': dict(labels or {}), 'Containers': set(),
+                'Subnet': subnet, 'Options': dict(options or {}),
+            }
+            self._networks[network['Id']] = network
+            self._network_names[name] = network['Id']
+        return network['Id']
+
+    def add_container(self, name, labels=None, networks=(), status='running', image=SITE_IMAGE, host_config=None):
+        with self._lock:
+            if self._find(self._containers, name) is not None:
+                raise ValueError(f'Conflict. The container name "/{name}" is already in use')
+            attached = []
+            for network_name in networks:
+                network = self._find(self._networks, network_name)
+                if network is None:
+                    raise KeyError(network_name)
+                attached.append(network)
+            container = {
+                'Id': _new_id(), 'Name': name, 'Image': image, 'Labels': dict(labels or {}),
+                'Status': status, 'Networks': {}, 'HostConfig': dict(host_config or {}),
+                'Created': int(time.time()), 'cpu': 0, 'rx': 0, 'tx': 0,
+            }
+            self._containers[container['Id']] = container
+            self._container_names[name] = container['Id']
+            for network in attached:
+                self._connect(network, container)
+        return container['Id']
+
+    def seed_sites(self, names):
+        """Działające kontenery i sieci stron tak, jak zostawia je panel, oraz Traefik."""
+        traefik_networks = []
+        for name in names:
+            network = f"{name}_isolated"
+            self.add_network(network)
+            traefik_networks.append(network)
+            self.add_container(
+                name,
+                labels={
+                    "traefik.enable": "true",
+                    "isolation.level": "full",
+                    "hosting.network": network,
+                },
+                networks=[network],
+                host_config={'Memory': 512 * 1024 * 1024},
+            )
+        if self.get_container(TRAEFIK_NAME) is None:
+            self.add_container(TRAEFIK_NAME, image="traefik:latest", networks=traefik_networks)
+        else:
+            with self._lock:
+                traefik = self._find(self._containers, TRAEFIK_NAME)
+                for network in traefik_networks:
+                    self._connect(self._find(self._networks, network), traefik)
+
+    def set_status(self, names, status):
+        with self._lock:
+            for name in names:
+                container = self._find(self._containers, name)
+                if container is not None:
+                    container['Status'] = status
+
+    def get_container(self, name):
+        with self._lock:
+            return self._find(self._containers, name)
+
+    def _find(self, items, ref):
+        """Obiekt po pełnym Id, nazwie lub prefiksie Id."""
+        if ref in items:
+            return items[ref]
+        names = self._container_names if items is self._containers else self._network_names
+        item_id = names.get(ref)
+        if item_id is not None:
+            return items[item_id]
+        if len(ref) >= 12:
+            for item_id, item in items.items():
+                if item_id.startswith(ref):
+                    return item
+        return None
+
+    def _connect(self, network, container, address=None):
+        self._ip += 1
+        network['Containers'].add(container['Id'])
+        container['Networks'][network['Name']] = {
+            'NetworkID': network['Id'],
+            'IPAddress': address or f"172.{16 + self._ip // 65536 % 16}.{self._ip // 256 % 256}.{self._ip % 256}",
+        }
+
+    # Reprezentacje JSON
+
+    def container_summary(self, c):
+        return {
+            'Id': c['Id'], 'Names': [f"/{c['Name']}"], 'Image': c['Image'], 'Created': c['Created'],
+            'State': c['Status'], 'Status': 'Up 1 hour' if c['Status'] == 'running' else 'Exited (0)',
+            'Labels': c['Labels'], 'NetworkSettings': {'Networks': c['Networks']},
+        }
+
+    def container_inspect(self, c):
+        return {
+            'Id': c['Id'], 'Name': f"/{c['Name']}", 'Created': c['Created'], 'Image': c['Image'],
+            'RestartCount': 0,
+            'State': {
+                'Status': c['Status'], 'Running': c['Status'] == 'running',
+                'ExitCode': 0, 'OOMKilled': False,
+            },
+            'Config': {'Image': c['Image'], 'Labels': c['Labels']},
+            'HostConfig': c['HostConfig'],
+            'NetworkSettings': {'Networks': c['Networks']},
+        }
+
+    def container_stats(self, c):
+        # Liczniki rosną między odczytami jak w prawdziwym kontenerze
+        c['cpu'] += random.randint(1, 50) * 10 ** 6
+        c['rx'] += random.randint(0, 64 * 1024)
+        c['tx'] += random.randint(0, 256 * 1024)
+        limit = c['HostConfig'].get('Memory') or 512 * 1024 * 1024
+        return {
+            'read': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'cpu_stats': {
+                'cpu_usage': {'total_usage': c['cpu']},
+                'system_cpu_usage': int(time.time() * 10 ** 9) * 4,
+                'online_cpus': 4,
+            },
+            'precpu_stats': {
+                'cpu_usage': {'total_usage': c['cpu'] - 10 ** 6},
+                'system_cpu_usage': int(time.time() * 10 ** 9) * 4 - 4 * 10 ** 9,
+            },
+            'memory_stats': {'usage': random.randint(8, 96) * 1024 * 1024, 'limit': limit},
+            'networks': {'eth0': {'rx_bytes': c['rx'], 'tx_bytes': c['tx']}},
+        }
+
+    def network_inspect(self, n):
+        return {
+            'Id': n['Id'], 'Name': n['Name'], 'Driver': 'bridge', 'Scope': 'local',
+            'Internal': False, 'Labels': n['Labels'], 'Options': n['Options'],
+            'IPAM': {'Driver': 'default', 'Config': [{'Subnet': n['Subnet']}] if n['Subnet'] else []},
+            'Containers': {
+                cid: {
+                    'Name': self._containers[cid]['Name'],
+                    'IPv4Address': f"{self._containers[cid]['Networks'][n['Name']]['IPAddress']}/16",
+                }
+                for cid in n['Containers'] if cid in self._containers
+            },
+        }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Domyślna kolejka (5) gubi połączenia przy równoległych klientach - SYN ponawiany po 1 s
+    request_queue_size = 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Trasy Docker Engine API; ``daemon`` ustawia ``FakeDockerDaemon.start``."""
+
+    protocol_version = "HTTP/1.1"
+    # Nagłówki i treść idą osobnymi zapisami - bez tego Nagle + opóźnione ACK dodają ~40 ms
+    disable_nagle_algorithm = True
+    daemon = None
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status=200, body=None):
+        data = b'' if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, message):
+        self._reply(status, {'message': message})
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        path = re.sub(r'^/v1\.\d+', '', unquote(url.path))
+        query = parse_qs(url.query)
+        body = self._body() if method in ('POST', 'PUT') else {}
+        for route_method, pattern, handler in ROUTES:
+            if route_method != method:
+                continue
+            match = re.fullmatch(pattern, path)
+            if match:
+                try:
+                    return handler(self, query, body, *match.groups())
+                except KeyError as e:
+                    return self._error(404, f"No such object: {e.args[0]}")
+        self._error(404, f"page not found: {method} {path}")
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def do_HEAD(self):
+        self._dispatch('HEAD')
+
+    # Ogólne
+
+    def ping(self, query, body):
+        data = b'OK'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Api-Version', API_VERSION)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def version(self, query, body):
+        self._reply(200, {'Version': '24.0.0-fake', 'ApiVersion': API_VERSION, 'MinAPIVersion': '1.12'})
+
+    def info(self, query, body):
+        with self.daemon._lock:
+            containers = list(self.daemon._containers.values())
+        self._reply(200, {
+            'NCPU': 4, 'MemTotal': 8 * 1024 ** 3, 'Name': 'fake-docker',
+            'Containers': len(containers),
+            'ContainersRunning': sum(c['Status'] == 'running' for c in containers),
+        })
+
+    def events(self, query, body):
+        # Strumień bez zdarzeń trwający do zatrzymania demona
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.wfile.flush()
+        self.daemon._stopped.wait()
+        self.close_connection = True
+
+    # Kontenery
+
+    def _container(self, ref):
+        container = self.daemon._find(self.daemon._containers, ref)
+        if container is None:
+            raise KeyError(ref)
+        return container
+
+    def containers_list(self, query, body):
+        self.daemon.delay('inspect')
+        filters = _parse_filters(query)
+        show_all = query.get('all', ['0'])[0] in ('1', 'true', 'True')
+        with self.daemon._lock:
+            result = [
+                self.daemon.container_summary(c) for c in self.daemon._containers.values()
+                if (show_all or c['Status'] == 'running')
+                and _matches(c['Labels'], c['Name'], c['Status'], filters)
+            ]
+        self._reply(200, result)
+
+    def containers_create(self, query, body):
+        self.daemon.delay('run')
+        name = query.get('name', [''])[0] or _new_id()[:12]
+        host_config = body.get('HostConfig') or {}
+        network = host_config.get('NetworkMode')
+        networks = [network] if network and network not in ('default', 'bridge', 'host') else []
+        try:
+            container_id = self.daemon.add_container(
+                name, labels=body.get('Labels'), networks=networks, status='created',
+                image=body.get('Image', SITE_IMAGE), host_config=host_config,
+            )
+        except ValueError as e:
+            return self._error(409, str(e))
+        self._reply(201, {'Id': container_id, 'Warnings': []})
+
+    def container_inspect(self, query, body, ref):
+        self.daemon.delay('inspect')
+        with self.daemon._lock:
+            data = self.daemon.container_inspect(self._container(ref))
+        self._reply(200, data)
+
+    def container_stats(self, query, body, ref):
+        self.daemon.delay('stats')
+        with self.daemon._lock:
+            data = self.daemon.container_stats(self._container(ref))
+        self._reply(200, data)
+
+    def container_action(self, query, body, ref, action):
+        if action == 'start':
+            self.daemon.delay('run')
+        with self.daemon._lock:
+            container = self._container(ref)
+            if action in ('start', 'restart', 'unpause'):
+                container['Status'] = 'running'
+            elif action in ('stop', 'kill'):
+                if action == 'stop' or query.get('signal', ['SIGKILL'])[0] in ('SIGKILL', 'KILL', '9'):
+                    container['Status'] = 'exited'
+            elif action == 'update':
+                container['HostConfig'].update(body)
+                return self._reply(200, {'Warnings': []})
+        self._reply(204)
+
+    def container_wait(self, query, body, ref):
+        # Kontenery jednorazowe (np. pomocnik zapory) kończą się od razu
+        with self.daemon._lock:
+            container = self._container(ref)
+            container['Status'] = 'exited'
+        self._reply(200, {'StatusCode': 0})
+
+    def container_remove(self, query, body, ref):
+        with self.daemon._lock:
+            container = self._container(ref)
+            del self.daemon._containers[container['Id']]
+            del self.daemon._container_names[container['Name']]
+            for network in self.daemon._networks.values():
+                network['Containers'].discard(container['Id'])
+        self._reply(204)
+
+    # Sieci
+
+    def _network(self, ref):
+        network = self.daemon._find(self.daemon._networks, ref)
+        if network is None:
+            raise KeyError(ref)
+        return network
+
+    def networks_list(self, query, body):
+        self.daemon.delay('networks')
+        filters = _parse_filters(query)
+        with self.daemon._lock:
+            result = [
+                self.daemon.network_inspect(n) for n in self.daemon._networks.values()
+                if _matches(n['Labels'], n['Name'], None, filters)
+            ]
+        self._reply(200, result)
+
+    def networks_create(self, query, body):
+        self.daemon.delay('networks')
+        with self.daemon._lock:
+            exists = self.daemon._find(self.daemon._networks, body['Name']) is not None
+        if exists:
+            return self._error(409, f"network with name {body['Name']} already exists")
+        subnets = [c['Subnet'] for c in (body.get('IPAM') or {}).get('Config') or [] if c.get('Subnet')]
+        subnet = subnets[0] if subnets else None
+        if subnet is not None:
+            requested = ipaddress.ip_network(subnet)
+            with self.daemon._lock:
+                taken = [n['Subnet'] for n in self.daemon._networks.values() if n['Subnet']]
+            if any(requested.overlaps(ipaddress.ip_network(t)) for t in taken):
+                return self._error(403, "Pool overlaps with other one on this address space")
+        network_id = self.daemon.add_network(body['Name'], body.get('Labels'), subnet, body.get('Options'))
+        self._reply(201, {'Id': network_id, 'Warning': ''})
+
+    def network_inspect(self, query, body, ref):
+        self.daemon.delay('networks')
+        with self.daemon._lock:
+            data = self.daemon.network_inspect(self._network(ref))
+        self._reply(200, data)
+
+    def network_connect(self, query, body, ref, action):
+        self.daemon.delay('networks')
+        with self.daemon._lock:
+            network = self._network(ref)
+            container = self._container(body['Container'])
+            if action == 'disconnect':
+                network['Containers'].discard(container['Id'])
+                container['Networks'].pop(network['Name'], None)
+            elif container['Id'] in network['Containers']:
+                return self._error(403, f"endpoint with name {container['Name']} already exists in network {network['Name']}")
+            else:
+                address = ((body.get('EndpointConfig') or {}).get('IPAMConfig') or {}).get('IPv4Address')
+                self.daemon._connect(network, container, address)
+        self._reply(200)
+
+    def network_remove(self, query, body, ref):
+        self.daemon.delay('networks')
+        with self.daemon._lock:
+            network = self._network(ref)
+            del self.daemon._networks[network['Id']]
+            del self.daemon._network_names[network['Name']]
+        self._reply(204)
+
+    # Obrazy - wszystkie są "pobrane"
+
+    def image_inspect(self, query, body, name):
+        self._reply(200, {'Id': f"sha256:{_new_id()}", 'RepoTags': [name]})
+
+    def image_pull(self, query, body):
+        self._reply(200, {'status': 'Downloaded'})
+
+
+ROUTES = [
+    ('GET', r'/_ping', _Handler.ping),
+    ('HEAD', r'/_ping', _Handler.ping),
+    ('GET', r'/version', _Handler.version),
+    ('GET', r'/info', _Handler.info),
+    ('GET', r'/events', _Handler.events),
+    ('GET', r'/containers/json', _Handler.containers_list),
+    ('POST', r'/containers/create', _Handler.containers_create),
+    ('GET', r'/containers/([^/]+)/json', _Handler.container_inspect),
+    ('GET', r'/containers/([^/]+)/stats', _Handler.container_stats),
+    ('POST', r'/containers/([^/]+)/(start|stop|restart|kill|update|pause|unpause)', _Handler.container_action),
+    ('POST', r'/containers/([^/]+)/wait', _Handler.container_wait),
+    ('DELETE', r'/containers/([^/]+)', _Handler.container_remove),
+    ('GET', r'/networks', _Handler.networks_list),
+    ('POST', r'/networks/create', _Handler.networks_create),
+    ('GET', r'/networks/([^/]+)', _Handler.network_inspect),
+    ('POST', r'/networks/([^/]+)/(connect|disconnect)', _Handler.network_connect),
+    ('DELETE', r'/networks/([^/]+)', _Handler.network_remove),
+    ('GET', r'/images/(.+)/json', _Handler.image_inspect),
+    ('POST', r'/images/create', _Handler.image_pull),
+]
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""Benchmark gorących ścieżek panelu na fałszywym demonie Dockera.
+
+Dla każdego rozmiaru (liczby stron) generowana jest baza SQLite i drzewo
+user_data, a panel rozmawia z demonem z benchmarks/fake_docker.py:
+
+    autostart  - autostart_sites (uzgodnienie wszystkich stron)
+    metrics    - get_all_sites_metrics (równoległe odczyty stats)
+    database   - start workera i panelu, renderowanie /database (z indeksem dysku)
+    create     - POST /create aż do zakończenia zadania w kolejce
+
+Każdy rozmiar działa w osobnym procesie, bo moduły panelu czytają
+konfigurację przy imporcie. Przykłady:
+    python benchmarks/hot_paths.py --sizes 10,100,1000,10000
+    python benchmarks/hot_paths.py --sizes 1000 --bench metrics --latency stats=200
+    python benchmarks/hot_paths.py --output wynik.json
+    python benchmarks/hot_paths.py --baseline wynik.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fake_docker
+
+BENCHMARKS = ('autostart', 'metrics', 'database', 'create')
+DEFAULT_SIZES = "10,100,1000,10000"
+DEFAULT_LATENCY = "stats=50,inspect=2,run=200,networks=10"
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(bench, sites, samples, items=1, unit='ops/s', calls=None):
+    """Wiersz wyniku: p50/p99 czasu operacji i przepustowość (``items`` na operację)."""
+    return {
+        'bench': bench,
+        'sites': sites,
+        'n': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+        'throughput': round(items * len(samples) / sum(samples), 1) if sum(samples) else 0.0,
+        'unit': unit,
+        'docker_calls': round(calls / len(samples), 1) if calls is not None else None,
+    }
+
+
+# Dane syntetyczne
+
+def generate_tree(user_data, names, files):
+    """Katalogi stron: index.html i pliki zasobów o różnych rozmiarach."""
+    for i, name in enumerate(names):
+        site_dir = os.path.join(user_data, name)
+        os.makedirs(os.path.join(site_dir, "assets", "img"))
+        with open(os.path.join(site_dir, "index.html"), "w") as f:
+            f.write(f"<h1>{name}</h1>" + "<p>lorem ipsum</p>" * 50)
+        for j in range(files - 1):
+            ext = ('js', 'css', 'png', 'svg')[j % 4]
+            subdir = "img" if ext in ('png', 'svg') else ""
+            path = os.path.join(site_dir, "assets", subdir, f"file{j}.{uuid.uuid4().hex[:8]}.{ext}")
+            with open(path, "wb") as f:
+                f.write(b"x" * (512 + (i * 7919 + j * 104729) % 20000))
+
+
+def generate_database(database, names):
+    """Strony z domyślnymi limitami w jednej transakcji."""
+    database.init_db()
+    with database.transaction():
+        for name in names:
+            database.add_site(name, '', f"{name}.localhost")
+
+
+# Pomiary (w procesie pracownika)
+
+def _calls(docker_client):
+    return sum(docker_client.get_call_totals().values())
+
+
+def bench_autostart(ctx):
+    from core_engine import docker_client
+    from core_engine import inventory
+    from web_panel import autostart
+
+    samples, per_site = [], []
+    calls = _calls(docker_client)
+    for _ in range(ctx['repeat']):
+        ctx['daemon'].set_status(ctx['stopped_names'], 'exited')
+        inventory.get_inventory().invalidate()
+        started = time.perf_counter()
+        timings = autostart.autostart_sites(background=False)
+        samples.append(time.perf_counter() - started)
+        per_site.extend(t.total for t in timings)
+    calls = _calls(docker_client) - calls
+    sites = len(ctx['names'])
+    return [
+        summarize('autostart', sites, samples, items=sites, unit='sites/s', calls=calls),
+        summarize('autostart/site', sites, per_site),
+    ]
+
+
+def bench_metrics(ctx):
+    from core_engine import docker_client
+    from core_engine import metrics
+
+    samples = []
+    calls = _calls(docker_client)
+    for _ in range(ctx['repeat']):
+        started = time.perf_counter()
+        results = metrics.get_all_sites_metrics()
+        samples.append(time.perf_counter() - started)
+        if len(results) < len(ctx['names']):
+            print(f"⚠️  metrics: {len(results)}/{len(ctx['names'])} stron w czasie")
+    calls = _calls(docker_client) - calls
+    sites = len(ctx['names'])
+    return [summarize('metrics', sites, samples, items=sites, unit='sites/s', calls=calls)]
+
+
+def _panel(ctx):
+    """Start panelu (worker, potem zadania sterujące) - raz na proces."""
+    if 'app' not in ctx:
+        started = time.perf_counter()
+        from web_panel import app
+        app.init_worker()
+        ctx['cold_start'] = time.perf_counter() - started
+        app.start_control_plane()
+        ctx['startup'] = time.perf_counter() - started
+        ctx['app'] = app
+        ctx['client'] = app.app.test_client()
+    return ctx['app'], ctx['client']
+
+
+def bench_database(ctx):
+    from core_engine import disk_index
+    from core_engine import docker_client
+
+    app, client = _panel(ctx)
+    index_samples = []
+    for name in ctx['names']:
+        started = time.perf_counter()
+        disk_index.refresh_site(name)
+        index_samples.append(time.perf_counter() - started)
+
+    samples = []
+    calls = _calls(docker_client)
+    for _ in range(ctx['repeat']):
+        started = time.perf_counter()
+        response = client.get("/database")
+        samples.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f"/database: HTTP {response.status_code}")
+    calls = _calls(docker_client) - calls
+    sites = len(ctx['names'])
+    return [
+        summarize('startup (worker)', sites, [ctx['cold_start']]),
+        summarize('startup', sites, [ctx['startup']]),
+        summarize('disk_index/site', sites, index_samples),
+        summarize('/database', sites, samples, calls=calls),
+    ]
+
+
+def bench_create(ctx):
+    from core_engine import docker_client
+    from web_panel import jobs
+
+    app, client = _panel(ctx)
+    http, total = [], []
+    calls = _calls(docker_client)
+    for i in range(ctx['creates']):
+        started = time.perf_counter()
+        response = client.post(
+            "/create",
+            data={'site_name': f"bench{i}", 'hosting_mode': 'isolated', 'idempotency_key': uuid.uuid4().hex},
+            headers={'Accept': 'application/json'},
+        )
+        http.append(time.perf_counter() - started)
+        if response.status_code != 202:
+            raise RuntimeError(f"/create: HTTP {response.status_code} {response.get_data(as_text=True)}")
+        job_id = response.get_json()['job_id']
+        while True:
+            job = jobs.get_job(job_id)
+            if job['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.002)
+        total.append(time.perf_counter() - started)
+        if job['status'] == 'failed':
+            raise RuntimeError(f"/create: zadanie nieudane: {job['error']}")
+    calls = _calls(docker_client) - calls
+    sites = len(ctx['names'])
+    return [
+        summarize('/create (HTTP)', sites, http),
+        summarize('/create (gotowa)', sites, total, calls=calls),
+    ]
+
+
+def run_worker(args):
+    """Jeden rozmiar: dane, demon, pomiary; wynik jako JSON w ``--result``."""
+    names = [f"site{i}" for i in range(args.worker)]
+    workdir = tempfile.mkdtemp(prefix=f"hosting-bench-{args.worker}-")
+    user_data = os.path.join(workdir, "user_data")
+    daemon = fake_docker.FakeDockerDaemon(latency=fake_docker.parse_latency(args.latency))
+
+    # Konfiguracja przed importem modułów panelu; tło, które zaburzałoby pomiary, wyłączone
+    os.environ.update({
+        'DOCKER_HOST': daemon.start(),
+        'DB_PATH': os.path.join(workdir, "database"),
+        'USER_DATA_DIR': user_data,
+        'METRICS_STREAMING': '0',
+        'METRICS_SAMPLER': '0',
+        'WARM_POOL_SIZE': '0',
+        'REBALANCE_ENABLED': '0',
+        'IDLE_ENABLED': '0',
+        'DISK_INDEX_INOTIFY': '0',
+        'DISK_INDEX_INTERVAL': '3600',
+    })
+    # host_path i konfiguracja nginx liczone są od bieżącego katalogu
+    os.chdir(workdir)
+
+    from web_panel import database
+
+    try:
+        started = time.perf_counter()
+        generate_tree(user_data, names, args.files)
+        generate_database(database, names)
+        every = round(1 / args.stopped) if args.stopped else 0
+        stopped_names = names[::every] if every else []
+        daemon.seed_sites(names)
+        print(f"🧪 {len(names)} stron wygenerowanych w {time.perf_counter() - started:.1f}s")
+
+        ctx = {
+            'names': names, 'daemon': daemon, 'stopped_names': stopped_names,
+            'repeat': args.repeat, 'creates': args.creates,
+        }
+        results = []
+        for bench in args.bench:
+            results.extend(BENCH_FUNCS[bench](ctx))
+        with open(args.result, "w") as f:
+            json.dump(results, f)
+    finally:
+        daemon.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+BENCH_FUNCS = {
+    'autostart': bench_autostart,
+    'metrics': bench_metrics,
+    'database': bench_database,
+    'create': bench_create,
+}
+
+
+# Orkiestracja
+
+def print_results(results, baseline=None, tolerance=0.2):
+    """Tabela wyników; z ``baseline`` zaznacza wiersze wolniejsze o więcej niż ``tolerance``."""
+    previous = {(r['bench'], r['sites']): r for r in baseline or []}
+    regressions = []
+    print(f"\n{'benchmark':<18} {'stron':>6} {'n':>5} {'p50 ms':>10} {'p99 ms':>10} "
+          f"{'przepustowość':>18} {'wywołań':>8}")
+    for r in results:
+        mark = ""
+        old = previous.get((r['bench'], r['sites']))
+        if old and old['p50_ms'] > 0:
+            change = r['p50_ms'] / old['p50_ms'] - 1
+            mark = f"  {change:+.0%}"
+            if change > tolerance:
+                mark += " ❌"
+                regressions.append(r)
+        calls = '' if r['docker_calls'] is None else r['docker_calls']
+        print(f"{r['bench']:<18} {r['sites']:>6} {r['n']:>5} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f} "
+              f"{r['throughput']:>11.1f} {r['unit']:<6} {calls:>8}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='liczby stron, np. 10,100,1000')
+    parser.add_argument('--bench', default=','.join(BENCHMARKS), help=f"które pomiary ({','.join(BENCHMARKS)})")
+    parser.add_argument('--latency', default=DEFAULT_LATENCY, help='opóźnienia demona w ms (stats,inspect,run,networks)')
+    parser.add_argument('--repeat', type=int, default=5, help='powtórzenia pomiarów całościowych')
+    parser.add_argument('--creates', type=int, default=20, help='ile stron założyć przez /create')
+    parser.add_argument('--files', type=int, default=10, help='plików na stronę w user_data')
+    parser.add_argument('--stopped', type=float, default=0.1, help='ułamek zatrzymanych kontenerów przed autostartem')
+    parser.add_argument('--output', help='zapis wyników (JSON) do porównań')
+    parser.add_argument('--baseline', help='wyniki wcześniejszego przebiegu do porównania')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='dopuszczalny wzrost p50 względem baseline')
+    parser.add_argument('--verbose', action='store_true', help='pokaż wyjście panelu')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.bench = [b for b in args.bench.split(',') if b]
+    unknown = set(args.bench) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"nieznane pomiary: {', '.join(sorted(unknown))}")
+    fake_docker.parse_latency(args.latency)
+
+    if args.worker is not None:
+        run_worker(args)
+        return
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(',') if s]:
+        print(f"⏱️  {size} stron...")
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            result_path = f.name
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker', str(size), '--result', result_path]
+        for option in ('bench', 'latency', 'repeat', 'creates', 'files', 'stopped'):
+            value = getattr(args, option)
+            cmd += [f'--{option}', ','.join(value) if isinstance(value, list) else str(value)]
+        started = time.monotonic()
+        proc = subprocess.run(cmd, stdout=None if args.verbose else subprocess.DEVNULL)
+        try:
+            if proc.returncode != 0:
+                print(f"❌ {size} stron: pracownik zakończył się kodem {proc.returncode}")
+                continue
+            with open(result_path) as f:
+                results.extend(json.load(f))
+        finally:
+            os.unlink(result_path)
+        print(f"   gotowe w {time.monotonic() - started:.1f}s")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = print_results(results, baseline, args.tolerance)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        print(f"\n❌ Regresje: {len(regressions)} (p50 wolniej o ponad {args.tolerance:.0%})")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Pomiar czasu zakładania kontenera strony (p50/p95/p99) z pulą i bez niej.
+
+Uruchamiać w kontenerze panelu:
+    python benchmarks/provision_latency.py --sites 50
+    python benchmarks/provision_latency.py --sites 50 --no-pool
+"""
+
+import argparse
+import sys
+import time
+sys.path.insert(0, '/app')
+
+from core_engine import docker_manager
+from core_engine import warm_pool
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sites', type=int, default=20, help='ile stron założyć')
+    parser.add_argument('--no-pool', action='store_true', help='bez puli gotowych sieci')
+    parser.add_argument('--prefix', default='bench', help='prefiks nazw stron testowych')
+    args = parser.parse_args()
+
+    if not args.no_pool:
+        pool = warm_pool.start_pool(size=args.sites)
+        print(f'Czekam na wypełnienie puli ({args.sites} sieci)...')
+        while pool is not None and pool.available() < args.sites:
+            time.sleep(0.5)
+
+    names = [f'{args.prefix}{i}' for i in range(args.sites)]
+    latencies = []
+    try:
+        for name in names:
+            started = time.monotonic()
+            container = docker_manager.start_container(name, cpu_limit=10, ram_limit_mb=64)
+            elapsed = time.monotonic() - started
+            if container is None:
+                print(f'❌ {name}: błąd uruchamiania')
+                continue
+            latencies.append(elapsed)
+    finally:
+        for name in names:
+            docker_manager.stop_container(name)
+
+    if not latencies:
+        print('Brak udanych pomiarów')
+        sys.exit(1)
+
+    mode = 'bez puli' if args.no_pool else 'z pulą'
+    print(f'\n⏱️  Zakładanie kontenera ({mode}, n={len(latencies)}):')
+    for p in (50, 95, 99):
+        print(f'   p{p}: {percentile(latencies, p) * 1000:.0f} ms')
+    print(f'   max: {max(latencies) * 1000:.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+"""Przyrostowe kopie zapasowe stron z deduplikacją fragmentów plików.
+
+Pliki stron dzielone są na fragmenty adresowane skrótem SHA-256; każdy
+unikalny fragment jest zapisywany raz dla wszystkich stron. Migawka strony
+to manifest (ścieżka -> rozmiar, mtime, tryb, lista fragmentów), którego
+ścieżka trafia do tabeli ``backups``.
+"""
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from core_engine import deploy
+from web_panel import database
+
+# Czy kopie są robione okresowo w tle
+BACKUP_ENABLED = os.environ.get("BACKUP_ENABLED", "1") == "1"
+# Katalog magazynu kopii (fragmenty i manifesty)
+BACKUP_DIR = os.environ.get("BACKUP_DIR", "/app/backups")
+# Co ile sekund robimy kopię wszystkich stron
+BACKUP_INTERVAL = float(os.environ.get("BACKUP_INTERVAL", str(24 * 3600)))
+# Ile stron kopiujemy równolegle
+BACKUP_WORKERS = int(os.environ.get("BACKUP_WORKERS", "4"))
+# Łączny limit odczytu plików stron (MB/s, 0 - bez limitu)
+BACKUP_IO_MB_S = float(os.environ.get("BACKUP_IO_MB_S", "50"))
+# Ile ostatnich migawek każdej strony zostawiamy
+BACKUP_KEEP = int(os.environ.get("BACKUP_KEEP", "7"))
+# Rozmiar fragmentu pliku
+CHUNK_SIZE = int(os.environ.get("BACKUP_CHUNK_MB", "4")) * 1024 * 1024
+# Poziom kompresji fragmentów (zlib)
+COMPRESS_LEVEL = int(os.environ.get("BACKUP_COMPRESS_LEVEL", "3"))
+# Ile plików odtwarzamy równolegle
+RESTORE_WORKERS = int(os.environ.get("BACKUP_RESTORE_WORKERS", "8"))
+
+CHUNKS_DIRNAME = "chunks"
+MANIFESTS_DIRNAME = "manifests"
+LOCK_NAME = ".lock"
+MANIFEST_VERSION = 1
+
+# Wpis pliku w manifeście: [rozmiar, mtime_ns, tryb, [skróty fragmentów]]
+_SIZE, _MTIME, _MODE, _CHUNKS = range(4)
+
+
+class Throttle:
+    """Wspólny limit przepustowości odczytu dla wszystkich wątków kopii."""
+
+    def __init__(self, mb_per_s=BACKUP_IO_MB_S):
+        self.rate = mb_per_s * 1024 * 1024
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def consume(self, n):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + n / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+@contextmanager
+def _store_lock(root, exclusive=False):
+    """Blokada magazynu: kopie i odtwarzanie współdzielone, sprzątanie wyłączne.
+
+    ``flock`` działa na otwarty plik, więc dotyczy zarówno wątków, jak
+    i innych procesów (np. skryptu z crona).
+    """
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_NAME), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def chunk_path(root, digest):
+    return os.path.join(root, CHUNKS_DIRNAME, digest[:2], digest[2:4], digest)
+
+
+def _store_chunk(root, data):
+    """Zapisuje fragment, jeśli go jeszcze nie ma; zwraca (skrót, nowe bajty)."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = chunk_path(root, digest)
+    if os.path.exists(path):
+        return digest, 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(zlib.compress(data, COMPRESS_LEVEL))
+    os.replace(tmp, path)
+    return digest, os.path.getsize(path)
+
+
+def _read_chunk(root, digest):
+    with open(chunk_path(root, digest), "rb") as f:
+        return zlib.decompress(f.read())
+
+
+def load_manifest(path):
+    with gzip.open(path, "rt") as f:
+        return json.load(f)
+
+
+def _write_manifest(root, site_name, manifest):
+    directory = os.path.join(root, MANIFESTS_DIRNAME, site_name)
+    os.makedirs(directory, exist_ok=True)
+    name = time.strftime("%Y%m%d-%H%M%S", time.gmtime(manifest['created'])) + f"-{uuid.uuid4().hex[:8]}.json.gz"
+    path = os.path.join(directory, name)
+    with gzip.open(f"{path}.tmp", "wt", compresslevel=6) as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def _previous_files(site_id):
+    """Pliki z ostatniej migawki strony (pusty słownik, gdy jej brak)."""
+    row = database.get_latest_backup(site_id)
+    if row is None:
+        return {}
+    try:
+        return load_manifest(row['backup_path'])['files']
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def _backup_file(root, path, throttle):
+    """Czyta plik fragmentami i zapisuje nowe fragmenty; zwraca (skróty, nowe bajty)."""
+    digests = []
+    stored = 0
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(CHUNK_SIZE)
+            if not data:
+                break
+            throttle.consume(len(data))
+            digest, new = _store_chunk(root, data)
+            digests.append(digest)
+            stored += new
+    return digests, stored
+
+
+def backup_site(site_name, user_data_dir, root=None, throttle=None):
+    """Robi migawkę strony i zapisuje ją w ``backups``; zwraca podsumowanie.
+
+    Pliki o niezmienionym rozmiarze i mtime nie są czytane - ich fragmenty
+    pochodzą z poprzedniej migawki.
+    """
+    root = root or BACKUP_DIR
+    throttle = throttle or Throttle()
+    site = database.get_site(site_name)
+    if site is None:
+        raise ValueError(f"Strona {site_name} nie istnieje")
+    site_dir = os.path.join(user_data_dir, site_name)
+    if not os.path.isdir(site_dir):
+        raise ValueError(f"Brak katalogu strony {site_name}")
+
+    started = time.monotonic()
+    summary = {'site': site_name, 'files': 0, 'read': 0, 'bytes': 0, 'read_bytes': 0, 'stored_bytes': 0}
+    manifest = {'version': MANIFEST_VERSION, 'site': site_name, 'created': time.time(),
+                'files': {}, 'dirs': [], 'links': {}}
+    with _store_lock(root):
+        previous = _previous_files(site['id'])
+        for dirpath, dirnames, filenames in os.walk(site_dir):
+            rel_dir = os.path.relpath(dirpath, site_dir)
+            if rel_dir != '.':
+                manifest['dirs'].append(rel_dir)
+            for name in dirnames + filenames:
+                path = os.path.join(dirpath, name)
+                rel = os.path.normpath(os.path.join(rel_dir, name))
+                try:
+                    st = os.lstat(path)
+                    if stat.S_ISLNK(st.st_mode):
+                        manifest['links'][rel] = os.readlink(path)
+                        continue
+                    if not stat.S_ISREG(st.st_mode):
+                        continue
+                    old = previous.get(rel)
+                    if old and old[_SIZE] == st.st_size and old[_MTIME] == st.st_mtime_ns:
+                        digests = old[_CHUNKS]
+                    else:
+                        digests, stored = _backup_file(root, path, throttle)
+                        summary['read'] += 1
+                        summary['read_bytes'] += st.st_size
+                        summary['stored_bytes'] += stored
+                except OSError as e:
+                    # Plik usunięty w trakcie kopii
+                    print(f"⚠️  Kopia {site_name}: pomijam {rel}: {e}")
+                    continue
+                manifest['files'][rel] = [st.st_size, st.st_mtime_ns, stat.S_IMODE(st.st_mode), digests]
+                summary['files'] += 1
+                summary['bytes'] += st.st_size
+
+        path = _write_manifest(root, site_name, manifest)
+        summary['backup_id'] = database.create_backup(
+            site['id'], path,
+            size_mb=round(summary['bytes'] / (1024 * 1024), 2),
+            stored_mb=round(summary['stored_bytes'] / (1024 * 1024), 2),
+        )
+    summary['seconds'] = round(time.monotonic() - started, 2)
+    return summary
+
+
+def prune_site(site_id, keep=BACKUP_KEEP):
+    """Usuwa migawki strony starsze niż ``keep`` ostatnich (fragmenty zostają do ``collect``)."""
+    removed = 0
+    for row in database.list_backups(site_id)[keep:]:
+        _remove_manifest(row)
+        removed += 1
+    return removed
+
+
+def _remove_manifest(row):
+    try:
+        os.remove(row['backup_path'])
+        # Pusty katalog manifestów strony (usuniętej) też znika
+        os.rmdir(os.path.dirname(row['backup_path']))
+    except OSError:
+        pass
+    database.delete_backup(row['id'])
+
+
+def prune_orphans():
+    """Usuwa migawki stron, których nie ma już w bazie; zwraca ich liczbę."""
+    rows = database.get_orphaned_backups()
+    for row in rows:
+        _remove_manifest(row)
+    return len(rows)
+
+
+def collect(root=None):
+    """Usuwa migawki usuniętych stron i fragmenty, do których nie odwołuje się żadna migawka."""
+    root = root or BACKUP_DIR
+    with _store_lock(root, exclusive=True):
+        orphans = prune_orphans()
+        if orphans:
+            print(f"🗑️  Usunięto {orphans} migawek usuniętych stron")
+        referenced = set()
+        for row in database.list_backups():
+            try:
+                files = load_manifest(row['backup_path'])['files']
+            except (OSError, ValueError, KeyError):
+                # Manifest nieczytelny - nie wiemy, czego używa, więc nic nie usuwamy
+                print(f"⚠️  Sprzątanie kopii przerwane: manifest {row['backup_path']} nieczytelny")
+                return 0
+            for entry in files.values():
+                referenced.update(entry[_CHUNKS])
+
+        removed = 0
+        for dirpath, _, filenames in os.walk(os.path.join(root, CHUNKS_DIRNAME)):
+            for name in filenames:
+                if name not in referenced:
+                    os.remove(os.path.join(dirpath, name))
+                    removed += 1
+    return removed
+
+
+def _restore_file(root, staging, rel, entry):
+    path = os.path.join(staging, rel)
+    with open(path, "wb") as f:
+        for digest in entry[_CHUNKS]:
+            f.write(_read_chunk(root, digest))
+    os.chmod(path, entry[_MODE])
+    # Ten sam mtime - następna kopia nie czyta pliku ponownie
+    os.utime(path, ns=(entry[_MTIME], entry[_MTIME]))
+
+
+def restore_site(site_name, user_data_dir, backup_id=None, root=None):
+    """Odtwarza katalog strony z migawki (domyślnie ostatniej) i podmienia go atomowo.
+
+    Czytane są tylko fragmenty plików tej strony; stara zawartość katalogu
+    jest usuwana po podmianie.
+    """
+    root = root or BACKUP_DIR
+    site = database.get_site(site_name)
+    if site is None:
+        raise ValueError(f"Strona {site_name} nie istnieje")
+    row = database.get_backup(backup_id) if backup_id else database.get_latest_backup(site['id'])
+    if row is None or row['site_id'] != site['id']:
+        raise ValueError(f"Brak kopii strony {site_name}")
+
+    started = time.monotonic()
+    staging = os.path.join(user_data_dir, deploy.STAGING_DIRNAME, f"{site_name}-restore-{uuid.uuid4().hex[:8]}")
+    try:
+        with _store_lock(root):
+            manifest = load_manifest(row['backup_path'])
+            os.makedirs(staging)
+            for rel in manifest['dirs']:
+                os.makedirs(os.path.join(staging, rel), exist_ok=True)
+            with ThreadPoolExecutor(max_workers=RESTORE_WORKERS, thread_name_prefix="restore") as pool:
+                list(pool.map(
+                    lambda item: _restore_file(root, staging, *item), manifest['files'].items()
+                ))
+            for rel, target in manifest['links'].items():
+                os.symlink(target, os.path.join(staging, rel))
+        deploy.swap_into_place(staging, os.path.join(user_data_dir, site_name))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    print(f"♻️  Odtworzono {site_name} z kopii #{row['id']} ({len(manifest['files'])} plików, "
+          f"{time.monotonic() - started:.2f}s)")
+    return {'site': site_name, 'backup_id': row['id'], 'files': len(manifest['files'])}
+
+
+def backup_all(user_data_dir, workers=None, root=None):
+    """Migawki wszystkich stron (równolegle, ze wspólnym limitem odczytu), rotacja i sprzątanie."""
+    root = root or BACKUP_DIR
+    throttle = Throttle()
+    started = time.monotonic()
+
+    def run(site):
+        try:
+            summary = backup_site(site['name'], user_data_dir, root, throttle)
+            prune_site(site['id'])
+            return summary
+        except Exception as e:
+            print(f"❌ Kopia {site['name']} nieudana: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers or BACKUP_WORKERS, thread_name_prefix="backup") as pool:
+        results = [r for r in pool.map(run, database.get_all_sites()) if r]
+    removed = collect(root)
+
+    mb = 1024 * 1024
+    print(f"💾 Kopie {len(results)} stron w {time.monotonic() - started:.1f}s: "
+          f"{sum(r['bytes'] for r in results) / mb:.1f} MB danych, "
+          f"przeczytano {sum(r['read_bytes'] for r in results) / mb:.1f} MB, "
+          f"nowe fragmenty {sum(r['stored_bytes'] for r in results) / mb:.1f} MB, "
+          f"usunięto {removed} fragmentów")
+    return results
+
+
+class BackupScheduler(threading.Thread):
+    """Wątek robiący kopie wszystkich stron co ``interval`` sekund."""
+
+    def __init__(self, user_data_dir, interval=BACKUP_INTERVAL):
+        super().__init__(name="backup-scheduler", daemon=True)
+        self.user_data_dir = user_data_dir
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                backup_all(self.user_data_dir)
+            except Exception as e:
+                print(f"⚠️  Błąd kopii zapasowych: {e}")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler(user_data_dir):
+    """Uruchamia (jednokrotnie) okresowe kopie, jeśli są włączone."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None and BACKUP_ENABLED and BACKUP_INTERVAL > 0:
+            _scheduler = BackupScheduler(user_data_dir)
+            _scheduler.start()
+            print(f"💾 Kopie zapasowe co {BACKUP_INTERVAL / 3600:.0f}h do {BACKUP_DIR}")
+    return _scheduler
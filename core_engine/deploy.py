@@ -0,0 +1,292 @@
+"""Wdrażanie plików strony z archiwum ZIP w tle."""
+import ctypes
+import os
+import shutil
+import stat
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from core_engine import static_build
+from web_panel import database
+
+# Katalog roboczy (w user_data, żeby zamiana była na tym samym systemie plików)
+STAGING_DIRNAME = ".staging"
+# Ile wdrożeń może trwać jednocześnie
+DEPLOY_WORKERS = int(os.environ.get("DEPLOY_WORKERS", "2"))
+# Ile plików jednego archiwum rozpakowujemy równolegle
+EXTRACT_WORKERS = int(os.environ.get("DEPLOY_EXTRACT_WORKERS", "4"))
+# Maksymalny stosunek rozmiaru po rozpakowaniu do rozmiaru skompresowanego
+MAX_COMPRESSION_RATIO = float(os.environ.get("DEPLOY_MAX_RATIO", "100"))
+# Maksymalna liczba plików w archiwum
+MAX_FILES = int(os.environ.get("DEPLOY_MAX_FILES", "50000"))
+# Po ilu sekundach zapominamy zakończone zadania
+JOB_TTL = float(os.environ.get("DEPLOY_JOB_TTL", "3600"))
+# Co ile sekund najczęściej zapisujemy postęp rozpakowywania do bazy
+PROGRESS_SAVE_INTERVAL = float(os.environ.get("DEPLOY_PROGRESS_SAVE_INTERVAL", "0.5"))
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class DeployError(Exception):
+    """Archiwum odrzucone (limit dysku, podejrzana kompresja, zła ścieżka)."""
+
+
+class DeployJob:
+    """Stan jednego wdrożenia, odpytywany przez panel."""
+
+    def __init__(self, site_name, bytes_limit, idempotency_key=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.site_name = site_name
+        self.idempotency_key = idempotency_key
+        self.status = 'queued'
+        self.files_total = 0
+        self.files_done = 0
+        self.bytes_written = 0
+        self.bytes_limit = bytes_limit
+        self.error = None
+        # Zadanie kolejki zlecone po podmianie plików (np. założenie kontenera)
+        self.job_id = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+        self._saved_at = 0.0
+
+    @classmethod
+    def from_row(cls, row):
+        """Stan wdrożenia prowadzonego przez inny proces panelu (z bazy)."""
+        job = cls(row['site_name'], row['bytes_limit'], row['idempotency_key'])
+        for field in ('id', 'status', 'files_total', 'files_done', 'bytes_written',
+                      'error', 'job_id', 'created_at', 'finished_at'):
+            setattr(job, field, row[field])
+        return job
+
+    def add_bytes(self, n):
+        with self._lock:
+            self.bytes_written += n
+            if self.bytes_written > self.bytes_limit:
+                raise DeployError(
+                    f"Przekroczono limit dysku strony ({self.bytes_limit // (1024 * 1024)} MB)"
+                )
+
+    def file_done(self):
+        with self._lock:
+            self.files_done += 1
+            if time.monotonic() - self._saved_at < PROGRESS_SAVE_INTERVAL:
+                return
+            self._saved_at = time.monotonic()
+        self.save()
+
+    def set_status(self, status):
+        self.status = status
+        self.save()
+
+    def save(self):
+        """Zapisuje stan do bazy - status odpytuje dowolny proces panelu."""
+        try:
+            database.save_deploy(self.to_dict())
+        except Exception as e:
+            print(f"⚠️  Nie udało się zapisać stanu wdrożenia {self.id}: {e}")
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'site': self.site_name,
+            'status': self.status,
+            'files_total': self.files_total,
+            'files_done': self.files_done,
+            'bytes_written': self.bytes_written,
+            'bytes_limit': self.bytes_limit,
+            'progress': round(self.files_done / self.files_total * 100, 1) if self.files_total else 0.0,
+            'error': self.error,
+            'job_id': self.job_id,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'idempotency_key': self.idempotency_key,
+        }
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=DEPLOY_WORKERS, thread_name_prefix="deploy")
+
+
+def get_job(job_id):
+    """Wdrożenie z tego procesu albo (tylko do odczytu) z bazy."""
+    job = _jobs.get(job_id)
+    if job is None and job_id:
+        row = database.get_deploy(job_id)
+        job = DeployJob.from_row(row) if row is not None else None
+    return job
+
+
+def find(idempotency_key):
+    """Wdrożenie zlecone wcześniej z tym samym kluczem idempotencji lub None."""
+    if not idempotency_key:
+        return None
+    for job in list(_jobs.values()):
+        if job.idempotency_key == idempotency_key:
+            return job
+    row = database.get_deploy_by_key(idempotency_key)
+    return DeployJob.from_row(row) if row is not None else None
+
+
+def is_pending(site_name):
+    """Czy dla strony trwa już wdrożenie (w którymkolwiek procesie panelu)."""
+    if any(job.site_name == site_name and job.finished_at is None for job in list(_jobs.values())):
+        return True
+    # Wpisy starsze niż JOB_TTL to wdrożenia przerwane restartem procesu
+    return bool(database.get_running_deploys(site_name, time.time() - JOB_TTL))
+
+
+def submit(site_name, archive, user_data_dir, disk_limit_mb, on_success=None, idempotency_key=None):
+    """Zleca wdrożenie archiwum ``archive`` do ``user_data_dir/<site_name>``.
+
+    Funkcja przejmuje otwarty plik ``archive`` i zamyka go po zakończeniu.
+    ``on_success(job)`` wywoływane jest po podmianie katalogu strony; jeśli
+    zwróci zadanie kolejki (słownik z ``id``), jego numer trafia do ``job_id``.
+    Powtórzone zlecenie z tym samym ``idempotency_key`` odnajduje ``find()``.
+    """
+    job = DeployJob(site_name, disk_limit_mb * 1024 * 1024, idempotency_key)
+    now = time.time()
+    with _jobs_lock:
+        for job_id in [i for i, j in _jobs.items() if j.finished_at and now - j.finished_at > JOB_TTL]:
+            del _jobs[job_id]
+        _jobs[job.id] = job
+    database.prune_deploys(now - JOB_TTL)
+    job.save()
+    _executor.submit(_run, job, archive, user_data_dir, on_success)
+    return job
+
+
+def _member_path(staging, info):
+    """Bezpieczna ścieżka docelowa pliku z archiwum (bez wyjścia poza katalog)."""
+    name = info.filename.replace('\\', '/')
+    parts = [p for p in name.split('/') if p not in ('', '.')]
+    if not parts or name.startswith('/') or '..' in parts or ':' in parts[0]:
+        raise DeployError(f"Niedozwolona ścieżka w archiwum: {info.filename}")
+    return os.path.join(staging, *parts)
+
+
+def _plan(zf, job):
+    """Sprawdza archiwum przed rozpakowaniem i zwraca listę plików."""
+    infos = zf.infolist()
+    if len(infos) > MAX_FILES:
+        raise DeployError(f"Za dużo plików w archiwum ({len(infos)} > {MAX_FILES})")
+
+    files = []
+    declared = 0
+    for info in infos:
+        if info.is_dir():
+            continue
+        # Dowiązania symboliczne z archiwum pomijamy
+        if stat.S_ISLNK(info.external_attr >> 16):
+            continue
+        if info.file_size > max(info.compress_size, 1) * MAX_COMPRESSION_RATIO:
+            raise DeployError(f"Podejrzany stopień kompresji pliku {info.filename}")
+        declared += info.file_size
+        files.append(info)
+
+    if declared > job.bytes_limit:
+        raise DeployError(
+            f"Archiwum po rozpakowaniu ({declared // (1024 * 1024)} MB) przekracza limit dysku strony"
+        )
+    return files
+
+
+def _extract_member(zf, info, staging, job):
+    """Rozpakowuje jeden plik, pilnując limitów w trakcie zapisu."""
+    if job._abort.is_set():
+        return
+    target = _member_path(staging, info)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    written = 0
+    limit = max(info.compress_size, 1) * MAX_COMPRESSION_RATIO
+    try:
+        with zf.open(info) as source, open(target, 'wb') as out:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if job._abort.is_set():
+                    return
+                written += len(chunk)
+                if written > limit:
+                    raise DeployError(f"Podejrzany stopień kompresji pliku {info.filename}")
+                job.add_bytes(len(chunk))
+                out.write(chunk)
+    except Exception:
+        job._abort.set()
+        raise
+    job.file_done()
+
+
+def _exchange(a, b):
+    """Atomowo zamienia miejscami dwa katalogi (renameat2 RENAME_EXCHANGE)."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError):
+        return False
+    at_fdcwd, rename_exchange = -100, 2
+    return renameat2(at_fdcwd, os.fsencode(a), at_fdcwd, os.fsencode(b), rename_exchange) == 0
+
+
+def swap_into_place(staging, target):
+    """Podmienia katalog ``target`` na ``staging``; stara zawartość trafia do ``staging``."""
+    if not os.path.exists(target):
+        os.rename(staging, target)
+        return
+    if not _exchange(staging, target):
+        # Bez renameat2: dwie zmiany nazwy z krótką przerwą
+        old = f"{staging}.old"
+        os.rename(target, old)
+        os.rename(staging, target)
+        os.rename(old, staging)
+
+
+def _run(job, archive, user_data_dir, on_success):
+    staging_root = os.path.join(user_data_dir, STAGING_DIRNAME)
+    staging = os.path.join(staging_root, f"{job.site_name}-{job.id}")
+    target = os.path.join(user_data_dir, job.site_name)
+    try:
+        job.set_status('extracting')
+        os.makedirs(staging)
+        with zipfile.ZipFile(archive) as zf:
+            files = _plan(zf, job)
+            job.files_total = len(files)
+            with ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix=f"unzip-{job.id}") as pool:
+                list(pool.map(lambda info: _extract_member(zf, info, staging, job), files))
+
+        if static_build.BUILD_ENABLED:
+            job.set_status('building')
+            try:
+                summary = static_build.build_site(staging, target if os.path.isdir(target) else None)
+                print(
+                    f"🗜️  {job.site_name}: skompresowano {summary['gz']} plików (.gz), {summary['br']} (.br), "
+                    f"{summary['hashed']} zasobów z hashem w nazwie"
+                )
+            except Exception as e:
+                # Strona działa i bez plików skompresowanych
+                print(f"⚠️  Budowanie {job.site_name} nieudane: {e}")
+
+        job.set_status('swapping')
+        swap_into_place(staging, target)
+        if on_success:
+            job.set_status('provisioning')
+            followup = on_success(job)
+            if isinstance(followup, dict):
+                job.job_id = followup.get('id')
+        job.status = 'done'
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        print(f"🔥 Wdrożenie {job.site_name} ({job.id}) nieudane: {e}")
+    finally:
+        archive.close()
+        shutil.rmtree(staging, ignore_errors=True)
+        job.finished_at = time.time()
+        job.save()
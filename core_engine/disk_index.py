@@ -0,0 +1,293 @@
+"""Przyrostowy indeks zajętości dysku katalogów user_data stron."""
+import json
+import os
+import threading
+import time
+
+from web_panel import database
+
+try:
+    import inotify_simple
+except ImportError:  # inotify jest opcjonalne - bez niego skanujemy po mtime
+    inotify_simple = None
+
+# Co ile sekund sprawdzamy katalogi stron (bez inotify)
+SCAN_INTERVAL = float(os.environ.get("DISK_INDEX_INTERVAL", "60"))
+# Co ile sekund robimy pełne skanowanie (zmiany plików w miejscu nie zmieniają mtime katalogu)
+FULL_RESCAN_INTERVAL = float(os.environ.get("DISK_INDEX_FULL_RESCAN", "3600"))
+# Czy używać inotify, jeśli moduł inotify_simple jest dostępny
+USE_INOTIFY = os.environ.get("DISK_INDEX_INOTIFY", "1") == "1"
+# Co ile sekund proces bez indeksera (worker WSGI) odświeża podsumowania z bazy
+STORED_TTL = float(os.environ.get("DISK_INDEX_STORED_TTL", "30"))
+
+NO_EXTENSION = 'bez rozszerzenia'
+
+# Wpis katalogu: [mtime_ns, liczba plików, bajty, {rozszerzenie: liczba}, [podkatalogi]]
+_MTIME, _COUNT, _BYTES, _TYPES, _SUBDIRS = range(5)
+
+
+def _scan_dir(path, mtime_ns):
+    """Zlicza pliki bezpośrednio w katalogu (bez rekursji)."""
+    count = 0
+    total = 0
+    types = {}
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    total += entry.stat().st_size
+                    count += 1
+                    ext = os.path.splitext(entry.name)[1].lower() or NO_EXTENSION
+                    types[ext] = types.get(ext, 0) + 1
+            except OSError:
+                pass
+    return [mtime_ns, count, total, types, subdirs]
+
+
+class SiteIndex:
+    """Indeks jednej strony: zagregowane dane dla każdego katalogu."""
+
+    def __init__(self, dirs=None):
+        self.dirs = dirs or {}
+        self.count = 0
+        self.bytes = 0
+        self.types = {}
+        self._summarize()
+
+    def _summarize(self):
+        count = 0
+        total = 0
+        types = {}
+        for entry in self.dirs.values():
+            count += entry[_COUNT]
+            total += entry[_BYTES]
+            for ext, n in entry[_TYPES].items():
+                types[ext] = types.get(ext, 0) + n
+        self.count, self.bytes, self.types = count, total, types
+
+    def update(self, root, dirty=(), force=False):
+        """Aktualizuje indeks; zwraca True, jeśli coś się zmieniło.
+
+        Katalog jest skanowany ponownie tylko wtedy, gdy zmienił się jego
+        mtime (dodanie/usunięcie/zmiana nazwy wpisu), został zgłoszony przez
+        inotify w ``dirty`` albo gdy ``force``. Niezmienione katalogi
+        kosztują jedno ``stat``.
+        """
+        dirs = {}
+        changed = False
+        stack = ['']
+        while stack:
+            rel = stack.pop()
+            path = os.path.join(root, rel) if rel else root
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            previous = self.dirs.get(rel)
+            if previous is not None and previous[_MTIME] == mtime_ns and not force and rel not in dirty:
+                entry = previous
+            else:
+                try:
+                    entry = _scan_dir(path, mtime_ns)
+                except OSError:
+                    continue
+                changed = changed or entry != previous
+            dirs[rel] = entry
+            stack.extend(os.path.join(rel, name) if rel else name for name in entry[_SUBDIRS])
+
+        changed = changed or dirs.keys() != self.dirs.keys()
+        self.dirs = dirs
+        if changed:
+            self._summarize()
+        return changed
+
+    def stats(self, top=5):
+        return {
+            'count': self.count,
+            'size_mb': round(self.bytes / (1024 * 1024), 2),
+            'types': sorted(self.types.items(), key=lambda x: x[1], reverse=True)[:top],
+        }
+
+
+class DiskIndexer(threading.Thread):
+    """Wątek utrzymujący indeksy wszystkich stron w katalogu ``root``."""
+
+    def __init__(self, root, interval=SCAN_INTERVAL):
+        super().__init__(name="disk-indexer", daemon=True)
+        self.root = root
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._indexes = {}
+        self._dirty = {}
+        # Zapisany indeks jest aktualny na tyle, by zacząć od skanowania po mtime
+        self._last_full_scan = time.monotonic()
+        self._inotify = None
+        self._watches = {}
+        self._watched = set()
+
+    def load(self):
+        """Wczytuje zapisane indeksy z bazy (przetrwają restart panelu)."""
+        for row in database.load_disk_indexes():
+            self._indexes[row['site_name']] = SiteIndex(json.loads(row['dirs']))
+
+    def get(self, site_name):
+        return self._indexes.get(site_name)
+
+    def refresh_site(self, site_name, force=False):
+        """Aktualizuje indeks strony i zapisuje go, jeśli się zmienił."""
+        with self._lock:
+            dirty = self._dirty.pop(site_name, set())
+            index = self._indexes.get(site_name)
+            if index is None:
+                index = self._indexes[site_name] = SiteIndex()
+                force = True
+            changed = index.update(os.path.join(self.root, site_name), dirty, force)
+            self._watch(site_name, index)
+        if changed:
+            database.save_disk_index(
+                site_name, index.count, index.bytes,
+                json.dumps(index.types), json.dumps(index.dirs)
+            )
+        return index
+
+    def forget_site(self, site_name):
+        with self._lock:
+            self._indexes.pop(site_name, None)
+            self._dirty.pop(site_name, None)
+        database.delete_disk_index(site_name)
+
+    def _site_names(self):
+        try:
+            with os.scandir(self.root) as entries:
+                return [e.name for e in entries if e.is_dir() and not e.name.startswith('.')]
+        except OSError:
+            return []
+
+    def run(self):
+        if USE_INOTIFY and inotify_simple is not None:
+            self._inotify = inotify_simple.INotify()
+            print("💾 Indeks dysku: śledzenie zmian przez inotify")
+        while not self._stop_event.is_set():
+            force = time.monotonic() - self._last_full_scan > FULL_RESCAN_INTERVAL
+            if force:
+                self._last_full_scan = time.monotonic()
+            try:
+                names = self._site_names()
+                for name in names:
+                    self.refresh_site(name, force=force)
+                for name in set(self._indexes) - set(names):
+                    self.forget_site(name)
+            except Exception as e:
+                print(f"⚠️  Błąd indeksowania dysku: {e}")
+            self._wait()
+
+    def _wait(self):
+        """Czeka do następnej rundy; z inotify odświeża od razu zmienione strony."""
+        deadline = time.monotonic() + self.interval
+        while not self._stop_event.is_set() and time.monotonic() < deadline:
+            if self._inotify is None:
+                self._stop_event.wait(max(0.0, deadline - time.monotonic()))
+                return
+            sites = set()
+            for event in self._inotify.read(timeout=1000):
+                if event.mask & inotify_simple.flags.IGNORED:
+                    # Katalog usunięty - jądro samo zdjęło obserwację
+                    with self._lock:
+                        self._watched.discard(self._watches.pop(event.wd, None))
+                    continue
+                watch = self._watches.get(event.wd)
+                if watch is None:
+                    continue
+                site_name, rel = watch
+                with self._lock:
+                    self._dirty.setdefault(site_name, set()).add(rel)
+                sites.add(site_name)
+            for site_name in sites:
+                self.refresh_site(site_name)
+
+    def _watch(self, site_name, index):
+        """Dodaje obserwację inotify dla nowych katalogów strony."""
+        if self._inotify is None:
+            return
+        flags = inotify_simple.flags
+        mask = (flags.CREATE | flags.DELETE | flags.MODIFY | flags.CLOSE_WRITE
+                | flags.MOVED_FROM | flags.MOVED_TO)
+        for rel in index.dirs:
+            key = (site_name, rel)
+            if key in self._watched:
+                continue
+            path = os.path.join(self.root, site_name, rel) if rel else os.path.join(self.root, site_name)
+            try:
+                wd = self._inotify.add_watch(path, mask)
+            except OSError:
+                continue
+            self._watches[wd] = key
+            self._watched.add(key)
+
+
+_indexer = None
+_indexer_lock = threading.Lock()
+# Podsumowania zapisane przez indekser innego procesu: (monotonic, {strona: SiteIndex})
+_stored = None
+_stored_lock = threading.Lock()
+
+
+def _stored_index(site_name):
+    """Podsumowanie strony z bazy dla procesu bez własnego indeksera."""
+    global _stored
+    with _stored_lock:
+        if _stored is None or time.monotonic() - _stored[0] > STORED_TTL:
+            indexes = {}
+            for row in database.get_disk_index_summaries():
+                index = SiteIndex()
+                index.count, index.bytes, index.types = row['file_count'], row['total_bytes'], json.loads(row['types'])
+                indexes[row['site_name']] = index
+            _stored = (time.monotonic(), indexes)
+        return _stored[1].get(site_name)
+
+
+def _get(site_name):
+    return _indexer.get(site_name) if _indexer else _stored_index(site_name)
+
+
+def start_indexer(root):
+    """Uruchamia (jednokrotnie) indeksowanie katalogów stron w ``root``."""
+    global _indexer
+    with _indexer_lock:
+        if _indexer is None:
+            _indexer = DiskIndexer(root)
+            try:
+                _indexer.load()
+            except Exception as e:
+                print(f"⚠️  Nie udało się wczytać indeksu dysku: {e}")
+            _indexer.start()
+    return _indexer
+
+
+def get_stats(site_name):
+    """Liczba plików, rozmiar (MB) i najczęstsze typy plików strony z indeksu."""
+    index = _get(site_name)
+    if index is None:
+        return {'count': 0, 'size_mb': 0.0, 'types': []}
+    return index.stats()
+
+
+def get_usage_mb(site_name):
+    """Zajętość dysku strony w MB z indeksu (0, gdy brak danych)."""
+    index = _get(site_name)
+    return round(index.bytes / (1024 * 1024), 2) if index else 0.0
+
+
+def refresh_site(site_name):
+    """Natychmiast aktualizuje indeks strony (np. po wdrożeniu plików)."""
+    if _indexer:
+        _indexer.refresh_site(site_name)
+
+
+def forget_site(site_name):
+    if _indexer:
+        _indexer.forget_site(site_name)
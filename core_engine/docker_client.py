@@ -0,0 +1,112 @@
+"""Współdzielony klient Docker API dla całego procesu."""
+import functools
+import os
+import threading
+from collections import Counter
+
+import docker
+
+from core_engine import instrumentation
+from web_panel import database
+
+# Maksymalna liczba połączeń HTTP w puli klienta
+DOCKER_POOL_SIZE = int(os.environ.get("DOCKER_POOL_SIZE", "32"))
+# Domyślny limit czasu (s) pojedynczego wywołania Docker API
+DOCKER_TIMEOUT = float(os.environ.get("DOCKER_TIMEOUT", "30"))
+# Czy wypisywać liczbę wywołań Docker API dla każdego żądania panelu
+LOG_CALLS = os.environ.get("DOCKER_LOG_CALLS", "0") == "1"
+
+# Nazwa węzła lokalnego (demon z docker.from_env)
+LOCAL_NODE = "local"
+
+_clients = {}
+_clients_lock = threading.Lock()
+_api_versions = {}
+
+_totals = Counter()
+_totals_lock = threading.Lock()
+_tracking = threading.local()
+
+# Segmenty ścieżki, po których następuje ID / nazwa obiektu
+_ID_PARENTS = {'containers', 'networks', 'images', 'volumes', 'exec'}
+_NON_ID_SEGMENTS = {'json', 'create', 'prune'}
+
+
+def _node_url(node):
+    """Adres demona Dockera węzła z rejestru węzłów."""
+    row = database.get_node(node)
+    if row is None or not row['docker_url']:
+        raise ValueError(f"Nieznany węzeł Dockera: {node}")
+    return row['docker_url']
+
+
+def get_client(timeout=None, pool_size=None, node=None):
+    """Zwraca współdzielonego klienta Dockera dla węzła ``node``.
+
+    Klienci są tworzeni raz na proces dla każdej trójki (węzeł, timeout,
+    pool_size) i bezpiecznie używani z wielu wątków. Wersja API jest
+    negocjowana tylko przy pierwszym kliencie każdego węzła.
+    """
+    node = node or LOCAL_NODE
+    key = (node, timeout or DOCKER_TIMEOUT, pool_size or DOCKER_POOL_SIZE)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            kwargs = {'timeout': key[1], 'max_pool_size': key[2]}
+            if node in _api_versions:
+                kwargs['version'] = _api_versions[node]
+            if node == LOCAL_NODE:
+                client = docker.from_env(**kwargs)
+            else:
+                client = docker.DockerClient(base_url=_node_url(node), **kwargs)
+            _api_versions[node] = client.api.api_version
+            client.api.hooks['response'].append(functools.partial(_count_call, node=node))
+            _clients[key] = client
+    return client
+
+
+def _call_type(request):
+    """Normalizuje żądanie HTTP do postaci "GET /containers/{id}/json"."""
+    path = request.path_url.split('?', 1)[0]
+    parts = [part for part in path.split('/') if part]
+    if parts and parts[0].startswith('v1.'):
+        parts = parts[1:]
+    for i in range(1, len(parts)):
+        if parts[i - 1] in _ID_PARENTS and parts[i] not in _NON_ID_SEGMENTS:
+            parts[i] = '{id}'
+    return f"{request.method} /{'/'.join(parts)}"
+
+
+def _count_call(response, *args, node=LOCAL_NODE, **kwargs):
+    call_type = _call_type(response.request)
+    with _totals_lock:
+        _totals[call_type] += 1
+    if instrumentation.INSTRUMENTATION_ENABLED:
+        # elapsed - od wysłania żądania do odebrania nagłówków odpowiedzi
+        instrumentation.DOCKER_CALLS.observe((node, call_type), response.elapsed.total_seconds())
+    counts = getattr(_tracking, 'counts', None)
+    if counts is not None:
+        counts[call_type] += 1
+    return response
+
+
+def begin_tracking():
+    """Zaczyna liczyć wywołania Docker API w bieżącym wątku."""
+    _tracking.counts = Counter()
+
+
+def end_tracking():
+    """Kończy liczenie i zwraca licznik wywołań z bieżącego wątku."""
+    counts = getattr(_tracking, 'counts', None) or Counter()
+    _tracking.counts = None
+    return counts
+
+
+def get_call_totals():
+    """Zwraca łączną liczbę wywołań Docker API w procesie wg typu."""
+    with _totals_lock:
+        return dict(_totals)
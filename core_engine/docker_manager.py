@@ -2,57 +2,157 @@ import docker
 import time
 import os
 
-client = docker.from_env()
+from core_engine import docker_client
+from core_engine import firewall
+from core_engine import instrumentation
+from core_engine import inventory
+from core_engine import networks
+from core_engine import static_build
+from web_panel import database
 
+# Etykieta kontenera z nazwą jego sieci (sieci z puli nie mają nazwy strony)
+NETWORK_LABEL = "hosting.network"
+# Obraz kontenerów stron statycznych (z NGINX_BROTLI=1 musi mieć moduł ngx_brotli)
+SITE_IMAGE = os.environ.get("SITE_IMAGE", "nginx:latest")
 
-def create_isolated_network(name):
-    """Tworzy izolowaną sieć dla strony i łączy z Traefik"""
+
+def label_network(container):
+    """Nazwa sieci z etykiety kontenera strony lub None (działa też dla modeli z listy kontenerów)."""
+    return (container.attrs.get('Labels') or {}).get(NETWORK_LABEL)
+
+
+def host_path(*parts):
+    """Ścieżka w katalogu projektu widziana przez demona Dockera (na hoście)"""
+    host_project_path = os.environ.get("REAL_PROJECT_PATH")
+    if not host_project_path:
+        host_project_path = os.getcwd()
+    return os.path.join(host_project_path, *parts)
+
+
+@instrumentation.operation
+def create_isolated_network(name, labels=None, node=None, subnet=None, icc=True):
+    """Tworzy izolowaną sieć dla strony (opcjonalnie o podanej podsieci) i łączy z Traefik węzła
+
+    ``icc=False`` - sieć współdzielona: kontenery sieci nie widzą się nawzajem, ruch
+    przepuszczamy tylko od Traefika (stały adres + reguła zapory hosta).
+    """
+    client = docker_client.get_client(node=node)
+    inv = inventory.get_inventory(node)
     network_name = f"{name}_isolated"
-    try:
-        network = client.networks.get(network_name)
+    network = inv.network(network_name)
+    if network is not None:
         print(f"   🔄 Sieć {network_name} już istnieje")
-    except docker.errors.NotFound:
-        network = client.networks.create(
-            network_name,
-            driver="bridge",
-            internal=False,
-        )
-        print(f"   🆕 Utworzono sieć {network_name}")
+    else:
+        ipam = None
+        if subnet is not None:
+            ipam = docker.types.IPAMConfig(pool_configs=[docker.types.IPAMPool(subnet=subnet)])
+        try:
+            network = client.networks.create(
+                network_name,
+                driver="bridge",
+                internal=False,
+                labels=labels,
+                ipam=ipam,
+                options=None if icc else {firewall.ICC_OPTION: "false"},
+            )
+            print(f"   🆕 Utworzono sieć {network_name}" + (f" ({subnet})" if subnet else ""))
+        except docker.errors.APIError as e:
+            # Migawka mogła być nieaktualna - sieć już istnieje
+            try:
+                network = client.networks.get(network_name)
+            except docker.errors.NotFound:
+                raise e
+        inv.add_network(network)
     
     # Połączenie Traefik z izolowaną siecią
+    address = None
     try:
-        traefik = client.containers.get("traefik_proxy")
-        networks = traefik.attrs['NetworkSettings']['Networks']
-        if network_name not in networks:
-            network.connect(traefik)
+        traefik = inv.traefik()
+        if traefik is None:
+            raise RuntimeError("brak kontenera traefik_proxy")
+        if not inv.traefik_attached(network_name):
+            address = attach_traefik(network, traefik)
+            inv.mark_traefik_attached(network_name)
             print(f"   🔗 Traefik podłączony do {network_name}")
     except docker.errors.APIError as e:
         if "already exists" not in str(e):
             print(f"   ⚠️  Błąd połączenia Traefik: {e}")
+        else:
+            inv.mark_traefik_attached(network_name)
     except Exception as e:
         print(f"   ⚠️  Traefik niedostępny: {e}")
+
+    # Bez reguły zapory strona w sieci bez ICC byłaby nieosiągalna - błąd przerywa zadanie
+    if inv.traefik_attached(network_name):
+        ensure_firewall(network, node=node, address=address)
     
     return network
 
 
-def start_container(name, cpu_limit=50, ram_limit_mb=512):
-    """Uruchamia izolowany kontener z limitami zasobów"""
-    host_project_path = os.environ.get("REAL_PROJECT_PATH")
-    if not host_project_path:
-        host_project_path = os.getcwd()
+def attach_traefik(network, traefik):
+    """Podłącza Traefik do sieci; w sieci bez ICC pod stałym adresem, który zwraca"""
+    address = firewall.traefik_address(network) if firewall.icc_disabled(network) else None
+    if address is None:
+        network.connect(traefik)
+        return None
+    try:
+        network.connect(traefik, ipv4_address=address)
+        return address
+    except docker.errors.APIError as e:
+        if "already exists" in str(e):
+            raise
+        # Adres zajęty (np. przez stronę) - Traefik dostaje dowolny, regułę ustawiamy na niego
+        network.connect(traefik)
+        return None
 
-    abs_path_on_host = os.path.join(host_project_path, "user_data", name)
+
+def traefik_ip(network, node=None):
+    """Adres Traefika w sieci według Dockera"""
+    attrs = docker_client.get_client(node=node).api.inspect_network(network.id)
+    for endpoint in (attrs.get('Containers') or {}).values():
+        if endpoint.get('Name') == inventory.TRAEFIK_NAME and endpoint.get('IPv4Address'):
+            return endpoint['IPv4Address'].split('/')[0]
+    raise RuntimeError(f"Traefik nie jest podłączony do {network.name}")
+
+
+def ensure_firewall(network, node=None, address=None):
+    """Zakłada regułę przepuszczającą Traefik w sieci bez ICC (raz na proces, chyba że adres się zmienił)"""
+    if not firewall.icc_disabled(network):
+        return
+    if address is None and firewall.is_allowed(network, node=node):
+        return
+    firewall.allow_traefik(network, address or traefik_ip(network, node=node), node=node)
+
+
+@instrumentation.operation
+def start_container(name, cpu_limit=50, ram_limit_mb=512, node=None, owner=None):
+    """Uruchamia izolowany kontener z limitami zasobów na węźle ``node``
+
+    ``owner`` (id właściciela nowej strony) wybiera jej sieć współdzieloną przy NETWORK_POLICY=owner.
+    """
+    abs_path_on_host = host_path("user_data", name)
+    volumes = {
+        abs_path_on_host: {"bind": "/usr/share/nginx/html", "mode": "ro"}
+    }
+    # Wspólna konfiguracja nginx (gzip_static, open_file_cache, Cache-Control)
+    if os.path.exists(static_build.config_path(os.path.join(os.getcwd(), "user_data"))):
+        conf_on_host = static_build.config_path(host_path("user_data"))
+        volumes[conf_on_host] = {"bind": "/etc/nginx/conf.d/default.conf", "mode": "ro"}
     domain = f"{name}.localhost"
     
-    network = create_isolated_network(name)
+    node = node or docker_client.LOCAL_NODE
+    client = docker_client.get_client(node=node)
+    inv = inventory.get_inventory(node)
+    # Sieć przydzielona stronie (dedykowana, z puli gotowych albo współdzielona)
+    network = networks.assign(name, node=node, owner=owner)
     
-    print(f"🚀 Uruchamiam {domain} (CPU: {cpu_limit}%, RAM: {ram_limit_mb}MB)")
+    print(f"🚀 Uruchamiam {domain} na węźle {node} (CPU: {cpu_limit}%, RAM: {ram_limit_mb}MB)")
     print(f"   📁 Ścieżka: {abs_path_on_host}")
     print(f"   🔒 Sieć: {network.name} (izolowana)")
 
     try:
         container = client.containers.run(
-            "nginx:latest",
+            SITE_IMAGE,
             detach=True,
             name=name,
             network=network.name,
@@ -67,9 +167,7 @@ def start_container(name, cpu_limit=50, ram_limit_mb=512):
                 '/var/cache/nginx': 'size=10M,mode=1777',
                 '/var/run': 'size=1M,mode=1777'
             },
-            volumes={
-                abs_path_on_host: {"bind": "/usr/share/nginx/html", "mode": "ro"}
-            },
+            volumes=volumes,
             labels={
                 "traefik.enable": "true",
                 f"traefik.http.routers.{name}.rule": f"Host(`{domain}`)",
@@ -77,9 +175,11 @@ def start_container(name, cpu_limit=50, ram_limit_mb=512):
                 f"isolation.level": "full",
                 f"resource.cpu": str(cpu_limit),
                 f"resource.ram": str(ram_limit_mb),
+                NETWORK_LABEL: network.name,
             },
         )
         
+        inv.add_container(name, container)
         print(f"   ✅ Kontener {name} uruchomiony z pełną izolacją")
         print(f"   🔒 Sieć: {network.name} (tylko Traefik ma dostęp)")
         
@@ -90,22 +190,75 @@ def start_container(name, cpu_limit=50, ram_limit_mb=512):
         return None
 
 
-def stop_container(name):
-    """Zatrzymuje kontener i usuwa jego izolowaną sieć"""
+@instrumentation.operation
+def restart_container(name, node=None):
+    """Restartuje kontener strony (np. po podmianie jej plików)"""
+    client = docker_client.get_client(node=node)
+    container = client.containers.get(name)
+    container.restart(timeout=5)
+    print(f"🔄 Zrestartowano {name}")
+    return container
+
+
+@instrumentation.operation
+def update_limits(name, cpu_limit, ram_limit_mb, node=None):
+    """Zmienia limity CPU/RAM działającego kontenera bez jego odtwarzania"""
+    client = docker_client.get_client(node=node)
+    container = client.containers.get(name)
+    container.update(
+        cpu_quota=int(cpu_limit * 1000),
+        cpu_period=100000,
+        mem_limit=f"{ram_limit_mb}m",
+        memswap_limit=f"{ram_limit_mb}m",
+    )
+    print(f"📏 Nowe limity {name}: CPU {cpu_limit}%, RAM {ram_limit_mb}MB")
+    return container
+
+
+@instrumentation.operation
+def stop_container(name, node=None):
+    """Zatrzymuje kontener i usuwa jego sieć, jeśli nie korzysta z niej inna strona"""
     print(f"💀 Usuwam {name}...")
+    client = docker_client.get_client(node=node)
+    inv = inventory.get_inventory(node)
     
     try:
         container = client.containers.get(name)
+        label_network = container.labels.get(NETWORK_LABEL, f"{name}_isolated")
         container.stop()
         container.remove()
-        
-        network_name = f"{name}_isolated"
-        try:
-            network = client.networks.get(network_name)
-            network.remove()
-            print(f"   🗑️ Usunięto sieć {network_name}")
-        except docker.errors.NotFound:
-            pass
+        inv.discard_container(name)
+
+        if database.get_site_network(name) is not None:
+            network_name = networks.release(name)
+        else:
+            # Strona uruchomiona przed zapisem przydziałów sieci w bazie
+            network_name = label_network
+        _remove_network(client, inv, network_name, node=node)
             
     except Exception as e:
         print(f"Błąd usuwania: {e}")
+
+
+def release_network(name, node=None):
+    """Zwalnia sieć strony bez kontenera (np. po nieudanym zakładaniu); pustą sieć usuwa"""
+    network_name = networks.release(name)
+    if network_name is not None:
+        _remove_network(docker_client.get_client(node=node), inventory.get_inventory(node), network_name, node=node)
+
+
+def _remove_network(client, inv, network_name, node=None):
+    if network_name is None:
+        return
+    try:
+        network = client.networks.get(network_name)
+        network.remove()
+        if firewall.icc_disabled(network):
+            try:
+                firewall.revoke(network, node=node)
+            except Exception as e:
+                print(f"   ⚠️  Nie usunięto reguły zapory {network_name}: {e}")
+        print(f"   🗑️ Usunięto sieć {network_name}")
+    except docker.errors.NotFound:
+        pass
+    inv.discard_network(network_name)
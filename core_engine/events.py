@@ -0,0 +1,298 @@
+"""Nasłuch zdarzeń Dockera utrzymujący lokalny stan kontenerów stron."""
+import os
+import threading
+import time
+
+from core_engine import docker_client
+from core_engine import inventory
+from web_panel import database
+
+# Co ile sekund porównujemy stan kontenerów z tabelą sites
+DRIFT_CHECK_INTERVAL = float(os.environ.get("EVENTS_DRIFT_CHECK_INTERVAL", "60"))
+# Ile sekund czekamy przed ponownym połączeniem po zerwaniu strumienia
+RECONNECT_DELAY = float(os.environ.get("EVENTS_RECONNECT_DELAY", "2"))
+
+# Akcje, po których obraz z inventory jest nieaktualny
+_INVENTORY_ACTIONS = {'create', 'destroy', 'start', 'die', 'stop', 'rename', 'connect', 'disconnect'}
+
+
+def _site_ip(network_settings):
+    """Adres IP kontenera w jego sieci izolowanej (lub pierwszej dostępnej)."""
+    networks = (network_settings or {}).get('Networks') or {}
+    for name, network in networks.items():
+        if name.endswith(inventory.NETWORK_SUFFIX) and network.get('IPAddress'):
+            return network['IPAddress']
+    for network in networks.values():
+        if network.get('IPAddress'):
+            return network['IPAddress']
+    return None
+
+
+def _health_from_status(status_text):
+    for health in ('healthy', 'unhealthy', 'health: starting'):
+        if f"({health})" in (status_text or ''):
+            return health.replace('health: ', '')
+    return None
+
+
+def _state_from_container(container):
+    """Stan kontenera z modelu z listy kontenerów (bez inspect)."""
+    attrs = container.attrs
+    return {
+        'id': container.short_id,
+        'status': container.status,
+        'ip': _site_ip(attrs.get('NetworkSettings')),
+        'restart_count': 0,
+        'oom_kills': 0,
+        'health': _health_from_status(attrs.get('Status')),
+        'exit_code': None,
+        'last_action': None,
+        'updated_at': time.time(),
+    }
+
+
+class ContainerStateCache(threading.Thread):
+    """Wątek czytający ``client.events`` i aktualizujący stan kontenerów stron.
+
+    Stan (status, IP, liczba restartów, zabicia OOM, health) jest trzymany
+    w pamięci, więc strony panelu nie muszą pytać demona. Do zdarzeń można
+    podpiąć własne reakcje przez ``subscribe``.
+    """
+
+    def __init__(self, client=None):
+        super().__init__(name="docker-events", daemon=True)
+        self.client = client or docker_client.get_client()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._states = {}
+        self._handlers = {}
+        self._drift = {'missing': [], 'stopped': [], 'orphaned': []}
+        self._last_drift_check = 0.0
+
+    def subscribe(self, action, handler):
+        """Rejestruje ``handler(name, state, event)`` dla akcji (np. 'die', 'oom')."""
+        self._handlers.setdefault(action, []).append(handler)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def get(self, name):
+        return self._states.get(name)
+
+    def all(self):
+        with self._lock:
+            return {name: dict(state) for name, state in self._states.items()}
+
+    def drift(self):
+        return self._drift
+
+    def seed(self):
+        """Wczytuje stan początkowy z jednego listowania kontenerów."""
+        inv = inventory.get_inventory()
+        inv.refresh()
+        states = {name: _state_from_container(container) for name, container in inv.containers().items()}
+        with self._lock:
+            # Liczniki restartów i OOM przeżywają ponowne połączenie
+            for name, state in states.items():
+                previous = self._states.get(name)
+                if previous:
+                    state['restart_count'] = previous['restart_count']
+                    state['oom_kills'] = previous['oom_kills']
+            self._states = states
+
+    def run(self):
+        seeded = bool(self._states)
+        while not self._stop_event.is_set():
+            try:
+                since = int(time.time())
+                # Po zerwaniu strumienia część zdarzeń przepadła - wczytujemy stan od nowa
+                if not seeded:
+                    self.seed()
+                seeded = False
+                self.check_drift()
+                events = self.client.events(
+                    decode=True, since=since,
+                    filters={'type': ['container', 'network']}
+                )
+                for event in events:
+                    if self._stop_event.is_set():
+                        break
+                    self.handle(event)
+                    if time.monotonic() - self._last_drift_check > DRIFT_CHECK_INTERVAL:
+                        self.check_drift()
+            except Exception as e:
+                print(f"⚠️  Strumień zdarzeń Dockera przerwany: {e}")
+            self._stop_event.wait(RECONNECT_DELAY)
+
+    def handle(self, event):
+        """Nanosi jedno zdarzenie Dockera na stan w pamięci."""
+        event_type = event.get('Type')
+        action = event.get('Action', '')
+        attributes = event.get('Actor', {}).get('Attributes', {})
+
+        if event_type == 'network':
+            if attributes.get('name', '').endswith(inventory.NETWORK_SUFFIX):
+                inventory.get_inventory().invalidate()
+            return
+        if event_type != 'container' or attributes.get('isolation.level') != 'full':
+            return
+
+        name = attributes.get('name')
+        container_id = event.get('Actor', {}).get('ID', '')
+        # np. "health_status: healthy", "exec_start: sh"
+        action, _, detail = action.partition(': ')
+
+        with self._lock:
+            state = self._states.setdefault(name, {
+                'id': container_id[:10], 'status': 'created', 'ip': None,
+                'restart_count': 0, 'oom_kills': 0, 'health': None,
+                'exit_code': None, 'last_action': None, 'updated_at': 0.0,
+            })
+            if action == 'start':
+                if state['last_action'] == 'die':
+                    state['restart_count'] += 1
+                state['status'] = 'running'
+            elif action == 'restart':
+                state['status'] = 'running'
+            elif action == 'die':
+                state['status'] = 'exited'
+                state['exit_code'] = attributes.get('exitCode')
+            elif action == 'oom':
+                state['oom_kills'] += 1
+            elif action in ('pause', 'unpause'):
+                state['status'] = 'paused' if action == 'pause' else 'running'
+            elif action == 'health_status':
+                state['health'] = detail
+            elif action == 'destroy':
+                self._states.pop(name, None)
+            if action not in ('exec_create', 'exec_start', 'exec_die', 'health_status'):
+                state['last_action'] = action
+            state['updated_at'] = event.get('time', time.time())
+            state = dict(state)
+
+        if action == 'start':
+            self._refresh_ip(name, container_id)
+        if action in _INVENTORY_ACTIONS:
+            inventory.get_inventory().invalidate()
+
+        for handler in self._handlers.get(action, ()):
+            try:
+                handler(name, state, event)
+            except Exception as e:
+                print(f"⚠️  Błąd obsługi zdarzenia {action} dla {name}: {e}")
+
+    def _refresh_ip(self, name, container_id):
+        try:
+            attrs = self.client.api.inspect_container(container_id)
+        except Exception:
+            return
+        with self._lock:
+            state = self._states.get(name)
+            if state is not None:
+                state['ip'] = _site_ip(attrs.get('NetworkSettings'))
+                state['restart_count'] = max(state['restart_count'], attrs.get('RestartCount', 0))
+
+    def check_drift(self):
+        """Porównuje stan kontenerów z tabelą sites i zgłasza rozbieżności.
+
+        Nasłuch obejmuje tylko lokalny demon, więc porównywane są strony lokalnego węzła.
+        """
+        self._last_drift_check = time.monotonic()
+        sites = [
+            site for site in database.get_sites_by_mode('isolated')
+            if site['node'] == docker_client.LOCAL_NODE
+        ]
+        site_names = {site['name'] for site in sites}
+        # Uśpione strony są zatrzymane celowo
+        sleeping = {site['name'] for site in sites if site['status'] == 'sleeping'}
+        states = self.all()
+
+        drift = {
+            'missing': sorted(site_names - set(states)),
+            'stopped': sorted(
+                n for n in (site_names - sleeping) & set(states) if states[n]['status'] != 'running'
+            ),
+            'orphaned': sorted(set(states) - site_names),
+        }
+        if drift != self._drift:
+            for kind, names in drift.items():
+                if names:
+                    print(f"⚠️  Rozbieżność ({kind}): {', '.join(names)}")
+        self._drift = drift
+        return drift
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def start_listener():
+    """Uruchamia (jednokrotnie) nasłuch zdarzeń Dockera."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ContainerStateCache()
+            try:
+                # Pierwszy odczyt synchronicznie, żeby strony od razu miały stan
+                _cache.seed()
+            except Exception as e:
+                print(f"⚠️  Nie udało się wczytać stanu kontenerów: {e}")
+            _cache.start()
+            print("👂 Nasłuch zdarzeń Dockera uruchomiony")
+    return _cache
+
+
+def get_state(name):
+    """Stan kontenera strony lub None.
+
+    Nasłuch działa tylko w procesie lidera (``start_control_plane``); pozostałe
+    workery czytają migawkę inventory - bez liczników restartów i OOM.
+    """
+    if _cache is not None:
+        return _cache.get(name)
+    container = inventory.get_inventory().container(name)
+    return _state_from_container(container) if container is not None else None
+
+
+def get_states():
+    """Stan wszystkich kontenerów stron: z nasłuchu lidera albo z migawki inventory."""
+    if _cache is not None:
+        return _cache.all()
+    return {name: _state_from_container(c) for name, c in inventory.get_inventory().containers().items()}
+
+
+def get_site_states(sites):
+    """Stan kontenerów stron {nazwa: stan}: lokalne z nasłuchu, zdalne z migawki inventory węzła."""
+    try:
+        local = get_states()
+    except Exception as e:
+        print(f"⚠️  Nie udało się wczytać stanu kontenerów: {e}")
+        local = {}
+    result = {}
+    unreachable = set()
+    for site in sites:
+        name, node = site['name'], site['node']
+        if node == docker_client.LOCAL_NODE:
+            state = local.get(name)
+        elif node in unreachable:
+            state = None
+        else:
+            try:
+                container = inventory.get_inventory(node).container(name)
+            except Exception as e:
+                print(f"⚠️  Węzeł {node} niedostępny: {e}")
+                unreachable.add(node)
+                container = None
+            state = _state_from_container(container) if container is not None else None
+        if state is not None:
+            result[name] = state
+    return result
+
+
+def get_drift():
+    return _cache.drift() if _cache else None
+
+
+def subscribe(action, handler):
+    """Podpina reakcję na zdarzenie kontenera (wymaga uruchomionego nasłuchu)."""
+    start_listener().subscribe(action, handler)
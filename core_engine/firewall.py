@@ -0,0 +1,111 @@
+"""Izolacja stron w sieciach współdzielonych: bez ruchu między kontenerami poza Traefikiem.
+
+Sieci współdzielone powstają z ``enable_icc=false`` - Docker odrzuca wtedy ruch
+między kontenerami tej samej sieci, także od Traefika. Reguła w łańcuchu
+DOCKER-USER hosta przepuszcza ruch tylko od adresu Traefika w tej sieci
+(odpowiedzi przepuszcza reguła RELATED,ESTABLISHED Dockera). Reguły zakłada
+krótkotrwały kontener pomocniczy w sieci hosta z uprawnieniem NET_ADMIN.
+"""
+import io
+import ipaddress
+import os
+import threading
+
+import docker
+
+from core_engine import docker_client
+
+ICC_OPTION = "com.docker.network.bridge.enable_icc"
+BRIDGE_NAME_OPTION = "com.docker.network.bridge.name"
+# Obraz z iptables dla kontenera pomocniczego (budowany na węźle, gdy go brak)
+FIREWALL_IMAGE = os.environ.get("NETWORK_FIREWALL_IMAGE", "hosting-firewall:1")
+FIREWALL_BASE_IMAGE = os.environ.get("NETWORK_FIREWALL_BASE_IMAGE", "alpine:3.20")
+# Ile sekund czekamy na kontener pomocniczy
+FIREWALL_TIMEOUT = int(os.environ.get("NETWORK_FIREWALL_TIMEOUT", "60"))
+
+# Reguły sieci (mostu) zastępujemy w tym backendzie iptables, w którym Docker ma DOCKER-USER
+_SCRIPT = """
+applied=0
+for ipt in iptables-nft iptables-legacy; do
+    $ipt -S DOCKER-USER >/dev/null 2>&1 || continue
+    $ipt -S DOCKER-USER | grep -e "-i $BRIDGE -o $BRIDGE " | sed 's/^-A DOCKER-USER //' |
+        while read -r rule; do $ipt -D DOCKER-USER $rule || exit 1; done || exit 1
+    if [ -n "$SOURCE" ]; then
+        $ipt -I DOCKER-USER -i "$BRIDGE" -o "$BRIDGE" -s "$SOURCE" -j ACCEPT || exit 1
+    fi
+    applied=1
+done
+[ "$applied" = 1 ] || { echo "brak łańcucha DOCKER-USER" >&2; exit 1; }
+"""
+
+# Reguły założone przez ten proces {(węzeł, sieć): adres Traefika}
+_applied = {}
+_lock = threading.Lock()
+
+
+def icc_disabled(network):
+    """Czy sieć blokuje ruch między kontenerami (``enable_icc=false``)."""
+    return (network.attrs.get('Options') or {}).get(ICC_OPTION) == "false"
+
+
+def bridge_name(network):
+    options = network.attrs.get('Options') or {}
+    return options.get(BRIDGE_NAME_OPTION) or f"br-{network.id[:12]}"
+
+
+def traefik_address(network):
+    """Stały adres Traefika w sieci bez ICC - pierwszy po bramie; None bez podsieci."""
+    for config in (network.attrs.get('IPAM') or {}).get('Config') or []:
+        if config.get('Subnet'):
+            return str(ipaddress.ip_network(config['Subnet'], strict=False)[2])
+    return None
+
+
+def is_allowed(network, node=None):
+    return (node or docker_client.LOCAL_NODE, network.name) in _applied
+
+
+def _ensure_image(client):
+    try:
+        client.images.get(FIREWALL_IMAGE)
+    except docker.errors.ImageNotFound:
+        print(f"🧱 Buduję obraz {FIREWALL_IMAGE}...")
+        dockerfile = f"FROM {FIREWALL_BASE_IMAGE}\nRUN apk add --no-cache iptables iptables-legacy\n"
+        client.images.build(fileobj=io.BytesIO(dockerfile.encode()), tag=FIREWALL_IMAGE, rm=True)
+
+
+def _run(node, bridge, source):
+    client = docker_client.get_client(node=node)
+    _ensure_image(client)
+    container = client.containers.create(
+        FIREWALL_IMAGE, ["sh", "-c", _SCRIPT],
+        environment={'BRIDGE': bridge, 'SOURCE': source or ''},
+        network_mode="host",
+        cap_add=["NET_ADMIN", "NET_RAW"],
+    )
+    try:
+        container.start()
+        status = container.wait(timeout=FIREWALL_TIMEOUT).get('StatusCode')
+        if status != 0:
+            error = container.logs(stdout=False, stderr=True).decode(errors='replace').strip()
+            raise RuntimeError(f"Reguły zapory dla {bridge} nieudane: {error}")
+    finally:
+        container.remove(force=True)
+
+
+def allow_traefik(network, traefik_ip, node=None):
+    """Przepuszcza ruch Traefik -> kontenery sieci bez ICC (zastępuje poprzednią regułę sieci)."""
+    key = (node or docker_client.LOCAL_NODE, network.name)
+    with _lock:
+        if _applied.get(key) == traefik_ip:
+            return
+        _run(node, bridge_name(network), traefik_ip)
+        _applied[key] = traefik_ip
+    print(f"   🧱 {network.name}: ruch między stronami zablokowany, Traefik ({traefik_ip}) przepuszczony")
+
+
+def revoke(network, node=None):
+    """Usuwa regułę sieci (przed usunięciem sieci z Dockera)."""
+    with _lock:
+        _run(node, bridge_name(network), None)
+        _applied.pop((node or docker_client.LOCAL_NODE, network.name), None)
@@ -0,0 +1,211 @@
+"""Usypianie nieużywanych stron i budzenie ich przy pierwszym żądaniu."""
+import json
+import os
+import threading
+import time
+
+import docker
+
+from core_engine import docker_client
+from core_engine import sampler
+from core_engine import static_build
+from web_panel import database
+
+# Czy usypiać nieużywane strony
+IDLE_ENABLED = os.environ.get("IDLE_ENABLED", "1") == "1"
+# Po ilu sekundach bez ruchu strona jest usypiana (musi zmieścić się w historii próbnika)
+IDLE_AFTER = float(os.environ.get("IDLE_AFTER", "1800"))
+# Ruch (MB, przychodzący + wychodzący) uznawany za brak ruchu
+IDLE_THRESHOLD_MB = float(os.environ.get("IDLE_THRESHOLD_MB", "0.01"))
+# Co ile sekund sprawdzamy strony
+IDLE_CHECK_INTERVAL = float(os.environ.get("IDLE_CHECK_INTERVAL", "60"))
+# Ile sekund czekamy na start budzonego kontenera
+WAKE_TIMEOUT = float(os.environ.get("WAKE_TIMEOUT", "15"))
+# Ile sekund po starcie czekamy, aż Traefik przełączy router na kontener
+WAKE_SETTLE = float(os.environ.get("WAKE_SETTLE", "0.5"))
+# Usługa Traefik panelu, do której trafiają żądania uśpionych stron
+WAKE_SERVICE = os.environ.get("WAKE_SERVICE", "webpanel@docker")
+
+STATUS_ACTIVE = 'active'
+STATUS_SLEEPING = 'sleeping'
+
+TRAEFIK_DIRNAME = "traefik"
+WAKE_ROUTES_NAME = "wake.yml"
+# Poniżej routera kontenera (Host, priorytet = długość reguły), powyżej puli współdzielonej
+WAKE_PRIORITY = 2
+
+_user_data_dir = None
+_routes_lock = threading.Lock()
+_wake_locks = {}
+_wake_locks_lock = threading.Lock()
+
+
+def wake_routes_path(user_data_dir):
+    return os.path.join(user_data_dir, static_build.CONFIG_DIRNAME, TRAEFIK_DIRNAME, WAKE_ROUTES_NAME)
+
+
+def write_wake_routes():
+    """Zapisuje routery Traefik (file provider) kierujące uśpione strony do panelu."""
+    if _user_data_dir is None:
+        return
+    with _routes_lock:
+        routers = {
+            f"wake-{site['name']}": {
+                'rule': f"Host(`{site['domain']}`)",
+                'service': WAKE_SERVICE,
+                'priority': WAKE_PRIORITY,
+                'entryPoints': ['web'],
+            }
+            # Strona współdzielona nie ma kontenera do budzenia - obsługuje ją pula
+            for site in database.get_sites_by_status(STATUS_SLEEPING, hosting_mode='isolated')
+        }
+        # JSON jest poprawnym YAML-em
+        content = json.dumps({'http': {'routers': routers}} if routers else {}, indent=2, sort_keys=True)
+        static_build.write_if_changed(wake_routes_path(_user_data_dir), content + "\n")
+
+
+def _traffic_mb(history, since):
+    """Ruch sieciowy od ``since`` z liczników próbnika; None, gdy za mało danych."""
+    timestamps = history['timestamp']
+    if not timestamps or timestamps[0] > since:
+        return None
+    # Ostatnia próbka sprzed okna jest punktem odniesienia
+    start = max(i for i, ts in enumerate(timestamps) if ts <= since)
+    rx = history['network_rx_mb']
+    tx = history['network_tx_mb']
+    traffic = (rx[-1] - rx[start]) + (tx[-1] - tx[start])
+    # Liczniki wyzerowane (restart kontenera) - traktujemy jak ruch
+    return traffic if traffic >= 0 else None
+
+
+def _wake_lock(name):
+    with _wake_locks_lock:
+        return _wake_locks.setdefault(name, threading.Lock())
+
+
+def sleep_site(name):
+    """Usypia stronę: najpierw router budzenia, potem zatrzymanie kontenera.
+
+    Budzenie może trwać w innym procesie (worker obsługujący żądanie), więc
+    status zmieniany jest warunkowo w bazie, a po zatrzymaniu sprawdzany
+    ponownie - strona obudzona w międzyczasie dostaje kontener z powrotem.
+    """
+    with _wake_lock(name):
+        site = database.get_site(name)
+        if site is None or not database.compare_and_set_site_status(name, STATUS_ACTIVE, STATUS_SLEEPING):
+            return False
+        write_wake_routes()
+        client = docker_client.get_client(node=site['node'])
+        try:
+            container = client.containers.get(name)
+            # "always" podniósłby kontener po restarcie demona
+            container.update(restart_policy={"Name": "unless-stopped"})
+            container.stop(timeout=5)
+        except docker.errors.NotFound:
+            return True
+        current = database.get_site(name)
+        if current is not None and current['status'] != STATUS_SLEEPING:
+            # Obudzona, zanim kontener się zatrzymał - router budzenia już zniknął
+            container.update(restart_policy={"Name": "always"})
+            container.start()
+            print(f"⏰ {name} obudzona w trakcie usypiania - kontener uruchomiony ponownie")
+            return False
+        print(f"😴 Uśpiono {name}")
+        return True
+
+
+def wake_site(name, timeout=WAKE_TIMEOUT):
+    """Budzi stronę i czeka, aż kontener działa; zwraca True po sukcesie.
+
+    Równoległe żądania do tej samej strony czekają na jeden start.
+    """
+    with _wake_lock(name):
+        site = database.get_site(name)
+        if site is None:
+            return False
+        client = docker_client.get_client(node=site['node'])
+        try:
+            container = client.containers.get(name)
+        except docker.errors.NotFound:
+            return False
+        if container.status != 'running':
+            started = time.monotonic()
+            container.update(restart_policy={"Name": "always"})
+            container.start()
+            while container.status != 'running' and time.monotonic() - started < timeout:
+                time.sleep(0.1)
+                container.reload()
+            if container.status != 'running':
+                return False
+            print(f"⏰ Obudzono {name} ({time.monotonic() - started:.2f}s)")
+        if database.compare_and_set_site_status(name, STATUS_SLEEPING, STATUS_ACTIVE):
+            write_wake_routes()
+        return True
+
+
+def mark_awake(name):
+    """Oznacza stronę jako aktywną i usuwa jej router budzenia."""
+    database.set_site_status(name, STATUS_ACTIVE)
+    write_wake_routes()
+
+
+class IdleDetector(threading.Thread):
+    """Wątek usypiający strony bez ruchu przez ``IDLE_AFTER`` sekund."""
+
+    def __init__(self, interval=IDLE_CHECK_INTERVAL):
+        super().__init__(name="idle-detector", daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check_once()
+            except Exception as e:
+                print(f"⚠️  Błąd wykrywania bezczynności: {e}")
+
+    def check_once(self):
+        """Usypia strony, których liczniki sieci nie wzrosły w oknie."""
+        since = time.time() - IDLE_AFTER
+        slept = []
+        for site in database.get_sites_by_mode('isolated'):
+            if site['status'] == STATUS_SLEEPING:
+                continue
+            history = sampler.get_site_history(site['name'])
+            if not history:
+                continue
+            traffic = _traffic_mb(history, since)
+            if traffic is not None and traffic <= IDLE_THRESHOLD_MB:
+                if sleep_site(site['name']):
+                    slept.append(site['name'])
+        return slept
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def configure(user_data_dir):
+    """Katalog danych dla routerów budzenia - potrzebny w każdym procesie, który budzi strony."""
+    global _user_data_dir
+    _user_data_dir = user_data_dir
+
+
+def start_detector(user_data_dir):
+    """Zapisuje routery budzenia i uruchamia (jednokrotnie) wykrywanie bezczynności."""
+    global _detector
+    with _detector_lock:
+        configure(user_data_dir)
+        write_wake_routes()
+        if _detector is None and IDLE_ENABLED:
+            _detector = IdleDetector()
+            _detector.start()
+            print(f"😴 Usypianie stron po {IDLE_AFTER:.0f}s bez ruchu")
+    return _detector
+
+
+def is_sleeping(site):
+    return site is not None and site['status'] == STATUS_SLEEPING
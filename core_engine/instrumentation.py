@@ -0,0 +1,291 @@
+"""Liczniki czasu wykonania w procesie i eksport w formacie Prometheus."""
+import atexit
+import bisect
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+# Czy mierzyć czas wywołań Dockera, funkcji bazy, operacji i tras panelu
+INSTRUMENTATION_ENABLED = os.environ.get("INSTRUMENTATION_ENABLED", "1") == "1"
+# Górne granice kubełków histogramów (sekundy)
+BUCKETS = tuple(
+    float(b) for b in os.environ.get(
+        "INSTRUMENTATION_BUCKETS",
+        "0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30"
+    ).split(",")
+)
+# Katalog wspólny procesów panelu (gunicorn): każdy proces zapisuje w nim swoje
+# histogramy, a eksport sumuje pliki wszystkich procesów. Pusty - tylko bieżący proces.
+SHARED_DIR = os.environ.get("INSTRUMENTATION_DIR", "")
+# Co ile sekund proces zapisuje histogramy do SHARED_DIR (eksport zapisuje własne od razu)
+FLUSH_INTERVAL = float(os.environ.get("INSTRUMENTATION_FLUSH_INTERVAL", "5"))
+
+
+class Histogram:
+    """Histogram czasu z etykietami; ``observe`` to bisect i kilka dodawań pod blokadą."""
+
+    def __init__(self, name, documentation, label_names, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # {etykiety: [liczności kubełków (ostatni = +Inf), suma, liczba]}
+        self._series = {}
+
+    def observe(self, labels, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: (list(s[0]), s[1], s[2]) for labels, s in self._series.items()}
+
+    def render(self, snapshot=None):
+        """Linie ekspozycji z ``snapshot`` (domyślnie - z tego procesu)."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        snapshot = self.snapshot() if snapshot is None else snapshot
+        for labels, (counts, total, count) in sorted(snapshot.items()):
+            pairs = list(zip(self.label_names, labels))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(pairs, le=le)} {cumulative}")
+            base = _labels(pairs)
+            lines.append(f"{self.name}_sum{base} {total!r}")
+            lines.append(f"{self.name}_count{base} {count}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs, **extra):
+    items = list(pairs) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+DOCKER_CALLS = Histogram(
+    "hosting_docker_api_call_duration_seconds",
+    "Czas wywołań Docker API wg węzła i typu wywołania.",
+    ("node", "call"),
+)
+DB_CALLS = Histogram(
+    "hosting_db_call_duration_seconds",
+    "Czas funkcji modułu web_panel.database.",
+    ("function",),
+)
+OPERATIONS = Histogram(
+    "hosting_operation_duration_seconds",
+    "Czas operacji na kontenerach (start, stop, statystyki...).",
+    ("operation",),
+)
+ROUTES = Histogram(
+    "hosting_http_request_duration_seconds",
+    "Czas obsługi żądań panelu wg trasy, metody i kodu odpowiedzi.",
+    ("route", "method", "status"),
+)
+HISTOGRAMS = [DOCKER_CALLS, DB_CALLS, OPERATIONS, ROUTES]
+
+# Czas startu procesu wg fazy (import, init, control_plane)
+_startup = {}
+# Nazwa pliku procesu w SHARED_DIR - z czasem startu, żeby nowy proces o tym samym pid nie nadpisał starego
+_process_file = f"{os.getpid()}-{int(time.time() * 1000)}.json"
+
+
+def record_startup(phase, seconds):
+    _startup[phase] = seconds
+
+
+def get_startup():
+    return dict(_startup)
+
+
+def flush():
+    """Zapisuje histogramy i czasy startu tego procesu do ``SHARED_DIR`` (atomowo)."""
+    if not SHARED_DIR:
+        return
+    data = {
+        'pid': os.getpid(),
+        'startup': get_startup(),
+        'histograms': {
+            histogram.name: [
+                [list(labels), counts, total, count]
+                for labels, (counts, total, count) in histogram.snapshot().items()
+            ]
+            for histogram in HISTOGRAMS
+        },
+    }
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    path = os.path.join(SHARED_DIR, _process_file)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _collect():
+    """Histogramy zsumowane ze wszystkich procesów i czasy startu żyjących procesów.
+
+    Pliki zakończonych workerów zostają - sumy i liczniki nie mogą maleć między
+    odczytami. Katalog czyści dopiero start panelu (gunicorn.conf.py).
+    """
+    merged = {histogram.name: {} for histogram in HISTOGRAMS}
+    sizes = {histogram.name: len(histogram.buckets) + 1 for histogram in HISTOGRAMS}
+    startup = {}
+    try:
+        names = os.listdir(SHARED_DIR)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(SHARED_DIR, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if data.get('startup') and _alive(data['pid']):
+            startup[data['pid']] = data['startup']
+        for histogram_name, series in data.get('histograms', {}).items():
+            target = merged.get(histogram_name)
+            if target is None:
+                continue
+            for labels, counts, total, count in series:
+                if len(counts) != sizes[histogram_name]:
+                    continue
+                labels = tuple(labels)
+                current = target.get(labels)
+                if current is not None:
+                    counts = [a + b for a, b in zip(current[0], counts)]
+                    total += current[1]
+                    count += current[2]
+                target[labels] = (list(counts), total, count)
+    return merged, startup
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError as e:
+            print(f"⚠️  Nie udało się zapisać histogramów: {e}")
+
+
+def start_flusher():
+    """Uruchamia (jednokrotnie) okresowy zapis histogramów procesu do ``SHARED_DIR``."""
+    global _flusher
+    if not SHARED_DIR or not INSTRUMENTATION_ENABLED:
+        return None
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="instrumentation-flush", daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+    return _flusher
+
+
+def timed(histogram, *labels):
+    """Dekorator mierzący czas funkcji; przy wyłączonym pomiarze zwraca ją bez zmian."""
+    def decorator(fn):
+        if not INSTRUMENTATION_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(labels, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def operation(fn):
+    """Mierzy czas funkcji jako operację o nazwie funkcji."""
+    return timed(OPERATIONS, fn.__name__)(fn)
+
+
+def instrument_module(module, histogram, skip=()):
+    """Opakowuje pomiarem wszystkie publiczne funkcje zdefiniowane w module.
+
+    Pomijane są generatory i funkcje z ``skip`` (np. menedżery kontekstu).
+    Moduły wywołują się przez atrybuty, więc wewnętrzne wywołania też są mierzone.
+    """
+    if not INSTRUMENTATION_ENABLED:
+        return
+    for name, fn in list(vars(module).items()):
+        if (name.startswith('_') or name in skip or not inspect.isfunction(fn)
+                or fn.__module__ != module.__name__ or inspect.isgeneratorfunction(fn)):
+            continue
+        setattr(module, name, timed(histogram, name)(fn))
+
+
+def render(site_metrics=()):
+    """Tekst w formacie ekspozycji Prometheus: histogramy i metryki stron.
+
+    ``site_metrics`` to ostatnia runda próbnika - eksport nie odpytuje Dockera.
+    Z ``SHARED_DIR`` histogramy są sumą wszystkich procesów panelu, więc każdy
+    worker zwraca te same liczniki; czasy startu mają etykietę ``pid``.
+    """
+    if SHARED_DIR:
+        flush()
+        snapshots, startup = _collect()
+    else:
+        snapshots, startup = {}, {os.getpid(): get_startup()}
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render(snapshots.get(histogram.name)))
+
+    gauges = [
+        ('hosting_site_cpu_percent', 'Użycie CPU kontenera strony (% jednego rdzenia).', 'cpu_percent', 1),
+        ('hosting_site_memory_bytes', 'Pamięć używana przez kontener strony.', 'ram_usage_mb', 1024 * 1024),
+        ('hosting_site_memory_limit_bytes', 'Limit pamięci kontenera strony.', 'ram_limit_mb', 1024 * 1024),
+        ('hosting_site_network_receive_bytes', 'Odebrane bajty od startu kontenera.', 'network_rx_mb', 1024 * 1024),
+        ('hosting_site_network_transmit_bytes', 'Wysłane bajty od startu kontenera.', 'network_tx_mb', 1024 * 1024),
+        ('hosting_site_disk_usage_bytes', 'Zajętość plików strony.', 'disk_usage_mb', 1024 * 1024),
+    ]
+    lines.append("# HELP hosting_process_startup_seconds Czas startu procesu panelu wg fazy.")
+    lines.append("# TYPE hosting_process_startup_seconds gauge")
+    for pid, phases in sorted(startup.items()):
+        for phase, seconds in sorted(phases.items()):
+            lines.append(f"hosting_process_startup_seconds{_labels([('pid', pid), ('phase', phase)])} {seconds!r}")
+
+    for name, documentation, key, scale in gauges:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        for item in site_metrics:
+            site = item['site']
+            value = item['metrics'][key] * scale
+            lines.append(f"{name}{_labels([('site', site['name']), ('node', site['node'])])} {value!r}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,141 @@
+"""Zbiorczy obraz kontenerów i sieci stron pobierany kilkoma wywołaniami API."""
+import os
+import threading
+import time
+
+from core_engine import docker_client
+
+# Po ilu sekundach obraz stanu jest pobierany ponownie
+INVENTORY_TTL = float(os.environ.get("DOCKER_INVENTORY_TTL", "5"))
+
+SITE_LABEL = "isolation.level=full"
+TRAEFIK_NAME = "traefik_proxy"
+NETWORK_SUFFIX = "_isolated"
+
+
+def _container_name(raw):
+    return raw['Names'][0].lstrip('/') if raw.get('Names') else raw['Id'][:12]
+
+
+class Inventory:
+    """Migawka kontenerów stron, sieci i Traefika z indeksami po nazwach.
+
+    Odświeżenie to zawsze trzy wywołania API niezależnie od liczby stron.
+    Zmiany wykonane przez panel są nanoszone lokalnie, a pełne odświeżenie
+    następuje po ``ttl`` sekundach lub po ``invalidate()``.
+    """
+
+    def __init__(self, client=None, ttl=INVENTORY_TTL, node=None):
+        self.node = node or docker_client.LOCAL_NODE
+        self.client = client or docker_client.get_client(node=self.node)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._fetched_at = 0.0
+        self._containers = {}
+        self._networks = {}
+        self._traefik = None
+        self._traefik_networks = set()
+
+    def refresh(self):
+        """Pobiera pełny obraz stanu z Dockera."""
+        api = self.client.api
+        raw_containers = api.containers(all=True, filters={'label': SITE_LABEL})
+        raw_traefik = api.containers(all=True, filters={'name': TRAEFIK_NAME})
+        raw_networks = api.networks()
+
+        containers = {
+            _container_name(raw): self.client.containers.prepare_model(raw)
+            for raw in raw_containers
+        }
+        networks = {
+            raw['Name']: self.client.networks.prepare_model(raw)
+            for raw in raw_networks
+        }
+        traefik = None
+        traefik_networks = set()
+        for raw in raw_traefik:
+            if _container_name(raw) == TRAEFIK_NAME:
+                traefik = self.client.containers.prepare_model(raw)
+                traefik_networks = set(raw.get('NetworkSettings', {}).get('Networks', {}))
+
+        with self._lock:
+            self._containers = containers
+            self._networks = networks
+            self._traefik = traefik
+            self._traefik_networks = traefik_networks
+            self._fetched_at = time.monotonic()
+
+    def invalidate(self):
+        """Wymusza pełne odświeżenie przy następnym odczycie."""
+        self._fetched_at = 0.0
+
+    def _ensure_fresh(self):
+        if time.monotonic() - self._fetched_at > self.ttl:
+            with self._refresh_lock:
+                if time.monotonic() - self._fetched_at > self.ttl:
+                    self.refresh()
+
+    def container(self, name):
+        """Kontener strony (model z listy, bez inspect) lub None."""
+        self._ensure_fresh()
+        return self._containers.get(name)
+
+    def containers(self):
+        self._ensure_fresh()
+        return dict(self._containers)
+
+    def network(self, name):
+        self._ensure_fresh()
+        return self._networks.get(name)
+
+    def networks(self):
+        self._ensure_fresh()
+        return dict(self._networks)
+
+    def traefik(self):
+        self._ensure_fresh()
+        return self._traefik
+
+    def traefik_attached(self, network_name):
+        self._ensure_fresh()
+        return network_name in self._traefik_networks
+
+    # Lokalne naniesienie zmian wykonanych przez panel
+
+    def add_container(self, name, container):
+        with self._lock:
+            self._containers[name] = container
+
+    def discard_container(self, name):
+        with self._lock:
+            self._containers.pop(name, None)
+
+    def add_network(self, network):
+        with self._lock:
+            self._networks[network.name] = network
+
+    def discard_network(self, name):
+        with self._lock:
+            self._networks.pop(name, None)
+            self._traefik_networks.discard(name)
+
+    def mark_traefik_attached(self, network_name):
+        with self._lock:
+            self._traefik_networks.add(network_name)
+
+
+_inventories = {}
+_inventory_lock = threading.Lock()
+
+
+def get_inventory(node=None):
+    """Zwraca współdzielony obraz stanu Dockera węzła ``node``."""
+    node = node or docker_client.LOCAL_NODE
+    inv = _inventories.get(node)
+    if inv is None:
+        with _inventory_lock:
+            inv = _inventories.get(node)
+            if inv is None:
+                inv = _inventories[node] = Inventory(node=node)
+    return inv
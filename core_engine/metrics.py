@@ -1,83 +1,178 @@
 """Moduł do zbierania metryk kontenerów przez Docker API."""
-import docker
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from core_engine import disk_index
+from core_engine import docker_client
+from core_engine import instrumentation
+from core_engine import stats_stream
 from web_panel import database
 
+# Maksymalna liczba równoległych zapytań o metryki
+METRICS_MAX_WORKERS = int(os.environ.get("METRICS_MAX_WORKERS", "16"))
+# Limit czasu (s) na pobranie metryk jednego kontenera
+METRICS_TIMEOUT = float(os.environ.get("METRICS_TIMEOUT", "5"))
+
+
+def parse_stats(stats, previous=None):
+    """Wylicza metryki z ramki ``stats`` Dockera.
+
+    Jeśli podano ``previous`` (poprzednia ramka ze strumienia), zużycie CPU
+    liczone jest względem niej zamiast względem ``precpu_stats``. Zajętości
+    dysku Docker nie podaje - uzupełnia ją ``get_container_stats``.
+    """
+    cpu_stats = stats.get('cpu_stats', {})
+    precpu_stats = previous['cpu_stats'] if previous else stats.get('precpu_stats', {})
+
+    cpu_delta = cpu_stats.get('cpu_usage', {}).get('total_usage', 0) - \
+               precpu_stats.get('cpu_usage', {}).get('total_usage', 0)
+    system_delta = cpu_stats.get('system_cpu_usage', 0) - \
+                  precpu_stats.get('system_cpu_usage', 0)
+    cpu_count = cpu_stats.get('online_cpus', 1)
+
+    cpu_percent = 0.0
+    if system_delta > 0 and cpu_delta > 0:
+        cpu_percent = (cpu_delta / system_delta) * cpu_count * 100.0
+
+    memory_stats = stats.get('memory_stats', {})
+    ram_usage_mb = memory_stats.get('usage', 0) / (1024 * 1024)
+    ram_limit_mb = memory_stats.get('limit', 0) / (1024 * 1024)
+    ram_percent = (ram_usage_mb / ram_limit_mb) * 100 if ram_limit_mb > 0 else 0
+
+    networks = stats.get('networks', {})
+    network_rx_mb = 0
+    network_tx_mb = 0
+    for interface in networks.values():
+        network_rx_mb += interface['rx_bytes'] / (1024 * 1024)
+        network_tx_mb += interface['tx_bytes'] / (1024 * 1024)
+
+    return {
+        'cpu_percent': round(cpu_percent, 2),
+        'ram_usage_mb': round(ram_usage_mb, 2),
+        'ram_limit_mb': round(ram_limit_mb, 2),
+        'ram_percent': round(ram_percent, 2),
+        'network_rx_mb': round(network_rx_mb, 2),
+        'network_tx_mb': round(network_tx_mb, 2),
+    }
+
+
+@instrumentation.operation
+def get_container_stats(container_name, client=None):
+    """Pobiera aktualne metryki kontenera.
+
+    Gdy działa subskrypcja strumieni ``stats``, wynik pochodzi z pamięci;
+    jednorazowe zapytanie do Dockera jest tylko awaryjnym wyjściem.
+    Zajętość dysku pochodzi z indeksu katalogu user_data strony.
+    """
+    streamed = stats_stream.get_latest(container_name)
+    if streamed is not None:
+        return dict(streamed, disk_usage_mb=disk_index.get_usage_mb(container_name))
 
-def get_container_stats(container_name):
-    """Pobiera aktualne metryki kontenera."""
     try:
-        client = docker.from_env()
+        if client is None:
+            client = docker_client.get_client()
         container = client.containers.get(container_name)
         
         stats = container.stats(stream=False)
-        
-        cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - \
-                   stats['precpu_stats']['cpu_usage']['total_usage']
-        system_delta = stats['cpu_stats']['system_cpu_usage'] - \
-                      stats['precpu_stats']['system_cpu_usage']
-        cpu_count = stats['cpu_stats']['online_cpus']
-        
-        cpu_percent = 0.0
-        if system_delta > 0 and cpu_delta > 0:
-            cpu_percent = (cpu_delta / system_delta) * cpu_count * 100.0
-        
-        ram_usage_mb = stats['memory_stats']['usage'] / (1024 * 1024)
-        ram_limit_mb = stats['memory_stats']['limit'] / (1024 * 1024)
-        ram_percent = (ram_usage_mb / ram_limit_mb) * 100 if ram_limit_mb > 0 else 0
-        
-        networks = stats.get('networks', {})
-        network_rx_mb = 0
-        network_tx_mb = 0
-        for interface in networks.values():
-            network_rx_mb += interface['rx_bytes'] / (1024 * 1024)
-            network_tx_mb += interface['tx_bytes'] / (1024 * 1024)
-        
-        disk_usage_mb = 0
-        try:
-            inspect = client.api.inspect_container(container_name)
-            size_rw = inspect.get('SizeRw', 0)
-            disk_usage_mb = size_rw / (1024 * 1024)
-        except:
-            pass
-        
-        return {
-            'cpu_percent': round(cpu_percent, 2),
-            'ram_usage_mb': round(ram_usage_mb, 2),
-            'ram_limit_mb': round(ram_limit_mb, 2),
-            'ram_percent': round(ram_percent, 2),
-            'network_rx_mb': round(network_rx_mb, 2),
-            'network_tx_mb': round(network_tx_mb, 2),
-            'disk_usage_mb': round(disk_usage_mb, 2),
-            'status': container.status
-        }
+        result = parse_stats(stats)
+        result['disk_usage_mb'] = disk_index.get_usage_mb(container_name)
+        result['status'] = container.status
+        return result
     except Exception as e:
         print(f"Błąd pobierania metryk dla {container_name}: {e}")
         return None
 
 
-def get_all_sites_metrics():
-    """Pobiera metryki dla wszystkich stron z bazy."""
-    sites = database.get_all_sites()
-    results = []
-    
-    for site in sites:
-        metrics = get_container_stats(site['name'])
-        limits = database.get_resource_limits(site['id'])
-        
+def get_offline_site_stats(site_name, status):
+    """Metryki strony bez działającego własnego kontenera (pula współdzielona, uśpiona) - tylko dysk."""
+    return {
+        'cpu_percent': 0.0,
+        'ram_usage_mb': 0.0,
+        'ram_limit_mb': 0.0,
+        'ram_percent': 0.0,
+        'network_rx_mb': 0.0,
+        'network_tx_mb': 0.0,
+        'disk_usage_mb': disk_index.get_usage_mb(site_name),
+        'status': status,
+    }
+
+
+def _has_container(site):
+    """Czy strona ma działający własny kontener, o który warto pytać Dockera."""
+    return site['hosting_mode'] != 'shared' and site['status'] != 'sleeping'
+
+
+def _build_site_metrics(site, metrics, limits):
+    """Łączy metryki i limity strony w jeden wpis z alertami."""
+    cpu_over_limit = metrics['cpu_percent'] > limits['cpu_limit'] if limits else False
+    ram_over_limit = metrics['ram_usage_mb'] > limits['ram_limit_mb'] if limits else False
+    disk_over_limit = metrics['disk_usage_mb'] > limits['disk_limit_mb'] if limits else False
+
+    return {
+        'site': site,
+        'metrics': metrics,
+        'limits': limits,
+        'alerts': {
+            'cpu': cpu_over_limit,
+            'ram': ram_over_limit,
+            'disk': disk_over_limit
+        }
+    }
+
+
+def get_all_sites_metrics(max_workers=None, timeout=None, sites=None):
+    """Pobiera metryki dla wszystkich stron z bazy (lub tylko dla ``sites``).
+
+    Zapytania do Dockera idą równolegle (maks. ``max_workers`` naraz), a każde
+    ma własny limit czasu ``timeout``. Strony, dla których nie udało się
+    pobrać metryk w czasie, są pomijane - zwracany jest częściowy wynik.
+    """
+    max_workers = max_workers or METRICS_MAX_WORKERS
+    timeout = timeout or METRICS_TIMEOUT
+
+    if sites is None:
+        sites = database.get_all_sites_with_limits()
+    if not sites:
+        return []
+
+    # Jeden klient na węzeł; timeout HTTP ogranicza każde wywołanie API
+    clients = {}
+    for node in {site['node'] for site in sites if _has_container(site)}:
+        try:
+            clients[node] = docker_client.get_client(timeout=timeout, node=node)
+        except Exception as e:
+            print(f"Węzeł {node} niedostępny: {e}")
+    workers = min(max_workers, len(sites))
+    # Najwolniejsza "fala" zadań nie może trwać dłużej niż timeout
+    waves = -(-len(sites) // workers)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="metrics")
+    try:
+        futures = {
+            executor.submit(get_container_stats, site['name'], clients[site['node']]): site
+            for site in sites if _has_container(site) and site['node'] in clients
+        }
+        done, not_done = wait(futures, timeout=timeout * waves)
+        for future in not_done:
+            future.cancel()
+            print(f"Przekroczono czas pobierania metryk dla {futures[future]['name']}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    results = [
+        _build_site_metrics(
+            site,
+            get_offline_site_stats(site['name'], 'shared' if site['hosting_mode'] == 'shared' else site['status']),
+            site if site['has_limits'] else None
+        )
+        for site in sites if not _has_container(site)
+    ]
+    for future, site in futures.items():
+        if future not in done:
+            continue
+        metrics = future.result()
         if metrics:
-            cpu_over_limit = metrics['cpu_percent'] > limits['cpu_limit'] if limits else False
-            ram_over_limit = metrics['ram_usage_mb'] > limits['ram_limit_mb'] if limits else False
-            disk_over_limit = metrics['disk_usage_mb'] > limits['disk_limit_mb'] if limits else False
-            
-            results.append({
-                'site': site,
-                'metrics': metrics,
-                'limits': limits,
-                'alerts': {
-                    'cpu': cpu_over_limit,
-                    'ram': ram_over_limit,
-                    'disk': disk_over_limit
-                }
-            })
-    
+            limits = site if site['has_limits'] else None
+            results.append(_build_site_metrics(site, metrics, limits))
+
     return results
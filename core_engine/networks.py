@@ -0,0 +1,268 @@
+"""Przydział sieci izolowanych stronom: sieci dedykowane, sieci tenantów i adresacja z własnej puli."""
+import ipaddress
+import os
+import threading
+import uuid
+
+import docker
+
+from core_engine import docker_client
+from core_engine import docker_manager
+from core_engine import inventory
+from core_engine import warm_pool
+from web_panel import database
+
+# Jak strony dzielą sieci:
+#   site   - każda strona ma własną sieć (najsilniejsza izolacja, jeden bridge na stronę)
+#   owner  - strony jednego właściciela dzielą sieci, strony bez właściciela mają własne
+#   shared - wszystkie strony węzła trafiają do ograniczonej liczby wspólnych sieci
+# Sieci współdzielone (owner, shared) blokują ruch między kontenerami (enable_icc=false),
+# przepuszczając tylko Traefik - zob. core_engine/firewall.py.
+NETWORK_POLICY = os.environ.get("NETWORK_POLICY", "owner")
+# Pula adresów, z której przydzielamy podsieci sieci stron (poza domyślnymi pulami Dockera)
+NETWORK_POOL = ipaddress.ip_network(os.environ.get("NETWORK_POOL", "10.200.0.0/16"))
+# Prefiks podsieci sieci dedykowanej (/28 = 14 adresów: strona, Traefik i zapas)
+SITE_PREFIX = int(os.environ.get("NETWORK_SITE_PREFIX", "28"))
+# Prefiks podsieci sieci współdzielonej (/24 = 254 adresy)
+SHARD_PREFIX = int(os.environ.get("NETWORK_SHARD_PREFIX", "24"))
+# Ile stron mieści jedna sieć współdzielona
+SHARD_CAPACITY = int(os.environ.get("NETWORK_SHARD_CAPACITY", "200"))
+# Czy sieci współdzielone blokują ruch między stronami (wymaga reguły zapory dla Traefika)
+SHARD_ISOLATION = os.environ.get("NETWORK_SHARD_ISOLATION", "1") == "1"
+
+SHARD_PREFIX_NAME = "shard"
+SHARED_TENANT = "shared"
+
+# Przydział podsieci i tworzenie sieci jednego węzła nie mogą się przeplatać
+_allocate_lock = threading.Lock()
+
+
+def tenant_for(site_name, owner=None):
+    """Tenant sieci strony wg ``NETWORK_POLICY``; None oznacza sieć dedykowaną.
+
+    ``owner`` to id właściciela nowej strony - jej wiersza w ``sites`` jeszcze nie ma.
+    """
+    if NETWORK_POLICY == 'shared':
+        return SHARED_TENANT
+    if NETWORK_POLICY == 'owner':
+        if owner is None:
+            site = database.get_site(site_name)
+            owner = site['user_id'] if site is not None else None
+        if owner is not None:
+            return f"user:{owner}"
+    return None
+
+
+def _network_subnets(network):
+    """Podsieci IPv4 sieci Dockera (z migawki listy sieci)."""
+    subnets = []
+    for config in (network.attrs.get('IPAM') or {}).get('Config') or []:
+        try:
+            subnet = ipaddress.ip_network(config.get('Subnet', ''), strict=False)
+        except ValueError:
+            continue
+        if subnet.version == 4:
+            subnets.append(subnet)
+    return subnets
+
+
+def used_subnets(node):
+    """Podsieci zajęte na węźle: zapisane w bazie i należące do istniejących sieci Dockera."""
+    used = {
+        ipaddress.ip_network(row['subnet'])
+        for row in database.get_networks(node)
+        if row['subnet']
+    }
+    for network in inventory.get_inventory(node).networks().values():
+        used.update(_network_subnets(network))
+    return used
+
+
+def next_subnet(prefix, used, pool=None):
+    """Pierwsza wolna podsieć ``/prefix`` z puli, niekolidująca z ``used``."""
+    pool = pool or NETWORK_POOL
+    size = 2 ** (32 - prefix)
+    start = int(pool.network_address)
+    end = int(pool.broadcast_address)
+    # Zajęte przedziały w obrębie puli, posortowane - przeskakujemy je zamiast sprawdzać każdą podsieć
+    taken = sorted(
+        (int(s.network_address), int(s.broadcast_address))
+        for s in used if s.version == 4 and s.overlaps(pool)
+    )
+    candidate = start
+    for low, high in taken:
+        if candidate + size - 1 < low:
+            break
+        if high >= candidate:
+            # Następny adres za zajętym przedziałem, wyrównany do rozmiaru podsieci
+            candidate = -(-(high + 1 - start) // size) * size + start
+    if candidate + size - 1 > end:
+        raise RuntimeError(f"Pula adresów sieci {pool} wyczerpana (/{prefix})")
+    return str(ipaddress.ip_network((candidate, prefix)))
+
+
+def allocate_subnet(node, prefix):
+    return next_subnet(prefix, used_subnets(node))
+
+
+def create_dedicated(base_name, labels=None, node=None):
+    """Tworzy sieć dedykowaną z podsiecią z puli, jeszcze bez strony (pula gotowych sieci)."""
+    node = node or docker_client.LOCAL_NODE
+    with _allocate_lock:
+        subnet = allocate_subnet(node, SITE_PREFIX)
+        return docker_manager.create_isolated_network(base_name, labels=labels, node=node, subnet=subnet)
+
+
+def _base_name(network_name):
+    return network_name[:-len(inventory.NETWORK_SUFFIX)]
+
+
+def _ensure(row):
+    """Tworzy (lub odnajduje) sieć Dockera z wiersza ``networks`` i podłącza do niej Traefik.
+
+    Sieć współdzielona (z tenantem) powstaje bez ruchu między kontenerami.
+    Gdy podsieć koliduje z siecią utworzoną poza panelem, przydziela nową.
+    """
+    subnet = row['subnet']
+    for attempt in range(3):
+        try:
+            return docker_manager.create_isolated_network(
+                _base_name(row['name']), node=row['node'], subnet=subnet,
+                icc=row['tenant'] is None or not SHARD_ISOLATION,
+            )
+        except docker.errors.APIError as e:
+            if subnet is None or "overlaps" not in str(e) or attempt == 2:
+                raise
+            inv = inventory.get_inventory(row['node'])
+            inv.refresh()
+            subnet = allocate_subnet(row['node'], ipaddress.ip_network(subnet).prefixlen)
+            database.set_network_subnet(row['id'], subnet)
+            print(f"   🔁 Podsieć sieci {row['name']} zajęta - nowa: {subnet}")
+
+
+def _record_existing(site_name, node, network, tenant=None, capacity=1):
+    """Zapisuje istniejącą sieć Dockera w bazie i przypisuje do niej stronę."""
+    subnets = _network_subnets(network)
+    with database.transaction():
+        network_id = database.add_network(
+            node, network.name, str(subnets[0]) if subnets else None, tenant, capacity
+        )
+        database.assign_site_network(site_name, network_id)
+    return network
+
+
+def _adopt(site_name, node, network_name):
+    """Przypisuje stronie istniejącą sieć Dockera; zwraca wiersz ``networks`` lub None."""
+    network = inventory.get_inventory(node).network(network_name)
+    if network is None:
+        return None
+    row = database.get_network_by_name(node, network_name)
+    if row is None:
+        _record_existing(site_name, node, network)
+    else:
+        database.assign_site_network(site_name, row['id'])
+    return database.get_site_network(site_name)
+
+
+def _legacy_network_names(site_name, node):
+    """Sieci, na których strona mogła działać przed zapisem przydziałów w bazie."""
+    names = []
+    container = inventory.get_inventory(node).container(site_name)
+    if container is not None:
+        # Np. warm<hex>_isolated z puli gotowych sieci - znana tylko z etykiety kontenera
+        label = docker_manager.label_network(container)
+        if label:
+            names.append(label)
+    names.append(f"{site_name}{inventory.NETWORK_SUFFIX}")
+    return names
+
+
+def adopt(site_name, node, network_name):
+    """Zapisuje sieć, na której już działa kontener strony, jako jej przydział (jeśli go nie ma)."""
+    with _allocate_lock:
+        if database.get_site_network(site_name) is not None:
+            return None
+        return _adopt(site_name, node, network_name)
+
+
+def assign(site_name, node=None, owner=None):
+    """Zwraca sieć Dockera strony na węźle ``node``, w razie potrzeby przydzielając ją.
+
+    Przydział jest zapisywany w bazie (tabele ``networks`` i ``network_assignments``),
+    więc restart kontenera trafia do tej samej sieci. ``owner`` - patrz ``tenant_for``.
+    """
+    node = node or docker_client.LOCAL_NODE
+    with _allocate_lock:
+        current = database.get_site_network(site_name)
+        if current is not None and current['node'] != node:
+            # Strona przeniesiona na inny węzeł - stary przydział nie ma tam znaczenia
+            release(site_name)
+            current = None
+        if current is not None:
+            return _ensure(current)
+
+        # Sieć strony z poprzedniej wersji panelu (własna lub z puli) zostaje jej siecią
+        for name in _legacy_network_names(site_name, node):
+            adopted = _adopt(site_name, node, name)
+            if adopted is not None:
+                return _ensure(adopted)
+
+        tenant = tenant_for(site_name, owner)
+        if tenant is None:
+            if node == docker_client.LOCAL_NODE:
+                network = warm_pool.claim_network()
+                if network is not None:
+                    return _record_existing(site_name, node, network)
+            subnet = allocate_subnet(node, SITE_PREFIX)
+            name = f"{site_name}{inventory.NETWORK_SUFFIX}"
+            with database.transaction():
+                network_id = database.add_network(node, name, subnet)
+                database.assign_site_network(site_name, network_id)
+            return _ensure(database.get_network(network_id))
+
+        with database.transaction():
+            row = database.find_network_with_room(node, tenant)
+            if row is None:
+                name = f"{SHARD_PREFIX_NAME}{uuid.uuid4().hex[:10]}{inventory.NETWORK_SUFFIX}"
+                subnet = allocate_subnet(node, SHARD_PREFIX)
+                network_id = database.add_network(node, name, subnet, tenant, SHARD_CAPACITY)
+            else:
+                network_id = row['id']
+            database.assign_site_network(site_name, network_id)
+        return _ensure(database.get_network(network_id))
+
+
+def release(site_name):
+    """Zwalnia przydział strony; zwraca nazwę sieci do usunięcia z Dockera albo None.
+
+    Sieć jest usuwana, gdy nie została w niej żadna strona (dedykowana zawsze).
+    """
+    network = database.release_site_network(site_name)
+    if network is None or network['used'] > 0:
+        return None
+    database.delete_network(network['id'])
+    return network['name']
+
+
+def site_network_names(node=None):
+    """Nazwy sieci stron {strona: sieć} zapisane w bazie."""
+    return database.get_site_network_names(node)
+
+
+def get_status(node=None):
+    """Sieci węzła (lub wszystkich węzłów) z obsadą - dla panelu."""
+    return {
+        'policy': NETWORK_POLICY,
+        'pool': str(NETWORK_POOL),
+        'networks': [
+            {
+                'name': row['name'],
+                'node': row['node'],
+                'subnet': row['subnet'],
+                'tenant': row['tenant'],
+                'capacity': row['capacity'],
+                'used': row['used'],
+            }
+            for row in database.get_networks(node)
+        ],
+    }
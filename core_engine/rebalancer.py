@@ -0,0 +1,262 @@
+"""Dynamiczny podział CPU/RAM węzła między strony na podstawie zużycia."""
+import os
+import threading
+import time
+
+from core_engine import docker_client
+from core_engine import docker_manager
+from core_engine import metrics
+from core_engine import sampler
+from core_engine import scheduler
+from web_panel import database
+
+# Czy rebalancer działa w tle
+REBALANCE_ENABLED = os.environ.get("REBALANCE_ENABLED", "1") == "1"
+# Czy nakładać limity na kontenery (0 - tylko zapis decyzji)
+REBALANCE_APPLY = os.environ.get("REBALANCE_APPLY", "1") == "1"
+# Co ile sekund przeliczamy podział
+REBALANCE_INTERVAL = float(os.environ.get("REBALANCE_INTERVAL", "60"))
+# Z ilu ostatnich sekund próbek liczymy zużycie
+REBALANCE_WINDOW = float(os.environ.get("REBALANCE_WINDOW", "300"))
+# Pojemność węzła: CPU w % jednego rdzenia i RAM w MB (domyślnie z systemu)
+CPU_CAPACITY = float(os.environ.get("REBALANCE_CPU_CAPACITY", "0")) or (os.cpu_count() or 1) * 100.0
+RAM_CAPACITY_MB = float(os.environ.get("REBALANCE_RAM_CAPACITY_MB", "0"))
+# Wagi planów użytkowników (plan:waga)
+PLAN_WEIGHTS = {
+    plan: float(weight)
+    for plan, _, weight in (
+        item.partition(':') for item in os.environ.get("REBALANCE_PLAN_WEIGHTS", "free:1,pro:2,business:4").split(',')
+    )
+    if weight
+}
+# Minimalne limity strony
+MIN_CPU = int(os.environ.get("REBALANCE_MIN_CPU", "10"))
+MIN_RAM_MB = int(os.environ.get("REBALANCE_MIN_RAM_MB", "64"))
+# Zapas ponad obserwowane zużycie
+HEADROOM = float(os.environ.get("REBALANCE_HEADROOM", "1.5"))
+# Histereza: limit zmieniamy, gdy nowy różni się o więcej niż ten ułamek
+HYSTERESIS = float(os.environ.get("REBALANCE_HYSTERESIS", "0.2"))
+# Ile sekund po zmianie limity strony się nie zmieniają (chyba że brakuje zasobów)
+COOLDOWN = float(os.environ.get("REBALANCE_COOLDOWN", "300"))
+# Przy jakim wykorzystaniu limitu strona dostaje więcej od razu
+PRESSURE = float(os.environ.get("REBALANCE_PRESSURE", "0.9"))
+
+
+def _host_ram_mb():
+    """80% pamięci hosta z /proc/meminfo (reszta dla systemu i panelu)."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) / 1024 * 0.8
+    except OSError:
+        pass
+    return 4096.0
+
+
+def fair_share(demands, weights, capacity):
+    """Ważony podział max-min pojemności ``capacity``.
+
+    Strony żądające mniej niż ich udział dostają tyle, ile żądają; reszta
+    dzielona jest między pozostałe proporcjonalnie do wag. Nadwyżka, gdy
+    wszyscy są zaspokojeni, trafia do wszystkich według wag jako zapas.
+    """
+    alloc = {}
+    active = set(demands)
+    remaining = capacity
+    while active:
+        total_weight = sum(weights[k] for k in active)
+        share = {k: remaining * weights[k] / total_weight for k in active}
+        satisfied = [k for k in active if demands[k] <= share[k]]
+        if not satisfied:
+            alloc.update(share)
+            remaining = 0.0
+            break
+        for k in satisfied:
+            alloc[k] = demands[k]
+            remaining -= demands[k]
+            active.discard(k)
+
+    if remaining > 0 and alloc:
+        total_weight = sum(weights[k] for k in alloc)
+        for k in alloc:
+            alloc[k] += remaining * weights[k] / total_weight
+    return alloc
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def observed_usage(sites, window=REBALANCE_WINDOW):
+    """Zużycie stron: p90 CPU i maksimum RAM z próbek z okna ``window``.
+
+    Dane pochodzą z bufora próbnika. Strony bez historii (nowe, obudzone)
+    są pomijane, dopóki próbnik jej nie zbierze; bez próbnika w procesie
+    tylko one są odczytywane jednorazowo z Dockera.
+    """
+    usage = {}
+    horizon = time.time() - window
+    for site in sites:
+        history = sampler.get_site_history(site['name'])
+        if not history:
+            continue
+        recent = [i for i, ts in enumerate(history['timestamp']) if ts >= horizon]
+        if recent:
+            usage[site['name']] = (
+                _percentile([history['cpu_percent'][i] for i in recent], 90),
+                max(history['ram_usage_mb'][i] for i in recent),
+            )
+
+    missing = [site for site in sites if site['name'] not in usage]
+    if missing and not sampler.is_running():
+        for item in metrics.get_all_sites_metrics(sites=missing):
+            usage[item['site']['name']] = (item['metrics']['cpu_percent'], item['metrics']['ram_usage_mb'])
+    return usage
+
+
+def plan_limits(sites, usage, cpu_capacity=CPU_CAPACITY, ram_capacity=None):
+    """Wylicza docelowe limity (cpu, ram_mb) stron z obserwowanego zużycia."""
+    if ram_capacity is None:
+        ram_capacity = RAM_CAPACITY_MB or _host_ram_mb()
+    names = [site['name'] for site in sites if site['name'] in usage]
+    weights = {site['name']: PLAN_WEIGHTS.get(site['plan'], 1.0) for site in sites}
+
+    cpu_demand = {n: max(MIN_CPU, usage[n][0] * HEADROOM) for n in names}
+    ram_demand = {n: max(MIN_RAM_MB, usage[n][1] * HEADROOM) for n in names}
+    cpu = fair_share(cpu_demand, weights, cpu_capacity)
+    ram = fair_share(ram_demand, weights, ram_capacity)
+
+    return {
+        # Nigdy poniżej minimum ani poniżej bieżącego zużycia RAM (OOM)
+        n: (max(MIN_CPU, int(cpu[n])), max(MIN_RAM_MB, int(ram[n]), int(usage[n][1] * 1.2) + 1))
+        for n in names
+    }
+
+
+def _changed(old, new):
+    return old is None or abs(new - old) > max(HYSTERESIS * old, 1)
+
+
+class Rebalancer(threading.Thread):
+    """Wątek, który co ``interval`` sekund przelicza i nakłada limity stron."""
+
+    def __init__(self, interval=REBALANCE_INTERVAL, apply=REBALANCE_APPLY):
+        super().__init__(name="rebalancer", daemon=True)
+        self.interval = interval
+        self.apply = apply
+        self._stop_event = threading.Event()
+        self._last_change = {}
+        self.last_plan = {}
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        # Pierwsza runda dopiero, gdy próbnik zbierze trochę historii
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.rebalance_once()
+            except Exception as e:
+                print(f"⚠️  Błąd rebalancera: {e}")
+
+    def rebalance_once(self):
+        """Jedna runda: pomiar, podział, histereza, nałożenie i zapis decyzji."""
+        # Strony współdzielone i uśpione nie zajmują zasobów własnego kontenera
+        running = [
+            s for s in database.get_all_sites_with_limits()
+            if s['hosting_mode'] != 'shared' and s['status'] != 'sleeping'
+        ]
+        # Limity przypięte ręcznie (/resize) zostają - rezerwują tylko pojemność węzła
+        sites = [s for s in running if not s['pinned']]
+        if not sites:
+            return []
+        usage = observed_usage(sites)
+        # Każdy węzeł dzieli własną pojemność między swoje strony
+        by_node = {}
+        for site in sites:
+            by_node.setdefault(site['node'], []).append(site)
+        plan = {}
+        for node, node_sites in by_node.items():
+            if node == docker_client.LOCAL_NODE:
+                cpu_capacity, ram_capacity = CPU_CAPACITY, RAM_CAPACITY_MB or _host_ram_mb()
+            else:
+                try:
+                    cpu_capacity, ram_capacity = scheduler.node_capacity(node)
+                except Exception as e:
+                    print(f"⚠️  Rebalancer pomija węzeł {node}: {e}")
+                    continue
+            pinned = [s for s in running if s['pinned'] and s['node'] == node]
+            cpu_capacity = max(0.0, cpu_capacity - sum(s['cpu_limit'] for s in pinned))
+            ram_capacity = max(0.0, ram_capacity - sum(s['ram_limit_mb'] for s in pinned))
+            plan.update(plan_limits(node_sites, usage, cpu_capacity, ram_capacity))
+        self.last_plan = plan
+
+        now = time.time()
+        decisions = []
+        limits = []
+        for site in sites:
+            name = site['name']
+            if name not in plan:
+                continue
+            cpu_new, ram_new = plan[name]
+            cpu_old = site['cpu_limit'] if site['has_limits'] else None
+            ram_old = site['ram_limit_mb'] if site['has_limits'] else None
+            cpu_usage, ram_usage = usage[name]
+
+            # Strona dobija do limitu - zmiana bez czekania na koniec cooldownu
+            pressure = (cpu_old and cpu_usage >= cpu_old * PRESSURE) or (ram_old and ram_usage >= ram_old * PRESSURE)
+            if not (_changed(cpu_old, cpu_new) or _changed(ram_old, ram_new)):
+                continue
+            if not pressure and now - self._last_change.get(name, 0.0) < COOLDOWN:
+                continue
+
+            reason = 'pressure' if pressure else 'rebalance'
+            applied = False
+            if self.apply:
+                try:
+                    docker_manager.update_limits(name, cpu_new, ram_new, node=site['node'])
+                    applied = True
+                except Exception as e:
+                    reason = f"error: {e}"
+            else:
+                reason = 'dry-run'
+
+            if applied:
+                self._last_change[name] = now
+                limits.append((
+                    site['id'], cpu_new, ram_new,
+                    site['disk_limit_mb'] if site['has_limits'] else 1024,
+                    site['bandwidth_limit_mb'] if site['has_limits'] else 10240,
+                ))
+            decisions.append((
+                now, site['id'], site['plan'], round(cpu_usage, 2), cpu_old, cpu_new,
+                round(ram_usage, 2), ram_old, ram_new, int(applied), reason
+            ))
+
+        if limits:
+            database.set_resource_limits_bulk(limits)
+        if decisions:
+            database.insert_rebalance_decisions(decisions)
+            print(f"⚖️  Rebalancer: {len(limits)} zmian limitów, {len(decisions)} decyzji")
+        return decisions
+
+
+_rebalancer = None
+_rebalancer_lock = threading.Lock()
+
+
+def start_rebalancer():
+    """Uruchamia (jednokrotnie) rebalancer w tle, jeśli jest włączony."""
+    global _rebalancer
+    with _rebalancer_lock:
+        if _rebalancer is None and REBALANCE_ENABLED:
+            _rebalancer = Rebalancer()
+            _rebalancer.start()
+            print(f"⚖️  Rebalancer uruchomiony (co {REBALANCE_INTERVAL}s, CPU: {CPU_CAPACITY:.0f}%)")
+    return _rebalancer
+
+
+def get_last_plan():
+    return _rebalancer.last_plan if _rebalancer else {}
@@ -0,0 +1,256 @@
+"""Próbnik metryk działający w tle z buforem cyklicznym próbek."""
+import os
+import threading
+import time
+from array import array
+
+from core_engine import metrics
+from web_panel import database
+
+# Co ile sekund odpytujemy Dockera o metryki
+SAMPLE_INTERVAL = float(os.environ.get("METRICS_SAMPLE_INTERVAL", "5"))
+# Ile ostatnich próbek trzymamy dla każdej strony
+HISTORY_SIZE = int(os.environ.get("METRICS_HISTORY_SIZE", "720"))
+# Czy próbnik działa w tle
+SAMPLER_ENABLED = os.environ.get("METRICS_SAMPLER", "1") == "1"
+# Czy zapisywać próbki do historii w SQLite
+PERSIST_ENABLED = os.environ.get("METRICS_PERSIST", "1") == "1"
+# Co ile sekund liczyć agregaty i czyścić stare próbki
+MAINTENANCE_INTERVAL = float(os.environ.get("METRICS_MAINTENANCE_INTERVAL", "60"))
+
+FIELDS = (
+    'cpu_percent',
+    'ram_usage_mb',
+    'ram_percent',
+    'network_rx_mb',
+    'network_tx_mb',
+    'disk_usage_mb',
+)
+
+
+class RingBuffer:
+    """Bufor cykliczny o stałym rozmiarze oparty na tablicach float."""
+
+    def __init__(self, capacity, fields=FIELDS):
+        self.capacity = capacity
+        self.fields = fields
+        self.timestamps = array('d', [0.0]) * capacity
+        self.columns = {field: array('d', [0.0]) * capacity for field in fields}
+        self.count = 0
+        self._next = 0
+
+    def append(self, timestamp, values):
+        """Zapisuje próbkę, nadpisując najstarszą po zapełnieniu bufora."""
+        i = self._next
+        self.timestamps[i] = timestamp
+        for field in self.fields:
+            self.columns[field][i] = float(values.get(field, 0.0))
+        self._next = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def latest(self):
+        """Zwraca ostatnią próbkę (O(1)) lub None."""
+        if not self.count:
+            return None
+        i = (self._next - 1) % self.capacity
+        sample = {field: self.columns[field][i] for field in self.fields}
+        sample['timestamp'] = self.timestamps[i]
+        return sample
+
+    def series(self):
+        """Zwraca próbki od najstarszej do najnowszej jako listy kolumn."""
+        start = (self._next - self.count) % self.capacity
+        order = [(start + k) % self.capacity for k in range(self.count)]
+        data = {field: [self.columns[field][i] for i in order] for field in self.fields}
+        data['timestamp'] = [self.timestamps[i] for i in order]
+        return data
+
+
+class MetricsSampler(threading.Thread):
+    """Wątek, który co ``interval`` sekund zbiera metryki wszystkich stron."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL, history_size=HISTORY_SIZE):
+        super().__init__(name="metrics-sampler", daemon=True)
+        self.interval = interval
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._buffers = {}
+        self._last_seen = {}
+        self._latest = []
+        self._latest_at = None
+        self._last_maintenance = time.monotonic()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self.sample_once()
+            except Exception as e:
+                print(f"⚠️  Błąd próbnika metryk: {e}")
+            elapsed = time.monotonic() - started
+            self._stop_event.wait(max(0.0, self.interval - elapsed))
+
+    def stop(self):
+        self._stop_event.set()
+
+    def sample_once(self):
+        """Zbiera jedną rundę metryk i zapisuje ją do buforów."""
+        results = metrics.get_all_sites_metrics()
+        now = time.time()
+
+        with self._lock:
+            for item in results:
+                name = item['site']['name']
+                buffer = self._buffers.get(name)
+                if buffer is None:
+                    buffer = self._buffers[name] = RingBuffer(self.history_size)
+                buffer.append(now, item['metrics'])
+                self._last_seen[name] = now
+
+            # Strony nie widziane przez całą długość historii zostały usunięte
+            horizon = now - self.interval * self.history_size
+            for name in [n for n, seen in self._last_seen.items() if seen < horizon]:
+                del self._buffers[name]
+                del self._last_seen[name]
+
+            self._latest = results
+            self._latest_at = now
+
+        if PERSIST_ENABLED:
+            self._persist(results, now)
+
+        return results
+
+    def _persist(self, results, now):
+        """Zapisuje rundę do SQLite i okresowo liczy agregaty / czyści historię."""
+        ts = int(now)
+        database.insert_metrics_batch([
+            (
+                item['site']['id'], ts,
+                item['metrics']['cpu_percent'],
+                item['metrics']['ram_usage_mb'],
+                item['metrics']['network_rx_mb'],
+                item['metrics']['network_tx_mb'],
+                item['metrics']['disk_usage_mb'],
+            )
+            for item in results
+        ])
+        if time.monotonic() - self._last_maintenance >= MAINTENANCE_INTERVAL:
+            self._last_maintenance = time.monotonic()
+            database.rollup_metrics()
+            database.prune_metrics()
+
+    def latest(self):
+        """Ostatnia runda metryk w formacie ``get_all_sites_metrics``."""
+        return self._latest
+
+    def latest_at(self):
+        """Znacznik czasu ostatniej rundy (None przed pierwszą)."""
+        return self._latest_at
+
+    def history(self, site_name):
+        """Historia próbek strony lub None, jeśli brak danych."""
+        with self._lock:
+            buffer = self._buffers.get(site_name)
+            return buffer.series() if buffer else None
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def start_sampler(interval=SAMPLE_INTERVAL, history_size=HISTORY_SIZE):
+    """Uruchamia (jednokrotnie) próbnik metryk w tle, jeśli jest włączony."""
+    global _sampler
+    if not SAMPLER_ENABLED:
+        return None
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = MetricsSampler(interval, history_size)
+            _sampler.start()
+            print(f"📈 Próbnik metryk uruchomiony (co {interval}s, {history_size} próbek)")
+    return _sampler
+
+
+# Ostatnia runda odczytana z bazy przez proces bez własnego próbnika: (monotonic, ts, wyniki)
+_stored = None
+_stored_lock = threading.Lock()
+
+
+def _stored_metrics(site, row):
+    """Wiersz ``metrics_raw`` w formacie ``get_container_stats``."""
+    ram_limit = site['ram_limit_mb'] if site['has_limits'] else 0
+    return {
+        'cpu_percent': row['cpu_percent'],
+        'ram_usage_mb': row['ram_usage_mb'],
+        'ram_limit_mb': ram_limit,
+        'ram_percent': round(row['ram_usage_mb'] / ram_limit * 100, 2) if ram_limit else 0.0,
+        'network_rx_mb': row['network_rx_mb'],
+        'network_tx_mb': row['network_tx_mb'],
+        'disk_usage_mb': row['disk_usage_mb'],
+        # Próbka strony z kontenerem oznacza, że kontener wtedy działał
+        'status': 'running' if metrics._has_container(site) else (
+            'shared' if site['hosting_mode'] == 'shared' else site['status']
+        ),
+    }
+
+
+def _stored_round():
+    """Ostatnia runda zapisana przez próbnik innego procesu (np. lidera przy wielu workerach).
+
+    Odczyt z bazy jest pamiętany przez ``SAMPLE_INTERVAL`` sekund.
+    """
+    global _stored
+    if not PERSIST_ENABLED:
+        return None, []
+    with _stored_lock:
+        if _stored is None or time.monotonic() - _stored[0] > SAMPLE_INTERVAL:
+            ts, rows = database.get_latest_metrics_round()
+            results = []
+            if rows:
+                sites = {site['id']: site for site in database.get_all_sites_with_limits()}
+                for row in rows:
+                    site = sites.get(row['site_id'])
+                    if site is not None:
+                        limits = site if site['has_limits'] else None
+                        results.append(metrics._build_site_metrics(site, _stored_metrics(site, row), limits))
+            _stored = (time.monotonic(), ts, results)
+        return _stored[1], _stored[2]
+
+
+def get_latest_metrics():
+    """Zwraca ostatnie metryki wszystkich stron bez odpytywania Dockera.
+
+    Proces bez próbnika czyta ostatnią rundę zapisaną w bazie.
+    """
+    return _sampler.latest() if _sampler else _stored_round()[1]
+
+
+def get_latest_timestamp():
+    """Znacznik czasu ostatniej rundy próbnika (None, gdy brak danych)."""
+    return _sampler.latest_at() if _sampler else _stored_round()[0]
+
+
+def is_running():
+    """Czy w tym procesie działa próbnik (historia stron rośnie co ``SAMPLE_INTERVAL``)."""
+    return _sampler is not None
+
+
+def get_site_history(site_name):
+    """Zwraca historię metryk strony z bufora próbnika (bez próbnika - z bazy)."""
+    if _sampler:
+        return _sampler.history(site_name)
+    site = database.get_site_with_limits(site_name) if PERSIST_ENABLED else None
+    if site is None:
+        return None
+    _, rows = database.get_metrics_history(
+        site['id'], time.time() - SAMPLE_INTERVAL * HISTORY_SIZE, tier='metrics_raw'
+    )
+    if not rows:
+        return None
+    samples = [_stored_metrics(site, row) for row in rows]
+    data = {field: [sample[field] for sample in samples] for field in FIELDS}
+    data['timestamp'] = [float(row['ts']) for row in rows]
+    return data
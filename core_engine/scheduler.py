@@ -0,0 +1,140 @@
+"""Wybór węzła Docker dla nowych kontenerów stron."""
+import os
+import threading
+import time
+
+from core_engine import docker_client
+from core_engine import sampler
+from web_panel import database
+
+# Ile sekund trzymamy rezerwację świeżo przydzielonej strony (zanim pojawi się w próbkach)
+RESERVATION_TTL = float(os.environ.get("SCHEDULER_RESERVATION_TTL", "60"))
+# Ile sekund pamiętamy pojemność węzła odczytaną z ``docker info``
+NODE_INFO_TTL = float(os.environ.get("SCHEDULER_NODE_INFO_TTL", "300"))
+# Jaka część pamięci węzła jest dla stron (reszta dla systemu i Dockera)
+RAM_FRACTION = float(os.environ.get("SCHEDULER_RAM_FRACTION", "0.8"))
+
+_lock = threading.Lock()
+_capacity = {}
+_reservations = []
+
+
+def node_capacity(node):
+    """Pojemność węzła: (CPU w % jednego rdzenia, RAM w MB).
+
+    Wartości z rejestru węzłów mają pierwszeństwo; brakujące są odczytywane
+    z ``docker info`` i pamiętane przez ``NODE_INFO_TTL`` sekund.
+    """
+    row = database.get_node(node)
+    if row is not None and row['cpu_capacity'] and row['ram_capacity_mb']:
+        return float(row['cpu_capacity']), float(row['ram_capacity_mb'])
+
+    cached = _capacity.get(node)
+    if cached is None or time.monotonic() - cached[0] > NODE_INFO_TTL:
+        info = docker_client.get_client(node=node).info()
+        cached = _capacity[node] = (
+            time.monotonic(), info['NCPU'] * 100.0, info['MemTotal'] / 1024 / 1024 * RAM_FRACTION
+        )
+    cpu, ram = cached[1], cached[2]
+    if row is not None:
+        cpu = float(row['cpu_capacity'] or cpu)
+        ram = float(row['ram_capacity_mb'] or ram)
+    return cpu, ram
+
+
+def node_usage():
+    """Zajętość węzłów {węzeł: [cpu, ram_mb]} z ostatniej rundy próbnika.
+
+    Strony bez próbki (nowe, jeszcze nie zmierzone) liczone są według limitów,
+    uśpione i współdzielone nie zajmują nic. Rezerwacje dotyczą stron, których
+    jeszcze nie ma w bazie.
+    """
+    usage = {}
+    sampled = set()
+    for item in sampler.get_latest_metrics():
+        node = item['site']['node']
+        used = usage.setdefault(node, [0.0, 0.0])
+        used[0] += item['metrics']['cpu_percent']
+        used[1] += item['metrics']['ram_usage_mb']
+        sampled.add(item['site']['name'])
+
+    for site in database.get_all_sites_with_limits():
+        if site['name'] in sampled:
+            continue
+        sampled.add(site['name'])
+        if site['hosting_mode'] == 'shared' or site['status'] == 'sleeping':
+            continue
+        used = usage.setdefault(site['node'], [0.0, 0.0])
+        used[0] += site['cpu_limit'] if site['has_limits'] else 50
+        used[1] += site['ram_limit_mb'] if site['has_limits'] else 512
+
+    now = time.monotonic()
+    with _lock:
+        _reservations[:] = [r for r in _reservations if r[0] > now]
+        for _, site_name, node, cpu, ram in _reservations:
+            if site_name in sampled:
+                continue
+            used = usage.setdefault(node, [0.0, 0.0])
+            used[0] += cpu
+            used[1] += ram
+    return usage
+
+
+def get_status():
+    """Stan węzłów do podglądu w panelu: pojemność, zajętość i wolne zasoby."""
+    usage = node_usage()
+    status = []
+    for row in database.get_nodes():
+        item = {'name': row['name'], 'docker_url': row['docker_url'], 'status': row['status']}
+        try:
+            cpu, ram = node_capacity(row['name'])
+        except Exception as e:
+            item['error'] = str(e)
+            status.append(item)
+            continue
+        used_cpu, used_ram = usage.get(row['name'], (0.0, 0.0))
+        item.update({
+            'cpu_capacity': round(cpu), 'ram_capacity_mb': round(ram),
+            'cpu_used': round(used_cpu, 1), 'ram_used_mb': round(used_ram, 1),
+            'cpu_free': round(cpu - used_cpu, 1), 'ram_free_mb': round(ram - used_ram, 1),
+        })
+        status.append(item)
+    return status
+
+
+def choose_node(site_name, cpu_limit=50, ram_limit_mb=512):
+    """Wybiera węzeł dla nowej strony i rezerwuje na nim jej limity.
+
+    Strona musi zmieścić się w wolnym RAM węzła; spośród pasujących wybierany
+    jest ten, któremu po przydziale zostanie najwięcej wolnego CPU i RAM
+    (w proporcji do pojemności). Gdy żaden się nie mieści, wybierany jest
+    najmniej zajęty węzeł z ostrzeżeniem.
+    """
+    nodes = [row['name'] for row in database.get_nodes('active')]
+    if not nodes:
+        return docker_client.LOCAL_NODE
+    if len(nodes) == 1:
+        return nodes[0]
+
+    usage = node_usage()
+    candidates = []
+    for node in nodes:
+        try:
+            cpu, ram = node_capacity(node)
+        except Exception as e:
+            print(f"⚠️  Pomijam węzeł {node}: {e}")
+            continue
+        used_cpu, used_ram = usage.get(node, (0.0, 0.0))
+        free_cpu = (cpu - used_cpu - cpu_limit) / cpu
+        free_ram = (ram - used_ram - ram_limit_mb) / ram
+        candidates.append((free_ram >= 0, min(free_cpu, free_ram), node))
+    if not candidates:
+        raise RuntimeError("Żaden węzeł Dockera nie jest dostępny")
+
+    fits, _, node = max(candidates)
+    if not fits:
+        print(f"⚠️  Żaden węzeł nie ma {ram_limit_mb}MB wolnego RAM - wybieram najmniej zajęty {node}")
+    with _lock:
+        _reservations.append((time.monotonic() + RESERVATION_TTL, site_name, node, cpu_limit, ram_limit_mb))
+    print(f"🗺️  {site_name} trafi na węzeł {node}")
+    return node
@@ -0,0 +1,170 @@
+"""Tryb współdzielony: pula kontenerów nginx obsługująca wiele stron statycznych."""
+import os
+import threading
+
+import docker
+
+from core_engine import docker_client
+from core_engine import docker_manager
+from core_engine import idle
+from core_engine import inventory
+from core_engine import scheduler
+from core_engine import static_build
+from web_panel import database
+
+# Ile kontenerów nginx obsługuje strony współdzielone
+SHARED_WORKERS = int(os.environ.get("SHARED_NGINX_WORKERS", "2"))
+# Limity jednego kontenera puli
+SHARED_CPU_LIMIT = int(os.environ.get("SHARED_NGINX_CPU", "100"))
+SHARED_RAM_MB = int(os.environ.get("SHARED_NGINX_RAM_MB", "256"))
+
+POOL_NAME = "shared_nginx"
+POOL_LABEL = "hosting.shared"
+CONF_DIRNAME = "shared"
+CONF_NAME = "sites.conf"
+SITES_ROOT = "/srv/sites"
+
+MODE_ISOLATED = 'isolated'
+MODE_SHARED = 'shared'
+
+_lock = threading.Lock()
+_user_data_dir = None
+
+
+def worker_names():
+    return [f"{POOL_NAME}_{i}" for i in range(SHARED_WORKERS)]
+
+
+def conf_dir(user_data_dir):
+    return os.path.join(user_data_dir, static_build.CONFIG_DIRNAME, CONF_DIRNAME)
+
+
+def render_config(sites):
+    """Bloki ``server`` dla stron współdzielonych (po jednym na domenę)."""
+    blocks = [static_build.CONFIG_HEADER]
+    # Nieznana domena - 404 zamiast pierwszej strony z listy
+    blocks.append("server {\n    listen 80 default_server;\n    server_name _;\n    return 404;\n}\n")
+    for site in sorted(sites, key=lambda s: s['name']):
+        blocks.append(static_build.nginx_server_block(
+            server_name=site['domain'], root=f"{SITES_ROOT}/{site['name']}"
+        ))
+    return "\n".join(blocks)
+
+
+def _start_worker(client, name, network):
+    """Uruchamia jeden kontener puli z całym user_data i katalogiem konfiguracji."""
+    return client.containers.run(
+        docker_manager.SITE_IMAGE,
+        detach=True,
+        name=name,
+        network=network.name,
+        restart_policy={"Name": "always"},
+        cpu_quota=int(SHARED_CPU_LIMIT * 1000),
+        cpu_period=100000,
+        mem_limit=f"{SHARED_RAM_MB}m",
+        memswap_limit=f"{SHARED_RAM_MB}m",
+        security_opt=["no-new-privileges:true"],
+        tmpfs={
+            '/var/cache/nginx': 'size=10M,mode=1777',
+            '/var/run': 'size=1M,mode=1777'
+        },
+        volumes={
+            docker_manager.host_path("user_data"): {"bind": SITES_ROOT, "mode": "ro"},
+            # Katalog, nie plik - podmiana sites.conf jest widoczna bez restartu
+            docker_manager.host_path("user_data", static_build.CONFIG_DIRNAME, CONF_DIRNAME): {
+                "bind": "/etc/nginx/conf.d", "mode": "ro"
+            },
+        },
+        labels={
+            "traefik.enable": "true",
+            # Najniższy priorytet: łapie domeny stron, które nie mają własnego kontenera
+            f"traefik.http.routers.{POOL_NAME}.rule": "HostRegexp(`^[a-z0-9]+\\.localhost$`)",
+            f"traefik.http.routers.{POOL_NAME}.priority": "1",
+            f"traefik.http.routers.{POOL_NAME}.entrypoints": "web",
+            f"traefik.http.services.{POOL_NAME}.loadbalancer.server.port": "80",
+            POOL_LABEL: "true",
+        },
+    )
+
+
+def ensure_pool():
+    """Tworzy lub uruchamia brakujące kontenery puli."""
+    client = docker_client.get_client()
+    network = docker_manager.create_isolated_network(POOL_NAME)
+    for name in worker_names():
+        try:
+            container = client.containers.get(name)
+            if container.status != 'running':
+                container.start()
+        except docker.errors.NotFound:
+            _start_worker(client, name, network)
+            print(f"🧩 Uruchomiono współdzielony nginx {name}")
+
+
+def reload():
+    """Przeładowuje konfigurację puli (SIGHUP - bez przerywania połączeń)."""
+    client = docker_client.get_client()
+    for name in worker_names():
+        try:
+            client.containers.get(name).kill(signal="SIGHUP")
+        except docker.errors.APIError as e:
+            print(f"⚠️  Nie udało się przeładować {name}: {e}")
+
+
+def sync():
+    """Generuje konfigurację ze stron w trybie współdzielonym i przeładowuje pulę."""
+    if _user_data_dir is None:
+        return False
+    with _lock:
+        sites = database.get_sites_by_mode(MODE_SHARED)
+        path = os.path.join(conf_dir(_user_data_dir), CONF_NAME)
+        if not static_build.write_if_changed(path, render_config(sites)):
+            return False
+        if sites:
+            ensure_pool()
+            reload()
+    print(f"🧩 Konfiguracja współdzielonego nginx: {len(sites)} stron")
+    return True
+
+
+def start_pool(user_data_dir):
+    """Zapisuje konfigurację i uruchamia pulę, jeśli są strony współdzielone."""
+    global _user_data_dir
+    _user_data_dir = user_data_dir
+    sync()
+    if database.get_sites_by_mode(MODE_SHARED):
+        ensure_pool()
+
+
+def move_to_shared(site_name):
+    """Przenosi stronę statyczną z własnego kontenera do puli współdzielonej."""
+    site = database.get_site(site_name)
+    if site is None or site['site_type'] != 'static':
+        raise ValueError("Tryb współdzielony jest dostępny tylko dla stron statycznych")
+    database.set_hosting_mode(site_name, MODE_SHARED)
+    # Najpierw pula zaczyna obsługiwać domenę, dopiero potem znika kontener
+    sync()
+    # Uśpionej strony nie trzeba już budzić - router budzenia przesłaniałby pulę
+    if idle.is_sleeping(site):
+        database.set_site_status(site_name, idle.STATUS_ACTIVE)
+    idle.write_wake_routes()
+    docker_manager.stop_container(site_name, node=site['node'])
+    database.set_container_id(site_name, '')
+
+
+def move_to_isolated(site_name, cpu_limit=50, ram_limit_mb=512):
+    """Przenosi stronę z puli do własnego, izolowanego kontenera."""
+    # Router kontenera (Host) ma pierwszeństwo przed routerem puli
+    node = database.get_site(site_name)['node']
+    container = inventory.get_inventory(node).container(site_name)
+    if container is None:
+        # Węzeł zapisujemy przed startem - ponowienie znajdzie kontener
+        node = scheduler.choose_node(site_name, cpu_limit=cpu_limit, ram_limit_mb=ram_limit_mb)
+        database.set_site_node(site_name, node)
+        container = docker_manager.start_container(site_name, cpu_limit=cpu_limit, ram_limit_mb=ram_limit_mb, node=node)
+    if not container:
+        raise RuntimeError("Błąd Docker")
+    database.set_container_id(site_name, container.short_id)
+    database.set_hosting_mode(site_name, MODE_ISOLATED)
+    sync()
+    return container
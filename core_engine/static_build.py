@@ -0,0 +1,319 @@
+"""Etap budowania plików strony po wdrożeniu: kompresja z góry i konfiguracja nginx."""
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+from urllib.parse import unquote, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import brotli
+except ImportError:  # brotli jest opcjonalne - bez niego tylko .gz
+    brotli = None
+
+# Czy budować pliki strony po wdrożeniu
+BUILD_ENABLED = os.environ.get("STATIC_BUILD", "1") == "1"
+# Ile plików kompresujemy równolegle
+BUILD_WORKERS = int(os.environ.get("STATIC_BUILD_WORKERS", "4"))
+# Mniejszych plików nie opłaca się kompresować
+MIN_SIZE = int(os.environ.get("STATIC_BUILD_MIN_SIZE", "1024"))
+# Większych plików nie kompresujemy (czas budowania)
+MAX_SIZE = int(os.environ.get("STATIC_BUILD_MAX_SIZE", str(50 * 1024 * 1024)))
+# Czy obraz nginx ma moduł ngx_brotli (stockowy nginx:latest go nie ma) - tylko wtedy budujemy .br
+NGINX_BROTLI = os.environ.get("NGINX_BROTLI", "0") == "1"
+# Czy nadawać zasobom nazwy z hashem treści (app.css -> app.<hash>.css) i podmieniać je w HTML
+HASH_NAMES = os.environ.get("STATIC_BUILD_HASH_NAMES", "1") == "1"
+
+MANIFEST_NAME = ".build-manifest.json"
+CONFIG_DIRNAME = ".config"
+NGINX_CONF_NAME = "nginx-site.conf"
+
+COMPRESSIBLE = {
+    '.html', '.htm', '.css', '.js', '.mjs', '.json', '.map', '.svg', '.xml',
+    '.txt', '.csv', '.md', '.ico', '.wasm', '.ttf', '.otf', '.eot', '.webmanifest',
+}
+# Zasoby dostające nazwę z hashem - te same rozszerzenia co lokalizacja "immutable" w NGINX_SERVER
+HASHABLE = {
+    '.css', '.js', '.mjs', '.map', '.json', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.webp',
+    '.avif', '.ico', '.woff', '.woff2', '.ttf', '.otf', '.eot', '.wasm',
+}
+PAGES = {'.html', '.htm'}
+# Nasze pliki wynikowe - pomijane przy przeglądaniu strony
+_OUTPUTS = ('.gz', '.br')
+# Nazwa już zawierająca hash treści (np. z bundlera) - zostawiamy ją bez zmian
+_HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.[^./]+$", re.IGNORECASE)
+# Odnośniki src/href w HTML
+_PAGE_REF = re.compile(r"""(\b(?:src|href)\s*=\s*)(["'])([^"'<>]+)\2""", re.IGNORECASE)
+
+CHUNK_SIZE = 1024 * 1024
+
+NGINX_SERVER = """\
+server {
+    listen 80%(default)s;
+    server_name %(server_name)s;
+    root %(root)s;
+    index index.html index.htm;
+
+    sendfile on;
+    tcp_nopush on;
+
+    # Pliki .gz przygotowane przy wdrożeniu - nginx nie kompresuje w locie
+    gzip off;
+    gzip_static on;
+    gzip_vary on;
+%(brotli)s
+    open_file_cache max=2000 inactive=60s;
+    open_file_cache_valid 60s;
+    open_file_cache_min_uses 2;
+    open_file_cache_errors on;
+
+    location ~ /\\.(?!well-known) {
+        deny all;
+    }
+
+    # Nazwy z hashem treści (np. app.3f9c2a1b.js) nigdy się nie zmieniają
+    location ~* "\\.[0-9a-f]{8,}\\.(?:css|js|mjs|map|json|svg|png|jpe?g|gif|webp|avif|ico|woff2?|ttf|otf|eot|wasm)$" {
+        add_header Cache-Control "public, max-age=31536000, immutable";
+        add_header Vary Accept-Encoding;
+    }
+
+    location ~* "\\.(?:css|js|mjs|map|json|svg|png|jpe?g|gif|webp|avif|ico|woff2?|ttf|otf|eot|wasm)$" {
+        add_header Cache-Control "public, max-age=3600";
+        add_header Vary Accept-Encoding;
+    }
+
+    # HTML zawsze rewalidowany (ETag), żeby nowe wdrożenie było od razu widoczne
+    location / {
+        add_header Cache-Control "no-cache";
+        try_files $uri $uri/ =404;
+    }
+}
+"""
+
+CONFIG_HEADER = "# Wygenerowane przez panel - nie edytować ręcznie\n"
+
+
+def nginx_server_block(server_name='_', root='/usr/share/nginx/html', default=False):
+    """Blok ``server`` serwujący statyczne pliki z ``root``."""
+    return NGINX_SERVER % {
+        'default': ' default_server' if default else '',
+        'server_name': server_name,
+        'root': root,
+        'brotli': "    brotli_static on;\n" if NGINX_BROTLI else "",
+    }
+
+
+def nginx_config():
+    """Treść konfiguracji nginx dla kontenerów stron."""
+    return CONFIG_HEADER + nginx_server_block()
+
+
+def config_path(user_data_dir):
+    return os.path.join(user_data_dir, CONFIG_DIRNAME, NGINX_CONF_NAME)
+
+
+def write_if_changed(path, content):
+    """Atomowo zapisuje plik konfiguracji; zwraca False, gdy treść się nie zmieniła."""
+    try:
+        with open(path) as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Osobny plik tymczasowy na proces - kilka workerów panelu może zapisywać naraz
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(content)
+    os.replace(tmp, path)
+    return True
+
+
+def write_nginx_config(user_data_dir):
+    """Zapisuje konfigurację nginx (tylko gdy się zmieniła) i zwraca jej ścieżkę."""
+    path = config_path(user_data_dir)
+    if write_if_changed(path, nginx_config()):
+        print(f"📝 Zapisano konfigurację nginx: {path}")
+    return path
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _load_manifest(site_dir):
+    try:
+        with open(os.path.join(site_dir, MANIFEST_NAME)) as f:
+            return json.load(f).get('files', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _site_files(site_dir):
+    """Ścieżki względne plików strony (bez plików wynikowych i ukrytych)."""
+    for dirpath, dirnames, filenames in os.walk(site_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for filename in filenames:
+            if filename.startswith('.') or filename.endswith(_OUTPUTS):
+                continue
+            path = os.path.join(dirpath, filename)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            yield os.path.relpath(path, site_dir)
+
+
+def _reuse(previous_dir, rel, suffix, target):
+    """Podpina plik wynikowy z poprzedniego wdrożenia (twardy link lub kopia)."""
+    source = os.path.join(previous_dir, rel + suffix)
+    if not os.path.isfile(source):
+        return False
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+    return True
+
+
+def _write_output(target, data, original_size):
+    """Zapisuje wersję skompresowaną, jeśli jest mniejsza od oryginału."""
+    if len(data) >= original_size:
+        return False
+    with open(target, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def _build_file(site_dir, rel, previous_dir, previous):
+    path = os.path.join(site_dir, rel)
+    size = os.path.getsize(path)
+    entry = {'hash': _file_hash(path), 'size': size, 'gz': False, 'br': False}
+
+    ext = os.path.splitext(rel)[1].lower()
+    if ext not in COMPRESSIBLE or not MIN_SIZE <= size <= MAX_SIZE:
+        return rel, entry
+
+    # Niezmieniony plik - bierzemy wyniki z poprzedniego wdrożenia
+    old = previous.get(rel)
+    unchanged = previous_dir and old and old['hash'] == entry['hash']
+
+    data = None
+    for suffix, key, enabled in (('.gz', 'gz', True), ('.br', 'br', brotli is not None and NGINX_BROTLI)):
+        if not enabled:
+            continue
+        target = path + suffix
+        if unchanged and old.get(key) and _reuse(previous_dir, rel, suffix, target):
+            entry[key] = True
+            continue
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        if key == 'gz':
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        else:
+            compressed = brotli.compress(data, quality=11)
+        entry[key] = _write_output(target, compressed, size)
+    return rel, entry
+
+
+def hashed_name(name, digest):
+    """``app.css`` -> ``app.<digest>.css`` (także dla ścieżek i adresów URL)."""
+    stem, ext = posixpath.splitext(name)
+    return f"{stem}.{digest}{ext}"
+
+
+def _link_hashed(site_dir, manifest):
+    """Podpina zasobom kopie z hashem w nazwie (twarde linki, także .gz/.br); zwraca {rel: hash}."""
+    hashed = {}
+    for rel, entry in manifest.items():
+        if os.path.splitext(rel)[1].lower() not in HASHABLE or _HASHED_NAME.search(rel):
+            continue
+        path = os.path.join(site_dir, rel)
+        target = hashed_name(path, entry['hash'])
+        try:
+            os.link(path, target)
+        except FileExistsError:
+            # Strona ma już plik o tej nazwie - nie nadpisujemy go
+            continue
+        except OSError:
+            shutil.copyfile(path, target)
+        for suffix in (suffix for suffix, key in (('.gz', 'gz'), ('.br', 'br')) if entry[key]):
+            try:
+                os.link(path + suffix, target + suffix)
+            except OSError:
+                shutil.copyfile(path + suffix, target + suffix)
+        entry['hashed'] = hashed_name(rel, entry['hash'])
+        hashed[rel] = entry['hash']
+    return hashed
+
+
+def rewrite_page_refs(html, rel, hashed):
+    """Podmienia w HTML odnośniki src/href do zasobów strony na ich nazwy z hashem."""
+    base = posixpath.dirname(rel)
+
+    def replace(match):
+        url = match.group(3)
+        parts = urlsplit(url)
+        if parts.scheme or parts.netloc or not parts.path:
+            return match.group(0)
+        path = unquote(parts.path)
+        target = posixpath.normpath(path.lstrip('/') if path.startswith('/') else posixpath.join(base, path))
+        digest = hashed.get(target)
+        if digest is None:
+            return match.group(0)
+        return match.group(1) + match.group(2) + url.replace(parts.path, hashed_name(parts.path, digest), 1) + match.group(2)
+
+    return _PAGE_REF.sub(replace, html)
+
+
+def _rewrite_page(site_dir, rel, hashed):
+    path = os.path.join(site_dir, rel)
+    try:
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+    except (OSError, UnicodeDecodeError):
+        return
+    rewritten = rewrite_page_refs(html, rel, hashed)
+    if rewritten != html:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(rewritten)
+
+
+def build_site(site_dir, previous_dir=None, workers=None):
+    """Przygotowuje pliki .gz/.br, nazwy z hashem i manifest z hashami treści w ``site_dir``.
+
+    ``previous_dir`` to aktualnie serwowana wersja strony - pliki o tym samym
+    hashu nie są kompresowane ponownie. Strony HTML są budowane na końcu, po
+    podmianie odnośników do zasobów na nazwy z hashem (cache "immutable").
+    Zwraca podsumowanie budowania.
+    """
+    previous = _load_manifest(previous_dir) if previous_dir else {}
+    files = list(_site_files(site_dir))
+    pages = [rel for rel in files if os.path.splitext(rel)[1].lower() in PAGES]
+    assets = [rel for rel in files if os.path.splitext(rel)[1].lower() not in PAGES]
+
+    def build(rel):
+        return _build_file(site_dir, rel, previous_dir, previous)
+
+    with ThreadPoolExecutor(max_workers=workers or BUILD_WORKERS, thread_name_prefix="static-build") as pool:
+        manifest = dict(pool.map(build, assets))
+        hashed = _link_hashed(site_dir, manifest) if HASH_NAMES else {}
+        if hashed:
+            list(pool.map(lambda rel: _rewrite_page(site_dir, rel, hashed), pages))
+        manifest.update(pool.map(build, pages))
+
+    with open(os.path.join(site_dir, MANIFEST_NAME), 'w') as f:
+        json.dump({'version': 2, 'files': manifest}, f, separators=(',', ':'), sort_keys=True)
+
+    return {
+        'files': len(manifest),
+        'gz': sum(1 for e in manifest.values() if e['gz']),
+        'br': sum(1 for e in manifest.values() if e['br']),
+        'hashed': len(hashed),
+    }
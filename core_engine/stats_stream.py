@@ -0,0 +1,122 @@
+"""Stałe subskrypcje strumieni ``stats`` Dockera dla kontenerów stron."""
+import os
+import threading
+import time
+
+import docker
+
+from core_engine import docker_client
+from core_engine import metrics
+
+# Czy utrzymywać strumienie stats zamiast jednorazowych zapytań
+STREAMING_ENABLED = os.environ.get("METRICS_STREAMING", "1") == "1"
+# Co ile sekund sprawdzamy listę działających kontenerów (nowe / zrestartowane)
+RESYNC_INTERVAL = float(os.environ.get("METRICS_STREAM_RESYNC", "10"))
+# Po ilu sekundach bez nowej ramki uznajemy odczyt za nieaktualny
+STALE_AFTER = float(os.environ.get("METRICS_STREAM_STALE_AFTER", "10"))
+# Każdy strumień zajmuje jedno połączenie HTTP z puli klienta
+STREAM_POOL_SIZE = int(os.environ.get("METRICS_STREAM_POOL_SIZE", "256"))
+
+SITE_LABEL = "isolation.level=full"
+
+
+class StatsSubscriptionManager:
+    """Utrzymuje jeden strumień ``stats`` na każdy działający kontener strony."""
+
+    def __init__(self, client=None, resync_interval=RESYNC_INTERVAL):
+        self.client = client or docker_client.get_client(pool_size=STREAM_POOL_SIZE)
+        self.resync_interval = resync_interval
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._subscribers = {}
+        self._latest = {}
+        self._supervisor = None
+
+    def start(self):
+        self._supervisor = threading.Thread(
+            target=self._supervise, name="stats-supervisor", daemon=True
+        )
+        self._supervisor.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def get(self, container_name):
+        """Ostatnie metryki kontenera z pamięci lub None, gdy brak/nieaktualne."""
+        entry = self._latest.get(container_name)
+        if entry is None:
+            return None
+        received_at, result = entry
+        if time.monotonic() - received_at > STALE_AFTER:
+            return None
+        return result
+
+    def _supervise(self):
+        while not self._stop_event.is_set():
+            try:
+                self.resync()
+            except Exception as e:
+                print(f"⚠️  Błąd synchronizacji strumieni stats: {e}")
+            self._stop_event.wait(self.resync_interval)
+
+    def resync(self):
+        """Podłącza strumienie do nowych lub zrestartowanych kontenerów."""
+        running = self.client.containers.list(
+            filters={'label': SITE_LABEL, 'status': 'running'}, sparse=True
+        )
+        with self._lock:
+            for container in running:
+                name = container.attrs['Names'][0].lstrip('/')
+                thread = self._subscribers.get(name)
+                if thread is not None and thread.is_alive():
+                    continue
+                thread = threading.Thread(
+                    target=self._consume, args=(container.id, name),
+                    name=f"stats-{name}", daemon=True
+                )
+                self._subscribers[name] = thread
+                thread.start()
+
+    def _consume(self, container_id, name):
+        """Czyta ramki ze strumienia aż do zatrzymania kontenera."""
+        previous = None
+        try:
+            frames = self.client.api.stats(container_id, stream=True, decode=True)
+            for frame in frames:
+                if self._stop_event.is_set():
+                    break
+                # Pierwsza ramka nie ma jeszcze poprzedniego pomiaru CPU
+                if previous is not None or frame.get('precpu_stats', {}).get('system_cpu_usage'):
+                    result = metrics.parse_stats(frame, previous)
+                    result['status'] = 'running'
+                    self._latest[name] = (time.monotonic(), result)
+                previous = frame
+        except docker.errors.NotFound:
+            pass
+        except Exception as e:
+            print(f"⚠️  Strumień stats dla {name} przerwany: {e}")
+        finally:
+            # Po restarcie kontenera supervisor założy nowy strumień
+            self._latest.pop(name, None)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def start_manager():
+    """Uruchamia (jednokrotnie) menedżera strumieni stats."""
+    global _manager
+    if not STREAMING_ENABLED:
+        return None
+    with _manager_lock:
+        if _manager is None:
+            _manager = StatsSubscriptionManager()
+            _manager.start()
+            print("📡 Subskrypcja strumieni stats uruchomiona")
+    return _manager
+
+
+def get_latest(container_name):
+    """Zwraca metryki ze strumienia lub None, gdy strumień nie działa."""
+    return _manager.get(container_name) if _manager else None
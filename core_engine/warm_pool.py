@@ -0,0 +1,149 @@
+"""Pula gotowych sieci i pobranych obrazów - szybkie zakładanie stron."""
+import collections
+import os
+import threading
+import uuid
+
+import docker
+
+from core_engine import docker_client
+from core_engine import docker_manager
+from core_engine import inventory
+from core_engine import networks
+from web_panel import database
+
+# Ile gotowych sieci (już podłączonych do Traefik) trzymamy w zapasie
+WARM_POOL_SIZE = int(os.environ.get("WARM_POOL_SIZE", "4"))
+# Typy stron, których obrazy pobieramy z góry
+WARM_POOL_TYPES = [t for t in os.environ.get("WARM_POOL_TYPES", "static").split(",") if t]
+# Co ile sekund sprawdzamy stan puli (uzupełnianie po pobraniu sieci jest natychmiastowe)
+REFILL_INTERVAL = float(os.environ.get("WARM_POOL_REFILL_INTERVAL", "30"))
+
+POOL_LABEL = "hosting.pool"
+POOL_PREFIX = "warm"
+
+
+def site_type_images(types=None):
+    """Obrazy do pobrania z góry dla typów stron z tabeli site_types."""
+    images = set()
+    for name in types if types is not None else WARM_POOL_TYPES:
+        if name == 'static':
+            # Strony statyczne startują z obrazu docker_manager, nie z site_types
+            images.add(docker_manager.SITE_IMAGE)
+            continue
+        site_type = database.get_site_type(name)
+        if site_type is not None:
+            images.add(site_type['docker_image'])
+    return sorted(images)
+
+
+class WarmPool(threading.Thread):
+    """Wątek utrzymujący zapas sieci stron i lokalne kopie obrazów.
+
+    Zakładanie strony pobiera gotową sieć przez ``claim()`` zamiast tworzyć
+    ją i podłączać Traefik w trakcie żądania; pula uzupełnia się w tle.
+    """
+
+    def __init__(self, size=WARM_POOL_SIZE):
+        super().__init__(name="warm-pool", daemon=True)
+        self.size = size
+        self._lock = threading.Lock()
+        self._ready = collections.deque()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def available(self):
+        return len(self._ready)
+
+    def claim(self):
+        """Zwraca gotową sieć z puli lub None, gdy pula jest pusta."""
+        with self._lock:
+            network = self._ready.popleft() if self._ready else None
+        self._wake.set()
+        return network
+
+    def adopt(self):
+        """Przejmuje wolne sieci puli z poprzedniego uruchomienia panelu."""
+        inv = inventory.get_inventory()
+        inv.refresh()
+        used = {
+            docker_manager.label_network(container)
+            for container in inv.containers().values()
+        }
+        # Sieć zapisana w bazie należy już do strony, nawet gdy jej kontener nie wystartował
+        # (np. zadanie zakładania czeka na ponowienie)
+        used.update(row['name'] for row in database.get_networks(docker_client.LOCAL_NODE))
+        client = docker_client.get_client()
+        free = [
+            client.networks.prepare_model(raw)
+            for raw in client.api.networks(filters={'label': POOL_LABEL})
+            if raw['Name'] not in used
+        ]
+        with self._lock:
+            known = {network.name for network in self._ready}
+            self._ready.extend(n for n in free if n.name not in known)
+        if free:
+            print(f"♨️  Pula: przejęto {len(free)} wolnych sieci")
+
+    def prepull(self, images=None):
+        """Pobiera brakujące obrazy, żeby start kontenera nie czekał na pull."""
+        client = docker_client.get_client()
+        for image in images if images is not None else site_type_images():
+            try:
+                client.images.get(image)
+            except docker.errors.ImageNotFound:
+                print(f"♨️  Pula: pobieram obraz {image}...")
+                client.images.pull(image)
+
+    def fill(self):
+        """Tworzy sieci, aż pula osiągnie ``size``."""
+        while self.available() < self.size and not self._stop_event.is_set():
+            name = f"{POOL_PREFIX}{uuid.uuid4().hex[:10]}"
+            network = networks.create_dedicated(name, labels={POOL_LABEL: "true"})
+            with self._lock:
+                self._ready.append(network)
+
+    def run(self):
+        try:
+            self.prepull()
+            self.adopt()
+        except Exception as e:
+            print(f"⚠️  Pula: błąd przygotowania: {e}")
+        while not self._stop_event.is_set():
+            try:
+                self.fill()
+            except Exception as e:
+                print(f"⚠️  Pula: błąd uzupełniania: {e}")
+            self._wake.wait(REFILL_INTERVAL)
+            self._wake.clear()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def start_pool(size=None):
+    """Uruchamia (jednokrotnie) utrzymywanie puli."""
+    global _pool
+    if networks.NETWORK_POLICY == 'shared':
+        # Wszystkie strony trafiają do sieci współdzielonych - gotowe sieci dedykowane są zbędne
+        return None
+    with _pool_lock:
+        if _pool is None and (size or WARM_POOL_SIZE) > 0:
+            _pool = WarmPool(size or WARM_POOL_SIZE)
+            _pool.start()
+            print(f"♨️  Pula gotowych sieci: {_pool.size}")
+    return _pool
+
+
+def claim_network():
+    """Gotowa sieć z puli albo None (pula wyłączona lub pusta)."""
+    return _pool.claim() if _pool else None
+
+
+def get_status():
+    return {'size': _pool.size, 'available': _pool.available()} if _pool else None
@@ -0,0 +1,27 @@
+"""Konfiguracja gunicorn dla trybu produkcyjnego panelu."""
+import os
+import shutil
+import tempfile
+
+wsgi_app = "wsgi:app"
+bind = f"0.0.0.0:{os.environ.get('PANEL_PORT', '5000')}"
+# Workery są bezstanowe - zadania sterujące wykonuje tylko lider (web_panel/leader.py)
+workers = int(os.environ.get("WEB_WORKERS", "4"))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "8"))
+# Przesyłanie archiwów i budzenie stron trwają dłużej niż zwykłe żądanie
+timeout = int(os.environ.get("WEB_TIMEOUT", "120"))
+graceful_timeout = 30
+# Bez preload: wątki sterujące muszą powstać w workerze, nie w procesie nadrzędnym
+preload_app = False
+# Recykling workerów co N żądań zabijałby lidera
+max_requests = 0
+accesslog = "-"
+
+# Histogramy wszystkich workerów sumowane przez /metrics/prometheus (core_engine/instrumentation.py)
+os.environ.setdefault("INSTRUMENTATION_DIR", os.path.join(tempfile.gettempdir(), "hosting-metrics"))
+
+
+def on_starting(server):
+    """Nowy start panelu - liczniki od zera (pliki poprzednich procesów są nieaktualne)."""
+    shutil.rmtree(os.environ["INSTRUMENTATION_DIR"], ignore_errors=True)
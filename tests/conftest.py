@@ -0,0 +1,13 @@
+import pytest
+
+from web_panel import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Pusta baza panelu w katalogu tymczasowym (DB_PATH testu)."""
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path))
+    monkeypatch.setattr(database, 'DB_NAME', str(tmp_path / "hosting.db"))
+    database.init_db()
+    yield database
+    database.close_connection()
@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from core_engine import backup
+
+
+@pytest.fixture
+def store(db, tmp_path, monkeypatch):
+    """Katalog user_data ze stronami 's1' i 's2' oraz pusty magazyn kopii."""
+    monkeypatch.setattr(backup, 'CHUNK_SIZE', 8)
+    user_data = tmp_path / "user_data"
+    for i, name in enumerate(['s1', 's2']):
+        site_dir = user_data / name
+        (site_dir / "css").mkdir(parents=True)
+        (site_dir / "index.html").write_text("<h1>wspólna treść</h1>")
+        (site_dir / "css" / "site.css").write_text(f"body {{ order: {i} }}")
+        db.add_site(name, f"container{i}", f"{name}.localhost")
+    return str(user_data), str(tmp_path / "backups")
+
+
+def _backup(name, store):
+    user_data, root = store
+    return backup.backup_site(name, user_data, root, backup.Throttle(0))
+
+
+def _chunks(root):
+    return sum(len(files) for _, _, files in os.walk(os.path.join(root, backup.CHUNKS_DIRNAME)))
+
+
+def test_second_backup_reads_only_changed_files(db, store):
+    user_data, _ = store
+    first = _backup('s1', store)
+    assert first['files'] == 2 and first['read'] == 2
+
+    assert _backup('s1', store)['read'] == 0
+
+    path = os.path.join(user_data, 's1', 'index.html')
+    with open(path, 'w') as f:
+        f.write("<h1>nowa treść strony</h1>")
+    os.utime(path, ns=(1, 1))
+    changed = _backup('s1', store)
+    assert changed['read'] == 1
+    assert len(db.list_backups(db.get_site('s1')['id'])) == 3
+
+
+def test_identical_content_is_stored_once(store):
+    first = _backup('s1', store)
+    second = _backup('s2', store)
+    assert first['stored_bytes'] > 0
+    # index.html jest taki sam w obu stronach - zapisywany jest tylko inny CSS
+    assert second['stored_bytes'] < first['stored_bytes']
+
+
+def test_restore_brings_back_snapshot(db, store):
+    user_data, _ = store
+    site_dir = os.path.join(user_data, 's1')
+    os.symlink("index.html", os.path.join(site_dir, "home.html"))
+    os.chmod(os.path.join(site_dir, "index.html"), 0o640)
+    _backup('s1', store)
+
+    with open(os.path.join(site_dir, "index.html"), 'w') as f:
+        f.write("zepsute")
+    with open(os.path.join(site_dir, "extra.txt"), 'w') as f:
+        f.write("po kopii")
+
+    result = backup.restore_site('s1', user_data, root=store[1])
+    assert result['files'] == 2
+    with open(os.path.join(site_dir, "index.html")) as f:
+        assert f.read() == "<h1>wspólna treść</h1>"
+    assert oct(os.stat(os.path.join(site_dir, "index.html")).st_mode & 0o777) == oct(0o640)
+    assert os.readlink(os.path.join(site_dir, "home.html")) == "index.html"
+    assert not os.path.exists(os.path.join(site_dir, "extra.txt"))
+
+
+def test_restore_rejects_backup_of_other_site(store):
+    other = _backup('s2', store)
+    with pytest.raises(ValueError):
+        backup.restore_site('s1', store[0], backup_id=other['backup_id'], root=store[1])
+
+
+def test_prune_and_collect_remove_unused_chunks(db, store):
+    user_data, root = store
+    _backup('s1', store)
+    path = os.path.join(user_data, 's1', 'css', 'site.css')
+    with open(path, 'w') as f:
+        f.write("body { color: red }")
+    os.utime(path, ns=(1, 1))
+    _backup('s1', store)
+    before = _chunks(root)
+
+    assert backup.prune_site(db.get_site('s1')['id'], keep=1) == 1
+    assert backup.collect(root) > 0
+    assert _chunks(root) < before
+    # Ostatnia migawka nadal daje się odtworzyć
+    backup.restore_site('s1', user_data, root=root)
+
+
+def test_collect_drops_backups_of_deleted_sites(db, store):
+    _, root = store
+    _backup('s1', store)
+    _backup('s1', store)
+    kept = _backup('s2', store)
+
+    db.remove_site('s1')
+    assert backup.collect(root) > 0
+    assert [row['id'] for row in db.list_backups()] == [kept['backup_id']]
+    assert not os.path.exists(os.path.join(root, backup.MANIFESTS_DIRNAME, 's1'))
+
+
+def test_collect_keeps_everything_when_manifest_is_unreadable(db, store):
+    _, root = store
+    result = _backup('s1', store)
+    with open(db.get_backup(result['backup_id'])['backup_path'], 'wb') as f:
+        f.write(b"uszkodzony")
+    before = _chunks(root)
+
+    assert backup.collect(root) == 0
+    assert _chunks(root) == before
@@ -0,0 +1,43 @@
+import threading
+
+from web_panel import database
+
+
+def _in_other_connection(fn):
+    """Wykonuje ``fn`` w osobnym wątku - z własnym połączeniem, jak inny proces panelu."""
+    def run():
+        try:
+            fn()
+        finally:
+            database.close_connection()
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+
+def test_data_version_sees_writes_of_other_connections(db):
+    before = db.get_data_version()
+    _in_other_connection(lambda: db.add_site('a', 'container', 'a.localhost'))
+    after = db.get_data_version()
+    assert after > before
+    assert db.get_data_version() == after
+
+
+def test_data_version_bumps_with_own_writes(db):
+    db.add_site('a', 'container', 'a.localhost')
+    before = db.get_data_version()
+    db.set_site_status('a', 'sleeping')
+    assert db.get_data_version() == before + 1
+
+
+def test_data_version_rolls_back_with_the_write(db):
+    db.add_site('a', 'container', 'a.localhost')
+    before = db.get_data_version()
+    try:
+        with db.transaction():
+            db.set_site_status('a', 'sleeping')
+            raise RuntimeError("przerwana zmiana")
+    except RuntimeError:
+        pass
+    assert db.get_data_version() == before
+    assert db.get_site('a')['status'] == 'active'
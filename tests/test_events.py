@@ -0,0 +1,51 @@
+from core_engine import docker_client
+from core_engine import events
+from core_engine import inventory
+
+
+class FakeContainer:
+    def __init__(self, status):
+        self.short_id = 'abc123'
+        self.status = status
+        self.attrs = {
+            'Status': 'Up 5 minutes (healthy)',
+            'NetworkSettings': {'Networks': {'a_isolated': {'IPAddress': '10.200.0.2'}}},
+        }
+
+
+class FakeInventory:
+    def __init__(self, containers):
+        self._containers = containers
+
+    def container(self, name):
+        return self._containers.get(name)
+
+    def containers(self):
+        return dict(self._containers)
+
+
+def test_workers_read_state_from_inventory_without_listener(monkeypatch):
+    monkeypatch.setattr(events, '_cache', None)
+    monkeypatch.setattr(inventory, 'get_inventory', lambda node=None: FakeInventory({'a': FakeContainer('running')}))
+
+    def no_listener():
+        raise AssertionError("nasłuch startuje tylko w procesie lidera")
+    monkeypatch.setattr(events, 'start_listener', no_listener)
+
+    sites = [{'name': 'a', 'node': docker_client.LOCAL_NODE}, {'name': 'b', 'node': docker_client.LOCAL_NODE}]
+    states = events.get_site_states(sites)
+    assert set(states) == {'a'}
+    assert states['a']['status'] == 'running'
+    assert states['a']['ip'] == '10.200.0.2'
+    assert states['a']['health'] == 'healthy'
+    assert events.get_state('a')['id'] == 'abc123'
+    assert events.get_state('b') is None
+
+
+def test_unreachable_docker_gives_no_states(monkeypatch):
+    monkeypatch.setattr(events, '_cache', None)
+
+    def broken(node=None):
+        raise ConnectionError("brak demona")
+    monkeypatch.setattr(inventory, 'get_inventory', broken)
+    assert events.get_site_states([{'name': 'a', 'node': docker_client.LOCAL_NODE}]) == {}
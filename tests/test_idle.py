@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from core_engine import docker_client
+from core_engine import idle
+
+
+class FakeContainer:
+    def __init__(self, on_stop=None):
+        self.status = 'running'
+        self.restart_policy = 'always'
+        self.on_stop = on_stop
+
+    def update(self, restart_policy):
+        self.restart_policy = restart_policy['Name']
+
+    def stop(self, timeout=None):
+        self.status = 'exited'
+        if self.on_stop:
+            self.on_stop()
+
+    def start(self):
+        self.status = 'running'
+
+    def reload(self):
+        pass
+
+
+class FakeContainers:
+    def __init__(self, container):
+        self.container = container
+
+    def get(self, name):
+        return self.container
+
+
+class FakeClient:
+    def __init__(self, container):
+        self.containers = FakeContainers(container)
+
+
+@pytest.fixture
+def routes(db, tmp_path, monkeypatch):
+    """Katalog routerów budzenia; zwraca funkcję czytającą nazwy routerów."""
+    monkeypatch.setattr(idle, '_user_data_dir', str(tmp_path))
+    db.add_site('a', 'container', 'a.localhost')
+
+    def read():
+        with open(idle.wake_routes_path(str(tmp_path))) as f:
+            return set(json.load(f).get('http', {}).get('routers', {}))
+    return read
+
+
+def _client(monkeypatch, container):
+    monkeypatch.setattr(docker_client, 'get_client', lambda **kwargs: FakeClient(container))
+
+
+def test_sleep_and_wake(db, routes, monkeypatch):
+    container = FakeContainer()
+    _client(monkeypatch, container)
+
+    assert idle.sleep_site('a')
+    assert db.get_site('a')['status'] == idle.STATUS_SLEEPING
+    assert container.status == 'exited'
+    assert routes() == {'wake-a'}
+
+    assert idle.wake_site('a')
+    assert db.get_site('a')['status'] == idle.STATUS_ACTIVE
+    assert container.status == 'running'
+    assert routes() == set()
+
+
+def test_wake_during_sleep_restarts_container(db, routes, monkeypatch):
+    # Inny proces budzi stronę, zanim kontener się zatrzymał
+    container = FakeContainer(on_stop=lambda: db.compare_and_set_site_status('a', 'sleeping', 'active'))
+    _client(monkeypatch, container)
+
+    assert not idle.sleep_site('a')
+    assert db.get_site('a')['status'] == idle.STATUS_ACTIVE
+    assert container.status == 'running'
+    assert container.restart_policy == 'always'
+
+
+def test_sleep_skips_site_that_is_not_active(db, routes, monkeypatch):
+    container = FakeContainer()
+    _client(monkeypatch, container)
+    db.set_site_status('a', idle.STATUS_SLEEPING)
+
+    assert not idle.sleep_site('a')
+    assert container.status == 'running'
+
+
+def test_wake_routes_only_for_isolated_sites(db, routes):
+    db.add_site('b', 'container-b', 'b.localhost')
+    db.set_site_status('a', idle.STATUS_SLEEPING)
+    db.set_site_status('b', idle.STATUS_SLEEPING)
+    db.set_hosting_mode('b', 'shared')
+
+    idle.write_wake_routes()
+    assert routes() == {'wake-a'}
+
+    db.remove_site('a')
+    idle.write_wake_routes()
+    assert routes() == set()
@@ -0,0 +1,48 @@
+import json
+import os
+
+from core_engine import instrumentation
+
+
+def _write_process(shared_dir, name, pid, counts, total, count):
+    data = {
+        'pid': pid,
+        'startup': {'worker': 0.5},
+        'histograms': {
+            instrumentation.ROUTES.name: [[['/', 'GET', '200'], counts, total, count]],
+        },
+    }
+    with open(os.path.join(shared_dir, name), 'w') as f:
+        json.dump(data, f)
+
+
+def _line(body, prefix):
+    return next(line for line in body.splitlines() if line.startswith(prefix))
+
+
+def test_render_sums_histograms_of_all_processes(tmp_path, monkeypatch):
+    shared_dir = str(tmp_path)
+    monkeypatch.setattr(instrumentation, 'SHARED_DIR', shared_dir)
+    buckets = len(instrumentation.ROUTES.buckets) + 1
+    # Drugi, już zakończony worker - jego liczniki nadal wchodzą do sumy
+    _write_process(shared_dir, "999999999-1.json", 999999999, [2] + [0] * (buckets - 1), 0.25, 2)
+
+    monkeypatch.setattr(instrumentation.ROUTES, '_series', {})
+    monkeypatch.setattr(instrumentation, '_startup', {'worker': 0.1})
+    instrumentation.ROUTES.observe(('/', 'GET', '200'), 0.0001)
+    body = instrumentation.render()
+
+    labels = 'route="/",method="GET",status="200"'
+    assert _line(body, f"{instrumentation.ROUTES.name}_count{{{labels}}}").endswith(" 3")
+    # Czasy startu tylko żyjących procesów, z etykietą pid
+    assert f'pid="{os.getpid()}",phase="worker"' in body
+    assert 'pid="999999999"' not in body
+    assert os.path.exists(os.path.join(shared_dir, instrumentation._process_file))
+
+
+def test_render_without_shared_dir_uses_own_process(monkeypatch):
+    monkeypatch.setattr(instrumentation, 'SHARED_DIR', "")
+    monkeypatch.setattr(instrumentation.ROUTES, '_series', {})
+    instrumentation.ROUTES.observe(('/x', 'GET', '200'), 0.0001)
+    body = instrumentation.render()
+    assert _line(body, f'{instrumentation.ROUTES.name}_count{{route="/x"').endswith(" 1")
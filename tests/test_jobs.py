@@ -0,0 +1,167 @@
+import json
+import time
+
+import pytest
+
+from core_engine import deploy
+from web_panel import jobs
+
+
+@pytest.fixture
+def handler(db, monkeypatch):
+    """Rejestruje zadanie 'test', którego wynik ustawia test przez ``calls``."""
+    calls = []
+
+    def run(site_name, payload):
+        calls.append((site_name, payload))
+        outcome = payload.get('raise')
+        if outcome == 'fatal':
+            raise jobs.JobFailed("nie do naprawienia")
+        if outcome:
+            raise RuntimeError("chwilowy błąd")
+        return {'ok': True}
+
+    monkeypatch.setitem(jobs._handlers, 'test', run)
+    return calls
+
+
+def test_claim_takes_oldest_job(db):
+    first = db.enqueue_job('test', 'a')
+    db.enqueue_job('test', 'b')
+    assert db.claim_job()['id'] == first['id']
+
+
+def test_claim_serializes_jobs_of_one_site(db):
+    first = db.enqueue_job('test', 'a')
+    second = db.enqueue_job('test', 'a')
+    other = db.enqueue_job('test', 'b')
+
+    assert db.claim_job()['id'] == first['id']
+    # Drugie zadanie strony 'a' czeka, aż pierwsze się zakończy
+    assert db.claim_job()['id'] == other['id']
+    assert db.claim_job() is None
+
+    db.finish_job(first['id'])
+    claimed = db.claim_job()
+    assert claimed['id'] == second['id']
+    assert claimed['status'] == 'running'
+    assert claimed['attempts'] == 1
+
+
+def test_claim_keeps_site_order_when_oldest_job_waits_for_retry(db):
+    first = db.enqueue_job('test', 'a')
+    db.enqueue_job('test', 'a')
+    now = time.time()
+    assert db.claim_job(now=now)['id'] == first['id']
+    db.fail_job(first['id'], "błąd", retry_at=now + 100)
+
+    # Późniejsze zadanie strony nie wyprzedza ponawianego
+    assert db.claim_job(now=now + 50) is None
+    assert db.claim_job(now=now + 100)['id'] == first['id']
+
+
+def test_fail_job_with_retry_requeues_after_delay(db):
+    job = db.enqueue_job('test', 'a')
+    now = time.time()
+    db.claim_job(now=now)
+    db.fail_job(job['id'], "błąd", retry_at=now + 30)
+
+    row = db.get_job(job['id'])
+    assert row['status'] == 'queued'
+    assert row['error'] == "błąd"
+    assert db.claim_job(now=now + 29) is None
+    assert db.claim_job(now=now + 30)['attempts'] == 2
+
+
+def test_fail_job_without_retry_marks_failed(db):
+    job = db.enqueue_job('test', 'a')
+    db.claim_job()
+    db.fail_job(job['id'], "błąd")
+
+    row = db.get_job(job['id'])
+    assert row['status'] == 'failed'
+    assert row['finished_at'] is not None
+    assert db.get_pending_jobs('a') == []
+
+
+def test_requeue_running_jobs(db):
+    job = db.enqueue_job('test', 'a')
+    db.claim_job()
+    assert db.requeue_running_jobs() == 1
+    assert db.get_job(job['id'])['status'] == 'queued'
+
+
+def test_submit_is_idempotent(handler):
+    first = jobs.submit('test', 'a', idempotency_key='k1')
+    again = jobs.submit('test', 'a', idempotency_key='k1')
+    assert again['id'] == first['id']
+    assert jobs.find('k1')['id'] == first['id']
+
+
+def test_submit_rejects_unknown_kind(db):
+    with pytest.raises(ValueError):
+        jobs.submit('nieznane', 'a')
+
+
+def test_run_job_stores_result(handler, db):
+    job = jobs.submit('test', 'a', {'x': 1})
+    assert jobs.run_job(db.claim_job())
+
+    done = jobs.get_job(job['id'])
+    assert done['status'] == 'done'
+    assert done['result'] == {'ok': True}
+    assert handler == [('a', {'x': 1})]
+
+
+def test_run_job_backoff_doubles(handler, db, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_RETRY_DELAY', 10)
+    monkeypatch.setattr(jobs.time, 'time', lambda: 1000.0)
+    job = jobs.submit('test', 'a', {'raise': 'retry'})
+
+    delays = []
+    for _ in range(2):
+        claimed = db.claim_job(now=10 ** 9)
+        assert not jobs.run_job(claimed)
+        delays.append(db.get_job(job['id'])['run_after'] - 1000.0)
+    assert delays == [10, 20]
+
+
+def test_run_job_gives_up_after_max_attempts(handler, db, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_MAX_ATTEMPTS', 2)
+    job = jobs.submit('test', 'a', {'raise': 'retry'})
+
+    for _ in range(2):
+        jobs.run_job(db.claim_job(now=10 ** 12))
+    assert jobs.get_job(job['id'])['status'] == 'failed'
+    assert db.claim_job(now=10 ** 12) is None
+
+
+def test_run_job_does_not_retry_job_failed(handler, db):
+    job = jobs.submit('test', 'a', {'raise': 'fatal'})
+    assert not jobs.run_job(db.claim_job())
+
+    failed = jobs.get_job(job['id'])
+    assert failed['status'] == 'failed'
+    assert failed['attempts'] == 1
+    assert json.loads(db.get_job(job['id'])['payload']) == {'raise': 'fatal'}
+
+
+def test_on_failure_runs_only_after_the_last_attempt(handler, db, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_MAX_ATTEMPTS', 2)
+    failures = []
+    monkeypatch.setitem(jobs._failure_handlers, 'test', lambda site, payload, error: failures.append((site, str(error))))
+    jobs.submit('test', 'a', {'raise': 'retry'})
+
+    jobs.run_job(db.claim_job(now=10 ** 12))
+    assert failures == []
+    jobs.run_job(db.claim_job(now=10 ** 12))
+    assert failures == [('a', "chwilowy błąd")]
+
+
+def test_deploy_is_found_by_idempotency_key(db):
+    job = deploy.DeployJob('a', 1024, idempotency_key='klucz')
+    job.save()
+    deploy._jobs.pop(job.id, None)
+    assert deploy.find('klucz').id == job.id
+    assert deploy.find('inny') is None
+    assert deploy.find(None) is None
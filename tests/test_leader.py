@@ -0,0 +1,30 @@
+import threading
+
+from web_panel import leader
+
+
+def test_failed_step_does_not_block_later_steps_and_is_retried():
+    calls = []
+    retried = threading.Event()
+
+    def flaky():
+        calls.append('flaky')
+        if calls.count('flaky') == 1:
+            raise RuntimeError("Docker niedostępny")
+        retried.set()
+
+    failed = leader.run_steps([
+        ('flaky', flaky),
+        ('jobs', lambda: calls.append('jobs')),
+    ], retry_interval=0.01)
+
+    assert failed == ['flaky']
+    assert calls[:2] == ['flaky', 'jobs']
+    assert retried.wait(2)
+    # Ponawiany jest tylko nieudany krok
+    assert calls.count('jobs') == 1
+
+
+def test_pending_steps_cleared_after_success():
+    assert leader.run_steps([('ok', lambda: None)]) == []
+    assert leader.get_pending_steps() == []
@@ -0,0 +1,258 @@
+import ipaddress
+
+import pytest
+
+from core_engine import docker_client
+from core_engine import docker_manager
+from core_engine import firewall
+from core_engine import inventory
+from core_engine import networks
+from web_panel import app
+
+POOL = ipaddress.ip_network("10.200.0.0/16")
+
+
+def _used(*subnets):
+    return {ipaddress.ip_network(s) for s in subnets}
+
+
+def test_next_subnet_empty_pool():
+    assert networks.next_subnet(28, set(), POOL) == "10.200.0.0/28"
+
+
+def test_next_subnet_skips_taken_ranges():
+    used = _used("10.200.0.0/28", "10.200.0.16/28", "10.200.0.48/28")
+    assert networks.next_subnet(28, used, POOL) == "10.200.0.32/28"
+
+
+def test_next_subnet_aligns_after_smaller_subnet():
+    # /24 nie może zaczynać się w środku zajętej /24 - następna wyrównana to 10.200.1.0
+    assert networks.next_subnet(24, _used("10.200.0.0/28"), POOL) == "10.200.1.0/24"
+
+
+def test_next_subnet_ignores_subnets_outside_pool():
+    used = _used("172.17.0.0/16", "10.0.0.0/24")
+    assert networks.next_subnet(28, used, POOL) == "10.200.0.0/28"
+
+
+def test_next_subnet_exhausted():
+    pool = ipaddress.ip_network("10.200.0.0/26")
+    used = _used("10.200.0.0/28", "10.200.0.16/28", "10.200.0.32/28", "10.200.0.48/28")
+    with pytest.raises(RuntimeError):
+        networks.next_subnet(28, used, pool)
+    with pytest.raises(RuntimeError):
+        networks.next_subnet(24, set(), pool)
+
+
+def test_find_network_with_room_respects_capacity(db):
+    network_id = db.add_network('local', 'shard1_isolated', '10.200.1.0/24', 'user:1', 2)
+    assert db.find_network_with_room('local', 'user:1')['id'] == network_id
+    db.assign_site_network('a', network_id)
+    db.assign_site_network('b', network_id)
+    assert db.find_network_with_room('local', 'user:1') is None
+    assert db.find_network_with_room('local', 'user:2') is None
+
+    released = db.release_site_network('a')
+    assert released['id'] == network_id and released['used'] == 1
+    assert db.find_network_with_room('local', 'user:1')['id'] == network_id
+
+
+class FakeNetwork:
+    def __init__(self, name, subnet, icc=True):
+        self.name = name
+        self.id = f"{name}-0123456789abcdef"
+        self.attrs = {
+            'IPAM': {'Config': [{'Subnet': subnet}]},
+            'Options': {} if icc else {firewall.ICC_OPTION: "false"},
+        }
+        self.connected = []
+
+    def connect(self, container, **kwargs):
+        self.connected.append((container, kwargs))
+
+
+class FakeContainer:
+    def __init__(self, labels):
+        self.attrs = {'Labels': labels}
+
+
+class FakeInventory:
+    def __init__(self, containers, networks_):
+        self.node = docker_client.LOCAL_NODE
+        self.containers = containers
+        self.networks_ = {n.name: n for n in networks_}
+
+    def container(self, name):
+        return self.containers.get(name)
+
+    def add_container(self, name, container):
+        self.containers[name] = container
+
+    def network(self, name):
+        return self.networks_.get(name)
+
+    def networks(self):
+        return self.networks_
+
+
+@pytest.fixture
+def docker_stub(db, monkeypatch):
+    """Węzeł z kontenerem strony 'a' na sieci z puli gotowych (znanej tylko z etykiety)."""
+    inv = FakeInventory(
+        {'a': FakeContainer({docker_manager.NETWORK_LABEL: 'warmabc123_isolated'})},
+        [FakeNetwork('warmabc123_isolated', '10.200.0.0/28')],
+    )
+    monkeypatch.setattr(inventory, 'get_inventory', lambda node=None: inv)
+    monkeypatch.setattr(
+        docker_manager, 'create_isolated_network',
+        lambda name, labels=None, node=None, subnet=None, icc=True: inv.network(f"{name}{inventory.NETWORK_SUFFIX}"),
+    )
+    db.add_site('a', 'container', 'a.localhost')
+    return inv
+
+
+def test_assign_adopts_label_network(db, docker_stub):
+    network = networks.assign('a')
+    assert network.name == 'warmabc123_isolated'
+    row = db.get_site_network('a')
+    assert row['name'] == 'warmabc123_isolated' and row['subnet'] == '10.200.0.0/28'
+    # Kolejny przydział wraca do tej samej sieci, bez nowego wiersza
+    assert networks.assign('a').name == 'warmabc123_isolated'
+    assert len(db.get_networks()) == 1
+
+
+def test_adopt_keeps_existing_assignment(db, docker_stub):
+    assert networks.adopt('a', docker_stub.node, 'warmabc123_isolated')['name'] == 'warmabc123_isolated'
+    assert networks.adopt('a', docker_stub.node, 'other_isolated') is None
+    assert db.get_site_network('a')['name'] == 'warmabc123_isolated'
+    # Sieć nieistniejąca w Dockerze nie jest zapisywana
+    assert networks.adopt('b', docker_stub.node, 'missing_isolated') is None
+    assert db.get_site_network('b') is None
+
+
+class FakeRunContainer:
+    short_id = 'abc123'
+
+    def __init__(self, kwargs=None):
+        self.kwargs = kwargs
+        self.removed = False
+
+    def start(self):
+        pass
+
+    def wait(self, timeout=None):
+        return {'StatusCode': 0}
+
+    def remove(self, force=False):
+        self.removed = True
+
+
+class FakeContainers:
+    def __init__(self):
+        self.runs = []
+
+        self.created = []
+
+    def run(self, image, **kwargs):
+        self.runs.append(kwargs)
+        return FakeRunContainer()
+
+    def create(self, image, command=None, **kwargs):
+        container = FakeRunContainer(kwargs)
+        self.created.append(container)
+        return container
+
+
+class FakeImages:
+    def get(self, name):
+        return name
+
+
+class FakeClient:
+    def __init__(self):
+        self.containers = FakeContainers()
+        self.images = FakeImages()
+
+
+def test_sites_of_one_owner_share_a_shard(db, monkeypatch):
+    inv = FakeInventory({}, [])
+
+    def create_network(name, labels=None, node=None, subnet=None, icc=True):
+        network_name = f"{name}{inventory.NETWORK_SUFFIX}"
+        return inv.networks_.setdefault(network_name, FakeNetwork(network_name, subnet, icc))
+
+    client = FakeClient()
+    monkeypatch.setattr(networks, 'NETWORK_POLICY', 'owner')
+    monkeypatch.setattr(inventory, 'get_inventory', lambda node=None: inv)
+    monkeypatch.setattr(docker_client, 'get_client', lambda **kwargs: client)
+    monkeypatch.setattr(docker_manager, 'create_isolated_network', create_network)
+    owner = db.create_user("owner@example.com", "hash", "Właściciel")
+    other = db.create_user("other@example.com", "hash", "Inny")
+
+    for name, user_id in (('a', owner), ('b', owner), ('c', other), ('d', None)):
+        app.provision_site(name, node=docker_client.LOCAL_NODE, user_id=user_id)
+
+    assigned = db.get_site_network_names()
+    assert assigned['a'] == assigned['b']
+    assert assigned['a'].startswith(networks.SHARD_PREFIX_NAME)
+    assert assigned['c'] not in (assigned['a'], assigned['d'])
+    assert assigned['d'] == f"d{inventory.NETWORK_SUFFIX}"
+    assert db.get_site('a')['user_id'] == owner
+    assert [run['network'] for run in client.containers.runs] == [assigned[n] for n in 'abcd']
+    # Sieci współdzielone bez ruchu między kontenerami, sieć dedykowana bez zmian
+    assert firewall.icc_disabled(inv.network(assigned['a']))
+    assert firewall.icc_disabled(inv.network(assigned['c']))
+    assert not firewall.icc_disabled(inv.network(assigned['d']))
+
+
+def test_shared_policy_isolates_tenants(db, monkeypatch):
+    monkeypatch.setattr(networks, 'NETWORK_POLICY', 'shared')
+    created = []
+
+    def create_network(name, labels=None, node=None, subnet=None, icc=True):
+        created.append(icc)
+        return FakeNetwork(f"{name}{inventory.NETWORK_SUFFIX}", subnet, icc)
+
+    monkeypatch.setattr(docker_manager, 'create_isolated_network', create_network)
+    monkeypatch.setattr(inventory, 'get_inventory', lambda node=None: FakeInventory({}, []))
+    networks.assign('a')
+    assert created == [False]
+
+    monkeypatch.setattr(networks, 'SHARD_ISOLATION', False)
+    monkeypatch.setattr(networks, 'SHARED_TENANT', 'shared-open')
+    networks.assign('b')
+    assert created == [False, True]
+
+
+class FakeTraefikInventory(FakeInventory):
+    def __init__(self, networks_):
+        super().__init__({}, networks_)
+        self.attached = set()
+
+    def traefik(self):
+        return 'traefik'
+
+    def traefik_attached(self, name):
+        return name in self.attached
+
+    def mark_traefik_attached(self, name):
+        self.attached.add(name)
+
+
+def test_traefik_gets_fixed_address_and_firewall_rule(monkeypatch):
+    shard = FakeNetwork('shard1_isolated', '10.200.1.0/24', icc=False)
+    inv = FakeTraefikInventory([shard])
+    client = FakeClient()
+    monkeypatch.setattr(inventory, 'get_inventory', lambda node=None: inv)
+    monkeypatch.setattr(docker_client, 'get_client', lambda **kwargs: client)
+    monkeypatch.setattr(firewall, '_applied', {})
+
+    assert docker_manager.create_isolated_network('shard1', icc=False) is shard
+    assert shard.connected == [('traefik', {'ipv4_address': '10.200.1.2'})]
+    [helper] = client.containers.created
+    assert helper.kwargs['network_mode'] == 'host'
+    assert helper.kwargs['environment'] == {'BRIDGE': 'br-shard1_isola', 'SOURCE': '10.200.1.2'}
+    assert helper.removed
+    # Reguła zakładana raz na proces
+    docker_manager.create_isolated_network('shard1', icc=False)
+    assert len(client.containers.created) == 1
@@ -0,0 +1,65 @@
+import time
+
+from core_engine import metrics
+from core_engine import rebalancer
+from core_engine import sampler
+
+
+def _add_sites(db, *names):
+    for i, name in enumerate(names):
+        db.add_site(name, f"container{i}", f"{name}.localhost")
+
+
+def test_pinned_limits_are_kept_and_reserve_capacity(db, monkeypatch):
+    _add_sites(db, 'a', 'b')
+    pinned = db.get_site('a')
+    db.set_resource_limits(pinned['id'], cpu_limit=150, ram_limit_mb=300, pinned=True)
+    monkeypatch.setattr(rebalancer, 'CPU_CAPACITY', 200.0)
+    monkeypatch.setattr(rebalancer, 'RAM_CAPACITY_MB', 1000.0)
+    observed = []
+
+    def usage(sites):
+        observed.extend(site['name'] for site in sites)
+        return {site['name']: (100.0, 900.0) for site in sites}
+
+    monkeypatch.setattr(rebalancer, 'observed_usage', usage)
+    balancer = rebalancer.Rebalancer(apply=False)
+    balancer.rebalance_once()
+
+    assert observed == ['b']
+    # Strona 'b' dzieli tylko to, czego nie zarezerwowała przypięta 'a'
+    assert balancer.last_plan['b'][0] == 50
+    assert db.get_site_with_limits('a')['cpu_limit'] == 150
+
+
+def test_set_resource_limits_keeps_pin_unless_given(db):
+    _add_sites(db, 'a')
+    site_id = db.get_site('a')['id']
+    db.set_resource_limits(site_id, pinned=True)
+    db.set_resource_limits(site_id, cpu_limit=20)
+    assert db.get_site_with_limits('a')['pinned'] == 1
+    db.set_resource_limits(site_id, pinned=False)
+    assert db.get_site_with_limits('a')['pinned'] == 0
+
+
+def test_observed_usage_reads_docker_only_for_sites_without_history(db, monkeypatch):
+    _add_sites(db, 'a', 'b')
+    history = {'timestamp': [time.time()], 'cpu_percent': [5.0], 'ram_usage_mb': [50.0]}
+    monkeypatch.setattr(sampler, 'get_site_history', lambda name: history if name == 'a' else None)
+    asked = []
+
+    def fetch(sites=None, **kwargs):
+        asked.append([site['name'] for site in sites])
+        return []
+
+    monkeypatch.setattr(metrics, 'get_all_sites_metrics', fetch)
+    sites = db.get_all_sites_with_limits()
+
+    # Próbnik działa - strona bez historii czeka na kolejną rundę
+    monkeypatch.setattr(sampler, 'is_running', lambda: True)
+    assert rebalancer.observed_usage(sites) == {'a': (5.0, 50.0)}
+    assert asked == []
+
+    monkeypatch.setattr(sampler, 'is_running', lambda: False)
+    rebalancer.observed_usage(sites)
+    assert asked == [['b']]
@@ -0,0 +1,66 @@
+import json
+import os
+import re
+
+from core_engine import static_build
+
+
+def _write(site_dir, rel, content):
+    path = os.path.join(site_dir, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def _immutable_pattern():
+    """Wzorzec lokalizacji "immutable" z konfiguracji nginx."""
+    config = static_build.nginx_config()
+    return re.compile(config.split('Nazwy z hashem')[1].split('"')[1], re.IGNORECASE)
+
+
+def test_assets_get_hashed_names_matching_the_immutable_rule(tmp_path):
+    site = str(tmp_path)
+    _write(site, "css/site.css", "body { color: red; }\n" * 100)
+    _write(site, "js/app.js", "console.log('x');\n")
+    _write(site, "index.html", '<link href="css/site.css?v=1" rel="stylesheet"><script src="/js/app.js"></script>'
+                               '<a href="https://example.com/app.js">x</a><a href="about.html">o nas</a>')
+    _write(site, "about.html", '<img src="missing.png">')
+
+    summary = static_build.build_site(site)
+    assert summary['hashed'] == 2
+
+    with open(os.path.join(site, static_build.MANIFEST_NAME)) as f:
+        files = json.load(f)['files']
+    css = files[os.path.join("css", "site.css")]['hashed']
+    js = files[os.path.join("js", "app.js")]['hashed']
+    pattern = _immutable_pattern()
+    for rel in (css, js):
+        assert pattern.search(rel)
+        assert os.path.isfile(os.path.join(site, rel))
+    # Kopia skompresowana także pod nazwą z hashem
+    assert os.path.isfile(os.path.join(site, css + ".gz"))
+
+    with open(os.path.join(site, "index.html")) as f:
+        html = f.read()
+    assert f'href="{css}?v=1"' in html
+    assert f'src="/{js}"' in html
+    assert 'href="https://example.com/app.js"' in html
+    assert 'href="about.html"' in html
+    # Manifest HTML opisuje stronę po podmianie odnośników
+    assert files["index.html"]['hash'] == static_build._file_hash(os.path.join(site, "index.html"))
+
+
+def test_already_hashed_names_are_left_alone(tmp_path):
+    site = str(tmp_path)
+    _write(site, "app.0123456789abcdef.js", "console.log('x');\n")
+    assert static_build.build_site(site)['hashed'] == 0
+    assert [name for name in os.listdir(site) if name.endswith('.js')] == ["app.0123456789abcdef.js"]
+
+
+def test_brotli_only_when_nginx_serves_it(tmp_path, monkeypatch):
+    site = str(tmp_path)
+    _write(site, "index.html", "<p>treść</p>\n" * 200)
+    monkeypatch.setattr(static_build, 'NGINX_BROTLI', False)
+    assert static_build.build_site(site)['br'] == 0
+    assert not os.path.exists(os.path.join(site, "index.html.br"))
+    assert "brotli_static" not in static_build.nginx_config()
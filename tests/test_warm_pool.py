@@ -0,0 +1,62 @@
+from core_engine import docker_client
+from core_engine import docker_manager
+from core_engine import inventory
+from core_engine import warm_pool
+
+
+class FakeNetwork:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeContainer:
+    def __init__(self, network):
+        self.attrs = {'Labels': {docker_manager.NETWORK_LABEL: network}}
+
+
+class FakeInventory:
+    def __init__(self, containers):
+        self._containers = containers
+
+    def refresh(self):
+        pass
+
+    def containers(self):
+        return self._containers
+
+
+class FakeApi:
+    def __init__(self, names):
+        self.names = names
+
+    def networks(self, filters=None):
+        return [{'Name': name} for name in self.names]
+
+
+class FakeNetworks:
+    def prepare_model(self, raw):
+        return FakeNetwork(raw['Name'])
+
+
+class FakeClient:
+    def __init__(self, names):
+        self.api = FakeApi(names)
+        self.networks = FakeNetworks()
+
+
+def test_adopt_skips_networks_used_by_containers_or_recorded_in_db(db, monkeypatch):
+    monkeypatch.setattr(
+        inventory, 'get_inventory',
+        lambda node=None: FakeInventory({'a': FakeContainer('warm1_isolated')}),
+    )
+    monkeypatch.setattr(
+        docker_client, 'get_client',
+        lambda **kwargs: FakeClient(['warm1_isolated', 'warm2_isolated', 'warm3_isolated']),
+    )
+    # Sieć przydzielona stronie 'b', której kontener jeszcze nie wystartował
+    network_id = db.add_network(docker_client.LOCAL_NODE, 'warm2_isolated', '10.200.0.16/28')
+    db.assign_site_network('b', network_id)
+
+    pool = warm_pool.WarmPool(size=4)
+    pool.adopt()
+    assert [pool.claim().name, pool.claim()] == ['warm3_isolated', None]
@@ -1,33 +1,31 @@
 #!/usr/bin/env python3
-"""Skrypt do aktualizacji limitów CPU w bazie danych na dynamiczne wartości."""
+"""Skrypt uruchamiający jedną rundę rebalancera limitów CPU/RAM.
+
+Limity liczone są z obserwowanego zużycia i planów użytkowników, a potem
+nakładane na działające kontenery (``--dry-run`` - tylko wyliczenie).
+"""
 
 import sys
 sys.path.insert(0, '/app')
 
+from core_engine import rebalancer
 from web_panel import database
 
-# Pobierz wszystkie strony
-sites = database.get_all_sites()
+dry_run = '--dry-run' in sys.argv
+
+sites = database.get_all_sites_with_limits()
 print(f'Znaleziono {len(sites)} stron')
 
 if len(sites) == 0:
     print('Brak stron w bazie')
     sys.exit(0)
 
-# Oblicz optymalny limit CPU
-optimal_cpu = max(10, int(100 / len(sites)))
-print(f'Optymalny limit CPU: {optimal_cpu}% (100% / {len(sites)} stron)')
-
-# Aktualizuj limity dla każdej strony
-for site in sites:
-    print(f'Aktualizuję limity dla {site["name"]}...')
-    database.set_resource_limits(
-        site['id'], 
-        cpu_limit=optimal_cpu,
-        ram_limit_mb=512,
-        disk_limit_mb=1024,
-        bandwidth_limit_mb=10240
-    )
-
-print(f'\n✅ Limity zaktualizowane!')
-print(f'Nowy limit CPU dla wszystkich: {optimal_cpu}%')
+print(f'Pojemność węzła: CPU {rebalancer.CPU_CAPACITY:.0f}%')
+decisions = rebalancer.Rebalancer(apply=not dry_run).rebalance_once()
+
+names = {site['id']: site['name'] for site in sites}
+for ts, site_id, plan, cpu_usage, cpu_old, cpu_new, ram_usage, ram_old, ram_new, applied, reason in decisions:
+    print(f'{names[site_id]:<24} [{plan}] CPU {cpu_old}% → {cpu_new}% (zużycie {cpu_usage}%), '
+          f'RAM {ram_old}MB → {ram_new}MB (zużycie {ram_usage}MB) - {reason}')
+
+print(f'\n✅ Decyzji: {len(decisions)}, nałożonych: {sum(d[9] for d in decisions)}')
@@ -0,0 +1,201 @@
+"""JSON API panelu: krótka pamięć podręczna, ETag (If-None-Match) i gzip."""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Blueprint, Response, abort, request
+
+from core_engine import disk_index
+from core_engine import events
+from core_engine import sampler as metrics_sampler
+from web_panel import database
+
+# Ile sekund odpowiedź API jest podawana z pamięci bez zaglądania do bazy
+API_CACHE_TTL = float(os.environ.get("API_CACHE_TTL", "5"))
+# Ile odpowiedzi (głównie pojedynczych stron) trzymamy w pamięci
+API_CACHE_SIZE = int(os.environ.get("API_CACHE_SIZE", "1024"))
+# Mniejszych odpowiedzi nie opłaca się kompresować
+API_GZIP_MIN_BYTES = int(os.environ.get("API_GZIP_MIN_BYTES", "1024"))
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+
+class CachedResponse:
+    """Gotowe ciało odpowiedzi JSON razem z ETag i wersją danych, z której powstało."""
+
+    __slots__ = ('version', 'expires', 'etag', 'body', '_gzipped')
+
+    def __init__(self, version, body):
+        self.version = version
+        self.expires = time.monotonic() + API_CACHE_TTL
+        # ETag z treści - po wygaśnięciu niezmienione dane nadal dają 304
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.body = body
+        self._gzipped = None
+
+    def fresh(self, version):
+        return self.version == version and time.monotonic() < self.expires
+
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._gzipped
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_build_locks = {}
+
+
+def _build_lock(key):
+    with _cache_lock:
+        return _build_locks.setdefault(key, threading.Lock())
+
+
+def _lookup(key, version):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry.fresh(version):
+            _cache.move_to_end(key)
+            return entry
+    return None
+
+
+def _cached(key, version, build):
+    """Odpowiedź z pamięci dla (klucz, wersja) albo zbudowana na nowo przez ``build()``.
+
+    Równoległe żądania o ten sam klucz czekają na jedno budowanie.
+    """
+    entry = _lookup(key, version)
+    if entry is not None:
+        return entry
+    with _build_lock(key):
+        entry = _lookup(key, version)
+        if entry is not None:
+            return entry
+        try:
+            payload = build()
+        except Exception:
+            # np. 404 dla nieistniejącej strony - nie trzymamy dla niej blokady
+            with _cache_lock:
+                if key not in _cache:
+                    _build_locks.pop(key, None)
+            raise
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+        entry = CachedResponse(version, body)
+        with _cache_lock:
+            _cache[key] = entry
+            _cache.move_to_end(key)
+            while len(_cache) > API_CACHE_SIZE:
+                old_key, _ = _cache.popitem(last=False)
+                _build_locks.pop(old_key, None)
+    return entry
+
+
+def _respond(entry):
+    """304 dla pasującego If-None-Match, w przeciwnym razie JSON (gzip, jeśli klient chce)."""
+    # Słaby ETag - ta sama treść w wersji zwykłej i skompresowanej
+    etag = f'W/"{entry.etag}"'
+    headers = {
+        'ETag': etag,
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding',
+    }
+    if request.if_none_match.contains_weak(entry.etag):
+        return Response(status=304, headers=headers)
+
+    body = entry.body
+    if len(body) >= API_GZIP_MIN_BYTES and request.accept_encodings.quality('gzip') > 0:
+        body = entry.gzipped()
+        headers['Content-Encoding'] = 'gzip'
+    return Response(body, mimetype='application/json', headers=headers)
+
+
+def _site_payload(site, state):
+    return {
+        'name': site['name'],
+        'domain': site['domain'],
+        'site_type': site['site_type'],
+        'status': site['status'],
+        'hosting_mode': site['hosting_mode'],
+        'node': site['node'],
+        'owner': site['user_id'],
+        'plan': site['plan'],
+        'created_at': site['created_at'],
+        'limits': {
+            'cpu': site['cpu_limit'],
+            'ram_mb': site['ram_limit_mb'],
+            'disk_mb': site['disk_limit_mb'],
+            'bandwidth_mb': site['bandwidth_limit_mb'],
+        } if site['has_limits'] else None,
+        'container': {
+            'id': state['id'],
+            'status': state['status'],
+            'ip': state['ip'],
+        } if state is not None else None,
+        'files': disk_index.get_stats(site['name']),
+    }
+
+
+@bp.route("/sites")
+def sites():
+    """Wszystkie strony z limitami, stanem kontenera i statystyką plików.
+
+    Stan kontenerów pochodzi z pamięci zdarzeń Dockera (strony zdalnych węzłów -
+    z migawki inventory) i nie zmienia wersji danych - jego zmiany widać
+    najpóźniej po ``API_CACHE_TTL`` sekundach.
+    """
+    def build():
+        sites = database.get_all_sites_with_limits()
+        states = events.get_site_states(sites)
+        return {
+            'version': database.get_data_version(),
+            'sites': [_site_payload(site, states.get(site['name'])) for site in sites],
+        }
+
+    return _respond(_cached(('sites',), database.get_data_version(), build))
+
+
+@bp.route("/sites/<site_name>")
+def site_detail(site_name):
+    """Jedna strona razem z ostatnią próbką metryk."""
+    def build():
+        site = database.get_site_with_limits(site_name)
+        if site is None:
+            abort(404)
+        payload = _site_payload(site, events.get_site_states([site]).get(site_name))
+        payload['metrics'] = None
+        for item in metrics_sampler.get_latest_metrics():
+            if item['site']['name'] == site_name:
+                payload['metrics'] = item['metrics']
+                payload['alerts'] = item['alerts']
+                break
+        return payload
+
+    version = (database.get_data_version(), metrics_sampler.get_latest_timestamp())
+    return _respond(_cached(('site', site_name), version, build))
+
+
+@bp.route("/metrics")
+def metrics():
+    """Ostatnia runda próbnika metryk; wersją jest znacznik czasu rundy."""
+    def build():
+        return {
+            'timestamp': metrics_sampler.get_latest_timestamp(),
+            'interval': metrics_sampler.SAMPLE_INTERVAL,
+            'sites': [
+                {
+                    'name': item['site']['name'],
+                    'node': item['site']['node'],
+                    'metrics': item['metrics'],
+                    'alerts': item['alerts'],
+                }
+                for item in metrics_sampler.get_latest_metrics()
+            ],
+        }
+
+    return _respond(_cached(('metrics',), metrics_sampler.get_latest_timestamp(), build))
@@ -1,175 +1,583 @@
+import io
 import os
 import shutil
-import zipfile
-from flask import Flask, render_template, request, redirect, url_for
-import docker
+import time
+import uuid
+from flask import Flask, Response, g, render_template, request, redirect, url_for, jsonify, abort
 
+from core_engine import backup
+from core_engine import deploy
+from core_engine import disk_index
+from core_engine import docker_client
 from core_engine import docker_manager
-from core_engine import metrics as metrics_module
+from core_engine import events
+from core_engine import idle
+from core_engine import instrumentation
+from core_engine import inventory
+from core_engine import networks
+from core_engine import rebalancer
+from core_engine import scheduler
+from core_engine import sampler as metrics_sampler
+from core_engine import shared_nginx
+from core_engine import static_build
+from core_engine import stats_stream
+from core_engine import warm_pool
+from web_panel import api
+from web_panel import autostart
 from web_panel import database
+from web_panel import jobs
+from web_panel import leader
 
 app = Flask(__name__)
+app.register_blueprint(api.bp)
 
-USER_DATA_DIR = "/app/user_data"
+USER_DATA_DIR = os.environ.get("USER_DATA_DIR", "/app/user_data")
+DEFAULT_DISK_LIMIT_MB = 1024
+# Domena samego panelu - żądania do innych domen to budzenie uśpionych stron
+PANEL_HOST = os.environ.get("PANEL_HOST", "localhost")
 
-if not os.path.exists(USER_DATA_DIR):
-    os.makedirs(USER_DATA_DIR)
-database.init_db()
+WAKE_PAGE = """<!DOCTYPE html>
+<html lang="pl"><head><meta charset="UTF-8"><meta http-equiv="refresh" content="1">
+<title>Uruchamianie...</title></head>
+<body><p>⏳ Strona się uruchamia, za chwilę zostaniesz przekierowany...</p></body></html>"""
 
 
-def autostart_sites():
-    """Automatycznie uruchamia wszystkie strony z bazy przy starcie panelu"""
-    print("🔄 Sprawdzam kontenery stron...")
-    docker_client = docker.from_env()
-    sites = database.get_all_sites()
-    
-    # Najpierw łączymy Traefik ze wszystkimi izolowanymi sieciami
-    try:
-        traefik = docker_client.containers.get("traefik_proxy")
-        for site in sites:
-            network_name = f"{site['name']}_isolated"
-            try:
-                network = docker_client.networks.get(network_name)
-                networks = traefik.attrs['NetworkSettings']['Networks']
-                if network_name not in networks:
-                    network.connect(traefik)
-                    print(f"🔗 Traefik podłączony do {network_name}")
-            except docker.errors.NotFound:
-                pass
-            except docker.errors.APIError:
-                pass
-    except Exception as e:
-        print(f"⚠️  Nie udało się podłączyć Traefik: {e}")
-    
-    for site in sites:
-        site_name = site['name']
-        site_id = site['id']
-        
-        limits = database.get_resource_limits(site_id)
-        cpu_limit = limits['cpu_limit'] if limits else 50
-        ram_limit = limits['ram_limit_mb'] if limits else 512
-        
-        try:
-            container = docker_client.containers.get(site_name)
-            if container.status != 'running':
-                print(f"▶️  Uruchamiam zatrzymany kontener {site_name}...")
-                container.start()
-            else:
-                print(f"✅ Kontener {site_name} już działa")
-        except docker.errors.NotFound:
-            print(f"🆕 Tworzę nowy kontener dla {site_name} (CPU: {cpu_limit}%, RAM: {ram_limit}MB)...")
-            container = docker_manager.start_container(site_name, cpu_limit=cpu_limit, ram_limit_mb=ram_limit)
-            if container:
-                conn = database.get_connection()
-                conn.execute('UPDATE sites SET container_id = ? WHERE name = ?', 
-                           (container.short_id, site_name))
-                conn.commit()
-                conn.close()
-        except Exception as e:
-            print(f"❌ Błąd uruchamiania {site_name}: {e}")
-
-autostart_sites()
+def init_worker():
+    """Przygotowanie procesu obsługującego żądania - bez wywołań Dockera.
+
+    Pamięci podręczne (stan kontenerów, indeks dysku, ostatnie metryki)
+    wypełniają się leniwie przy pierwszym użyciu.
+    """
+    os.makedirs(USER_DATA_DIR, exist_ok=True)
+    database.init_db()
+    idle.configure(USER_DATA_DIR)
+
+
+def start_control_plane():
+    """Zadania sterujące - w całym wdrożeniu wykonuje je tylko jeden proces (lider).
+
+    Kroki są niezależne: błąd jednego (np. Docker chwilowo niedostępny) nie
+    blokuje pozostałych, a nieudane są ponawiane w tle.
+    """
+    return leader.run_steps([
+        ('nginx_config', lambda: static_build.write_nginx_config(USER_DATA_DIR)),
+        ('autostart', autostart.autostart_sites),
+        ('warm_pool', warm_pool.start_pool),
+        ('shared_nginx', lambda: shared_nginx.start_pool(USER_DATA_DIR)),
+        ('disk_index', lambda: disk_index.start_indexer(USER_DATA_DIR)),
+        ('events', events.start_listener),
+        ('watch_events', autostart.watch_events),
+        ('stats_stream', stats_stream.start_manager),
+        ('sampler', metrics_sampler.start_sampler),
+        ('rebalancer', rebalancer.start_rebalancer),
+        ('idle', lambda: idle.start_detector(USER_DATA_DIR)),
+        ('backup', lambda: backup.start_scheduler(USER_DATA_DIR)),
+        # Kolejka wznawia przerwane zadania - dwa procesy zabrałyby je sobie nawzajem
+        ('jobs', jobs.start_workers),
+    ])
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.before_request
+def track_docker_calls():
+    docker_client.begin_tracking()
+
+
+@app.before_request
+def wake_sleeping_site():
+    """Żądanie do uśpionej strony (router budzenia Traefik) - budzi ją i ponawia żądanie"""
+    host = request.host.split(':')[0]
+    if host == PANEL_HOST:
+        return None
+    site = database.get_site_by_domain(host)
+    if site is None:
+        return None
+    if idle.is_sleeping(site):
+        if not idle.wake_site(site['name']):
+            return WAKE_PAGE, 503, {'Retry-After': '2'}
+        # Traefik potrzebuje chwili na przełączenie routera - potem klient ponawia żądanie
+        time.sleep(idle.WAKE_SETTLE)
+        return redirect(request.url, code=307)
+    # Strona już obudzona, ale router jeszcze nie przełączony
+    return WAKE_PAGE, 503, {'Retry-After': '1'}
+
+
+@app.after_request
+def observe_request_time(response):
+    """Czas obsługi żądania do histogramu tras (rejestrowany pierwszy, wykonywany ostatni)"""
+    started = g.get('request_started')
+    if instrumentation.INSTRUMENTATION_ENABLED and started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        instrumentation.ROUTES.observe(
+            (route, request.method, str(response.status_code)), time.perf_counter() - started
+        )
+    return response
+
+
+@app.after_request
+def report_docker_calls(response):
+    """Dodaje do odpowiedzi liczbę wywołań Docker API wykonanych przez żądanie"""
+    counts = docker_client.end_tracking()
+    total = sum(counts.values())
+    response.headers['X-Docker-API-Calls'] = str(total)
+    if docker_client.LOG_CALLS and total:
+        details = ", ".join(f"{call}: {n}" for call, n in counts.most_common())
+        print(f"🐳 {request.method} {request.path} → {total} wywołań Docker API ({details})")
+    return response
 
 
 @app.route("/")
 def index():
     sites = database.get_all_sites()
-    return render_template("index.html", sites=sites)
+    pending = None
+    deploy_job = deploy.get_job(request.args.get("deploy", ""))
+    job = jobs.get_job(request.args.get("job", type=int) or 0)
+    if deploy_job:
+        pending = {'url': url_for("deploy_status", job_id=deploy_job.id), 'label': f"Wdrażanie {deploy_job.site_name}"}
+    elif job:
+        pending = {'url': url_for("job_status", job_id=job['id']), 'label': f"Zadanie {job['kind']} ({job['site']})"}
+    return render_template(
+        "index.html", sites=sites, states=events.get_site_states(sites), pending=pending,
+        users=database.get_all_users(), idempotency_key=uuid.uuid4().hex
+    )
+
+
+def provision_site(site_name, hosting_mode=shared_nginx.MODE_ISOLATED, node=None, user_id=None):
+    """Uruchamia nową stronę (własny kontener lub pula współdzielona) i zapisuje ją w bazie"""
+    domain = f"{site_name}.localhost"
+    if hosting_mode == shared_nginx.MODE_SHARED:
+        site_id = database.add_site(site_name, '', domain, user_id=user_id, hosting_mode=hosting_mode)
+        shared_nginx.sync()
+    else:
+        node = node or scheduler.choose_node(site_name, cpu_limit=50, ram_limit_mb=512)
+        # Kontener mógł powstać w przerwanej wcześniej próbie
+        container = inventory.get_inventory(node).container(site_name)
+        container = container or docker_manager.start_container(
+            site_name, cpu_limit=50, ram_limit_mb=512, node=node, owner=user_id
+        )
+        if not container:
+            raise RuntimeError("Błąd Docker")
+        site_id = database.add_site(site_name, container.short_id, domain, user_id=user_id, node=node)
+    database.set_resource_limits(site_id, cpu_limit=50, ram_limit_mb=512, disk_limit_mb=DEFAULT_DISK_LIMIT_MB)
+    disk_index.refresh_site(site_name)
+
+
+def reload_site_files(site_name):
+    """Po podmianie katalogu strony: przełącza kontener lub pulę na nowe pliki"""
+    site = database.get_site(site_name)
+    if site is None or idle.is_sleeping(site):
+        # Uśpiony kontener podepnie nowy katalog przy obudzeniu
+        pass
+    elif site['hosting_mode'] == shared_nginx.MODE_SHARED:
+        # Pula montuje cały user_data - wystarczy wyczyścić open_file_cache
+        shared_nginx.reload()
+    else:
+        # Bind mount wskazuje na stary katalog - restart podpina nowy
+        docker_manager.restart_container(site_name, node=site['node'])
+    disk_index.refresh_site(site_name)
+
+
+def _detach_upload(storage):
+    """Przejmuje przesłany plik tak, żeby przeżył koniec żądania.
+
+    Werkzeug i tak buforuje upload (w pamięci lub w pliku tymczasowym) -
+    duplikujemy deskryptor zamiast kopiować archiwum drugi raz na dysk.
+    """
+    stream = storage.stream
+    try:
+        archive = os.fdopen(os.dup(stream.fileno()), "rb")
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        stream.seek(0)
+        return io.BytesIO(stream.read())
+    archive.seek(0)
+    return archive
+
+
+def _deploy_response(job):
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({
+            'job_id': job.id,
+            'status_url': url_for("deploy_status", job_id=job.id),
+        }), 202
+    return redirect(url_for("index", deploy=job.id))
+
+
+def _idempotency_key():
+    return request.headers.get("Idempotency-Key") or request.form.get("idempotency_key") or None
+
+
+def _job_response(job):
+    """202 z numerem zadania (API) albo powrót na stronę główną ze statusem"""
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({
+            'job_id': job['id'],
+            'status_url': url_for("job_status", job_id=job['id']),
+        }), 202
+    return redirect(url_for("index", job=job['id']))
+
 
 @app.route("/create", methods=["POST"])
 def create():
     site_name = request.form.get("site_name").strip().lower()
     uploaded_file = request.files.get("html_file")
+    hosting_mode = request.form.get("hosting_mode", shared_nginx.MODE_ISOLATED)
+    # Właściciel strony - jego strony dzielą sieci (NETWORK_POLICY=owner)
+    user_id = request.form.get("user_id", type=int)
+
+    # Powtórzone żądanie (np. podwójne kliknięcie) - to samo zadanie
+    key = _idempotency_key()
+    job = jobs.find(key)
+    if job is not None:
+        return _job_response(job)
+    deploy_job = deploy.find(key)
+    if deploy_job is not None:
+        return _deploy_response(deploy_job)
 
     if not site_name.isalnum():
         return "Błąd: Nazwa tylko litery i cyfry!", 400
+    if hosting_mode not in (shared_nginx.MODE_ISOLATED, shared_nginx.MODE_SHARED):
+        return "Błąd: Nieznany tryb hostingu!", 400
+    if user_id is not None and database.get_user(user_id=user_id) is None:
+        return "Błąd: Nieznany właściciel!", 400
 
     site_path = os.path.join(USER_DATA_DIR, site_name)
-    if os.path.exists(site_path):
+    if os.path.exists(site_path) or deploy.is_pending(site_name):
         return "Błąd: Strona już istnieje!", 400
-    os.makedirs(site_path)
 
-    # ZIP lub zaglushka
+    # ZIP - rozpakowanie w tle, kontener startuje po podmianie katalogu
     if uploaded_file and uploaded_file.filename.endswith(".zip"):
-        zip_path = os.path.join(site_path, "upload.zip")
-        uploaded_file.save(zip_path)
+        job = deploy.submit(
+            site_name, _detach_upload(uploaded_file), USER_DATA_DIR, DEFAULT_DISK_LIMIT_MB,
+            on_success=lambda job: jobs.submit(
+                'create', site_name, {'hosting_mode': hosting_mode, 'user_id': user_id}, key
+            ),
+            idempotency_key=key,
+        )
+        return _deploy_response(job)
 
-        try:
-            with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                zip_ref.extractall(site_path)
-            os.remove(zip_path)
-        except Exception as e:
-            return f"Błąd rozpakowania archiwum: {e}", 500
-    else:
-        with open(os.path.join(site_path, "index.html"), "w") as f:
-            f.write(f"<h1>Strona: {site_name}</h1><p>Czekam na zawartość...</p>")
+    # Katalog zakładamy od razu - rezerwuje nazwę przed wykonaniem zadania
+    os.makedirs(site_path)
+    with open(os.path.join(site_path, "index.html"), "w") as f:
+        f.write(f"<h1>Strona: {site_name}</h1><p>Czekam na zawartość...</p>")
 
-    try:
-        container = docker_manager.start_container(site_name, cpu_limit=50, ram_limit_mb=512)
-        if container:
-            domain = f"{site_name}.localhost"
-            site_id = database.add_site(site_name, container.short_id, domain)
-            database.set_resource_limits(site_id, cpu_limit=50, ram_limit_mb=512, disk_limit_mb=1024)
-        else:
-            return "Błąd Docker", 500
-    except Exception as e:
-        return f"Błąd krytyczny: {e}", 500
+    # Węzeł wybieramy raz - ponowienie zadania trafia tam, gdzie pierwsza próba
+    payload = {'hosting_mode': hosting_mode, 'user_id': user_id}
+    if hosting_mode == shared_nginx.MODE_ISOLATED:
+        payload['node'] = scheduler.choose_node(site_name, cpu_limit=50, ram_limit_mb=512)
+    job = jobs.submit('create', site_name, payload, key)
+    return _job_response(job)
+
+
+@app.route("/redeploy/<site_name>", methods=["POST"])
+def redeploy(site_name):
+    """Podmienia pliki istniejącej strony na zawartość nowego archiwum"""
+    site = database.get_site_with_limits(site_name)
+    if site is None:
+        return "Błąd: Strona nie istnieje!", 404
+
+    uploaded_file = request.files.get("html_file")
+    if not uploaded_file or not uploaded_file.filename.endswith(".zip"):
+        return "Błąd: Wymagane archiwum .zip!", 400
+    if deploy.is_pending(site_name):
+        return "Błąd: Wdrożenie tej strony już trwa!", 409
+
+    disk_limit_mb = site['disk_limit_mb'] if site['has_limits'] else DEFAULT_DISK_LIMIT_MB
+    job = deploy.submit(
+        site_name, _detach_upload(uploaded_file), USER_DATA_DIR, disk_limit_mb,
+        on_success=lambda job: jobs.submit('reload', site_name)
+    )
+    return _deploy_response(job)
+
+
+@app.route("/deploy/<job_id>")
+def deploy_status(job_id):
+    """Postęp wdrożenia (JSON)"""
+    job = deploy.get_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
 
-    return redirect(url_for("index"))
+
+@app.route("/mode/<site_name>", methods=["POST"])
+def change_mode(site_name):
+    """Przenosi stronę między własnym kontenerem a pulą współdzieloną"""
+    if database.get_site(site_name) is None:
+        return "Błąd: Strona nie istnieje!", 404
+    hosting_mode = request.form.get("hosting_mode")
+    if hosting_mode not in (shared_nginx.MODE_ISOLATED, shared_nginx.MODE_SHARED):
+        return "Błąd: Nieznany tryb hostingu!", 400
+    return _job_response(jobs.submit('mode', site_name, {'hosting_mode': hosting_mode}, _idempotency_key()))
+
+
+@app.route("/restart/<site_name>", methods=["POST"])
+def restart(site_name):
+    if database.get_site(site_name) is None:
+        return "Błąd: Strona nie istnieje!", 404
+    return _job_response(jobs.submit('restart', site_name, idempotency_key=_idempotency_key()))
+
+
+@app.route("/resize/<site_name>", methods=["POST"])
+def resize(site_name):
+    """Zmienia limity CPU (%), RAM (MB) i dysku (MB) strony; pinned=0 oddaje CPU/RAM rebalancerowi"""
+    site = database.get_site_with_limits(site_name)
+    if site is None:
+        return "Błąd: Strona nie istnieje!", 404
+    try:
+        limits = {
+            'cpu_limit': int(request.form.get("cpu_limit", site['cpu_limit'] or 50)),
+            'ram_limit_mb': int(request.form.get("ram_limit_mb", site['ram_limit_mb'] or 512)),
+            'disk_limit_mb': int(request.form.get("disk_limit_mb", site['disk_limit_mb'] or DEFAULT_DISK_LIMIT_MB)),
+            'pinned': request.form.get("pinned", "1") != "0",
+        }
+    except ValueError:
+        return "Błąd: Limity muszą być liczbami!", 400
+    if not (1 <= limits['cpu_limit'] <= 400 and limits['ram_limit_mb'] >= 16 and limits['disk_limit_mb'] >= 1):
+        return "Błąd: Niepoprawne limity!", 400
+    return _job_response(jobs.submit('resize', site_name, limits, _idempotency_key()))
 
 
 @app.route("/delete/<site_name>", methods=["POST"])
 def delete(site_name):
-    docker_manager.stop_container(site_name)
+    # Węzeł w zadaniu - ponowienie nie znajdzie już strony w bazie
+    site = database.get_site(site_name)
+    payload = {'node': site['node']} if site is not None else {}
+    return _job_response(jobs.submit('delete', site_name, payload, _idempotency_key()))
+
+
+@app.route("/nodes", methods=["GET", "POST"])
+def nodes():
+    """Węzły Dockera (JSON): lista z zajętością lub rejestracja nowego węzła"""
+    if request.method == "POST":
+        data = request.get_json(silent=True) or request.form
+        name = (data.get("name") or "").strip().lower()
+        docker_url = (data.get("docker_url") or "").strip()
+        if not name.isalnum() or not docker_url:
+            return jsonify({'error': "Wymagane: name (litery i cyfry) i docker_url"}), 400
+        try:
+            cpu_capacity = int(data["cpu_capacity"]) if data.get("cpu_capacity") else None
+            ram_capacity_mb = int(data["ram_capacity_mb"]) if data.get("ram_capacity_mb") else None
+        except ValueError:
+            return jsonify({'error': "Pojemność musi być liczbą"}), 400
+        if database.add_node(name, docker_url, cpu_capacity, ram_capacity_mb) is None:
+            return jsonify({'error': f"Węzeł {name} już istnieje"}), 409
+        return jsonify({'name': name}), 201
+    return jsonify(scheduler.get_status())
+
+
+@app.route("/nodes/<name>/status", methods=["POST"])
+def node_status(name):
+    """Włącza węzeł ('active') lub wyłącza go z przydziału nowych stron ('drain')"""
+    if database.get_node(name) is None:
+        abort(404)
+    data = request.get_json(silent=True) or request.form
+    status = data.get("status")
+    if status not in ('active', 'drain'):
+        return jsonify({'error': "Status: active lub drain"}), 400
+    database.set_node_status(name, status)
+    return jsonify({'name': name, 'status': status})
+
+
+@app.route("/networks")
+def network_list():
+    """Sieci stron (JSON): polityka, pula adresów, podsieci i obsada"""
+    return jsonify(networks.get_status(request.args.get("node")))
+
+
+@app.route("/backup/<site_name>", methods=["POST"])
+def backup_site(site_name):
+    """Zleca migawkę plików strony"""
+    if database.get_site(site_name) is None:
+        return "Błąd: Strona nie istnieje!", 404
+    return _job_response(jobs.submit('backup', site_name, idempotency_key=_idempotency_key()))
+
+
+@app.route("/restore/<site_name>", methods=["POST"])
+def restore_site(site_name):
+    """Odtwarza pliki strony z kopii (``backup_id`` lub ostatniej)"""
+    if database.get_site(site_name) is None:
+        return "Błąd: Strona nie istnieje!", 404
+    if deploy.is_pending(site_name):
+        return "Błąd: Wdrożenie tej strony już trwa!", 409
+    backup_id = request.form.get("backup_id", type=int)
+    return _job_response(jobs.submit('restore', site_name, {'backup_id': backup_id}, _idempotency_key()))
+
+
+@app.route("/backups/<site_name>")
+def list_backups(site_name):
+    """Kopie zapasowe strony (JSON)"""
+    site = database.get_site(site_name)
+    if site is None:
+        abort(404)
+    return jsonify([
+        {'id': row['id'], 'created_at': row['created_at'], 'size_mb': row['size_mb'], 'stored_mb': row['stored_mb']}
+        for row in database.list_backups(site['id'])
+    ])
+
+
+@app.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    """Stan zadania z kolejki (JSON)"""
+    job = jobs.get_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+
+# Zadania kolejki - muszą być idempotentne (po restarcie wykonują się ponownie)
+
+def _job_create(site_name, payload):
+    if database.get_site(site_name) is not None:
+        return {'created': False}
+    site_path = os.path.join(USER_DATA_DIR, site_name)
+    if not os.path.exists(site_path):
+        raise jobs.JobFailed("Katalog strony nie istnieje")
+    provision_site(
+        site_name, payload.get('hosting_mode', shared_nginx.MODE_ISOLATED), payload.get('node'),
+        payload.get('user_id')
+    )
+    return {'created': True}
+
+
+def _job_create_failed(site_name, payload, error):
+    """Ostatecznie nieudane zakładanie: zwalnia nazwę (katalog, kontener, sieć)"""
+    if database.get_site(site_name) is not None:
+        return
+    # Zakładanie z archiwum wybiera węzeł dopiero w zadaniu - zdradza go przydział sieci
+    assigned = database.get_site_network(site_name)
+    node = payload.get('node') or (assigned['node'] if assigned is not None else None)
+    if inventory.get_inventory(node).container(site_name) is not None:
+        docker_manager.stop_container(site_name, node=node)
+    else:
+        docker_manager.release_network(site_name, node=node)
+    shutil.rmtree(os.path.join(USER_DATA_DIR, site_name), ignore_errors=True)
+    disk_index.forget_site(site_name)
+    print(f"🧹 Zwolniono nazwę {site_name} po nieudanym zakładaniu")
+
+
+def _job_delete(site_name, payload):
+    site = database.get_site(site_name)
+    # Najpierw baza - zdarzenie "destroy" nie może odtworzyć usuwanej strony
     database.remove_site(site_name)
+    # Router budzenia usuniętej strony kierowałby jej domenę do panelu
+    idle.write_wake_routes()
+    if site is not None and site['hosting_mode'] == shared_nginx.MODE_SHARED:
+        shared_nginx.sync()
+    else:
+        docker_manager.stop_container(site_name, node=site['node'] if site is not None else payload.get('node'))
     shutil.rmtree(os.path.join(USER_DATA_DIR, site_name), ignore_errors=True)
-    return redirect(url_for("index"))
+    disk_index.forget_site(site_name)
+
+
+def _job_restart(site_name, payload):
+    site = database.get_site(site_name)
+    if site is None:
+        raise jobs.JobFailed("Strona nie istnieje")
+    if site['hosting_mode'] == shared_nginx.MODE_SHARED:
+        shared_nginx.reload()
+    elif idle.is_sleeping(site):
+        idle.wake_site(site_name)
+    else:
+        docker_manager.restart_container(site_name, node=site['node'])
+
+
+def _job_resize(site_name, payload):
+    site = database.get_site_with_limits(site_name)
+    if site is None:
+        raise jobs.JobFailed("Strona nie istnieje")
+    bandwidth = site['bandwidth_limit_mb'] if site['has_limits'] else 10240
+    database.set_resource_limits(
+        site['id'], cpu_limit=payload['cpu_limit'], ram_limit_mb=payload['ram_limit_mb'],
+        disk_limit_mb=payload['disk_limit_mb'], bandwidth_limit_mb=bandwidth,
+        pinned=payload.get('pinned', True)
+    )
+    if site['hosting_mode'] != shared_nginx.MODE_SHARED:
+        docker_manager.update_limits(site_name, payload['cpu_limit'], payload['ram_limit_mb'], node=site['node'])
+    return payload
+
+
+def _job_mode(site_name, payload):
+    site = database.get_site_with_limits(site_name)
+    if site is None:
+        raise jobs.JobFailed("Strona nie istnieje")
+    hosting_mode = payload['hosting_mode']
+    if hosting_mode == site['hosting_mode']:
+        return {'changed': False}
+    if hosting_mode == shared_nginx.MODE_SHARED:
+        try:
+            shared_nginx.move_to_shared(site_name)
+        except ValueError as e:
+            raise jobs.JobFailed(str(e))
+    else:
+        cpu_limit = site['cpu_limit'] if site['has_limits'] else 50
+        ram_limit = site['ram_limit_mb'] if site['has_limits'] else 512
+        shared_nginx.move_to_isolated(site_name, cpu_limit=cpu_limit, ram_limit_mb=ram_limit)
+    return {'changed': True}
+
+
+def _job_backup(site_name, payload):
+    site = database.get_site(site_name)
+    if site is None:
+        raise jobs.JobFailed("Strona nie istnieje")
+    try:
+        summary = backup.backup_site(site_name, USER_DATA_DIR)
+    except ValueError as e:
+        raise jobs.JobFailed(str(e))
+    # Strona mogła zostać usunięta w trakcie - jej migawki usunie collect()
+    backup.prune_site(site['id'])
+    return summary
+
+
+def _job_reload(site_name, payload):
+    if database.get_site(site_name) is None:
+        raise jobs.JobFailed("Strona nie istnieje")
+    reload_site_files(site_name)
+
+
+def _job_restore(site_name, payload):
+    try:
+        result = backup.restore_site(site_name, USER_DATA_DIR, payload.get('backup_id'))
+    except ValueError as e:
+        raise jobs.JobFailed(str(e))
+    reload_site_files(site_name)
+    return result
+
+
+jobs.register('create', _job_create, on_failure=_job_create_failed)
+jobs.register('delete', _job_delete)
+jobs.register('restart', _job_restart)
+jobs.register('resize', _job_resize)
+jobs.register('mode', _job_mode)
+jobs.register('backup', _job_backup)
+jobs.register('restore', _job_restore)
+jobs.register('reload', _job_reload)
 
 
 @app.route("/database")
 def view_database():
     """Strona szczegółowych informacji o stronach"""
-    docker_client = docker.from_env()
     sites = database.get_all_sites()
+    states = events.get_site_states(sites)
     
     sites_info = []
     for site in sites:
         site_name = site['name']
-        site_path = os.path.join(USER_DATA_DIR, site_name)
         
         container_info = {
             'id': 'N/A',
             'status': 'Nie uruchomiony',
             'ip': 'N/A'
         }
-        try:
-            container = docker_client.containers.get(site_name)
+        state = states.get(site_name)
+        if state is not None:
             container_info = {
-                'id': container.short_id,
-                'status': container.status,
-                'ip': container.attrs['NetworkSettings']['Networks'].get('hosting-project_default', {}).get('IPAddress', 'N/A')
+                'id': state['id'],
+                'status': state['status'],
+                'ip': state['ip'] or 'N/A'
             }
-        except:
-            pass
-        
-        file_types = {}
-        total_size = 0
-        file_count = 0
-        
-        if os.path.exists(site_path):
-            for root, dirs, files in os.walk(site_path):
-                for file in files:
-                    file_count += 1
-                    file_path = os.path.join(root, file)
-                    try:
-                        file_size = os.path.getsize(file_path)
-                        total_size += file_size
-                        ext = os.path.splitext(file)[1].lower() or 'bez rozszerzenia'
-                        file_types[ext] = file_types.get(ext, 0) + 1
-                    except:
-                        pass
-        
-        top_types = sorted(file_types.items(), key=lambda x: x[1], reverse=True)[:5]
         
         sites_info.append({
             'name': site_name,
@@ -177,11 +585,7 @@ def view_database():
             'created_at': site['created_at'] if 'created_at' in site.keys() else 'N/A',
             'owner': site['user_id'] if site['user_id'] else 'System',
             'container': container_info,
-            'file_stats': {
-                'count': file_count,
-                'size_mb': round(total_size / (1024*1024), 2),
-                'types': top_types
-            }
+            'file_stats': disk_index.get_stats(site_name)
         })
     
     return render_template("database.html", sites_info=sites_info)
@@ -190,9 +594,64 @@ def view_database():
 @app.route("/metrics")
 def view_metrics():
     """Strona monitoringu metryk"""
-    sites_metrics = metrics_module.get_all_sites_metrics()
+    sites_metrics = metrics_sampler.get_latest_metrics()
     return render_template("metrics.html", sites_metrics=sites_metrics)
 
 
+@app.route("/metrics/prometheus")
+def metrics_prometheus():
+    """Metryki w formacie Prometheus - z pamięci procesu, bez wywołań Dockera"""
+    body = instrumentation.render(metrics_sampler.get_latest_metrics())
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route("/metrics/history/<site_name>")
+def metrics_history(site_name):
+    """Historia metryk strony (JSON).
+
+    Bez parametrów - bufor próbnika; z ``?range=<sekundy>`` - historia z bazy
+    (opcjonalnie ``&tier=metrics_1h`` itd.).
+    """
+    range_seconds = request.args.get("range", type=int)
+    if range_seconds:
+        site = database.get_site(site_name)
+        if site is None:
+            abort(404)
+        try:
+            tier, rows = database.get_metrics_history(
+                site['id'], time.time() - range_seconds, tier=request.args.get("tier")
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({
+            'site': site_name,
+            'tier': tier,
+            'samples': [dict(row) for row in rows],
+        })
+
+    history = metrics_sampler.get_site_history(site_name)
+    if history is None:
+        abort(404)
+    return jsonify({
+        'site': site_name,
+        'interval': metrics_sampler.SAMPLE_INTERVAL,
+        'samples': history,
+    })
+
+
+@app.route("/healthz")
+def healthz():
+    """Stan procesu: czy jest liderem i ile trwał jego start (JSON)"""
+    return jsonify({
+        'pid': os.getpid(),
+        'leader': leader.is_leader(),
+        'pending_steps': leader.get_pending_steps(),
+        'startup': instrumentation.get_startup(),
+    })
+
+
 if __name__ == "__main__":
+    # Tryb deweloperski: jeden proces robi wszystko (produkcyjnie - wsgi.py)
+    init_worker()
+    leader.start_election(start_control_plane)
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,236 @@
+"""Uzgadnianie kontenerów stron z bazą przy starcie panelu."""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+
+from core_engine import docker_client
+from core_engine import docker_manager
+from core_engine import events
+from core_engine import idle
+from core_engine import inventory
+from core_engine import networks
+from web_panel import database
+
+# Ile stron uzgadniamy równolegle
+AUTOSTART_WORKERS = int(os.environ.get("AUTOSTART_WORKERS", "8"))
+# Czy uzgadniać w tle, żeby Flask od razu obsługiwał żądania
+AUTOSTART_BACKGROUND = os.environ.get("AUTOSTART_BACKGROUND", "0") == "1"
+# Ile najwolniejszych stron pokazać w raporcie
+REPORT_TOP = int(os.environ.get("AUTOSTART_REPORT_TOP", "20"))
+
+
+class _Timing:
+    """Czasy poszczególnych etapów uzgadniania jednej strony."""
+
+    def __init__(self, site_name):
+        self.site_name = site_name
+        self.phases = {}
+        self.action = None
+        self.total = 0.0
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+
+class _Phase:
+    def __init__(self, timing, name):
+        self.timing = timing
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.monotonic()
+
+    def __exit__(self, *exc):
+        elapsed = time.monotonic() - self.started
+        self.timing.phases[self.name] = self.timing.phases.get(self.name, 0.0) + elapsed
+        return False
+
+
+def connect_traefik_networks(inv, sites, executor):
+    """Etap zbiorczy: podłącza Traefik do brakujących sieci stron (każdej sieci raz) i zakłada reguły zapory."""
+    traefik = inv.traefik()
+    if traefik is None:
+        print("⚠️  Nie udało się podłączyć Traefik: brak kontenera traefik_proxy")
+        return
+
+    assigned = networks.site_network_names(inv.node)
+    names = set()
+    for site in sites:
+        name = assigned.get(site['name'])
+        if name is None:
+            # Strona sprzed zapisu przydziałów - sieć z etykiety kontenera (np. z puli gotowych)
+            container = inv.container(site['name'])
+            name = docker_manager.label_network(container) if container is not None else None
+            name = name or f"{site['name']}{inventory.NETWORK_SUFFIX}"
+            # Zapis w bazie - odtworzony kontener wróci do tej samej sieci, a nie do nowej
+            networks.adopt(site['name'], inv.node, name)
+        names.add(name)
+    site_networks = [inv.network(name) for name in sorted(names) if inv.network(name) is not None]
+
+    def connect(network):
+        address = None
+        if not inv.traefik_attached(network.name):
+            try:
+                address = docker_manager.attach_traefik(network, traefik)
+                inv.mark_traefik_attached(network.name)
+                print(f"🔗 Traefik podłączony do {network.name}")
+            except docker.errors.APIError as e:
+                if "already exists" not in str(e):
+                    return
+                inv.mark_traefik_attached(network.name)
+        # Reguły zapory nie przetrwają restartu hosta - zakładamy je przy każdym starcie
+        try:
+            docker_manager.ensure_firewall(network, node=inv.node, address=address)
+        except Exception as e:
+            print(f"⚠️  Brak reguły zapory dla {network.name}: {e}")
+
+    list(executor.map(connect, site_networks))
+
+
+def reconcile_site(inv, site):
+    """Uruchamia lub tworzy kontener jednej strony i mierzy czas etapów.
+
+    ``site`` to wiersz z ``database.get_all_sites_with_limits``.
+    """
+    site_name = site['name']
+    timing = _Timing(site_name)
+    started = time.monotonic()
+
+    cpu_limit = site['cpu_limit'] if site['has_limits'] else 50
+    ram_limit = site['ram_limit_mb'] if site['has_limits'] else 512
+
+    with timing.phase('lookup'):
+        container = inv.container(site_name)
+
+    try:
+        if container is None:
+            print(f"🆕 Tworzę nowy kontener dla {site_name} (CPU: {cpu_limit}%, RAM: {ram_limit}MB)...")
+            with timing.phase('create'):
+                container = docker_manager.start_container(
+                    site_name, cpu_limit=cpu_limit, ram_limit_mb=ram_limit, node=site['node']
+                )
+            if container:
+                with timing.phase('db'):
+                    database.set_container_id(site_name, container.short_id)
+                    # Nowy kontener działa - strona nie jest już uśpiona
+                    if idle.is_sleeping(site):
+                        idle.mark_awake(site_name)
+                timing.action = 'created'
+            else:
+                timing.action = 'error'
+        elif idle.is_sleeping(site):
+            timing.action = 'sleeping'
+        elif container.status != 'running':
+            print(f"▶️  Uruchamiam zatrzymany kontener {site_name}...")
+            with timing.phase('start'):
+                container.start()
+            timing.action = 'started'
+        else:
+            print(f"✅ Kontener {site_name} już działa")
+            timing.action = 'running'
+    except Exception as e:
+        print(f"❌ Błąd uruchamiania {site_name}: {e}")
+        timing.action = 'error'
+
+    timing.total = time.monotonic() - started
+    return timing
+
+
+def print_report(timings, traefik_time, wall_time):
+    """Wypisuje raport czasu startu: etapy łącznie i najwolniejsze strony."""
+    print(f"⏱️  Uzgadnianie {len(timings)} stron: {wall_time:.2f}s "
+          f"(Traefik: {traefik_time:.2f}s)")
+    if not timings:
+        return
+
+    phase_totals = {}
+    actions = {}
+    for timing in timings:
+        actions[timing.action] = actions.get(timing.action, 0) + 1
+        for name, elapsed in timing.phases.items():
+            phase_totals[name] = phase_totals.get(name, 0.0) + elapsed
+
+    print("   Akcje: " + ", ".join(f"{a}={n}" for a, n in sorted(actions.items())))
+    print("   Etapy (suma): " + ", ".join(
+        f"{name}={elapsed:.2f}s" for name, elapsed in sorted(phase_totals.items(), key=lambda x: -x[1])
+    ))
+
+    slowest = sorted(timings, key=lambda t: t.total, reverse=True)[:REPORT_TOP]
+    print(f"   Najwolniejsze strony (top {len(slowest)}):")
+    for timing in slowest:
+        phases = " ".join(f"{name}={elapsed:.2f}s" for name, elapsed in timing.phases.items())
+        print(f"   {timing.site_name:<24} {timing.total:6.2f}s  [{timing.action}] {phases}")
+
+
+def _run(workers):
+    started = time.monotonic()
+    # Strony współdzielone nie mają własnych kontenerów
+    by_node = {}
+    for site in database.get_all_sites_with_limits():
+        if site['hosting_mode'] != 'shared':
+            by_node.setdefault(site['node'], []).append(site)
+
+    timings = []
+    traefik_time = 0.0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="autostart") as executor:
+        for node, sites in by_node.items():
+            try:
+                inv = inventory.get_inventory(node)
+                inv.refresh()
+            except Exception as e:
+                print(f"❌ Węzeł {node} niedostępny ({len(sites)} stron): {e}")
+                continue
+
+            # Najpierw łączymy Traefik węzła ze wszystkimi izolowanymi sieciami
+            traefik_started = time.monotonic()
+            connect_traefik_networks(inv, sites, executor)
+            traefik_time += time.monotonic() - traefik_started
+
+            timings.extend(executor.map(lambda site: reconcile_site(inv, site), sites))
+
+    print_report(timings, traefik_time, time.monotonic() - started)
+    return timings
+
+
+def autostart_sites(workers=None, background=None):
+    """Automatycznie uruchamia wszystkie strony z bazy przy starcie panelu.
+
+    Przy ``background=True`` praca trwa w osobnym wątku, który jest zwracany.
+    """
+    workers = workers or AUTOSTART_WORKERS
+    background = AUTOSTART_BACKGROUND if background is None else background
+
+    print("🔄 Sprawdzam kontenery stron...")
+    if not background:
+        return _run(workers)
+
+    thread = threading.Thread(target=_run, args=(workers,), name="autostart", daemon=True)
+    thread.start()
+    return thread
+
+
+def watch_events():
+    """Reaguje na zdarzenia Dockera zamiast czekać na kolejne uzgadnianie.
+
+    Kontener strony usunięty poza panelem jest od razu odtwarzany, a zabicia
+    przez OOM są zgłaszane w logu.
+    """
+    def on_destroy(name, state, event):
+        site = database.get_site_with_limits(name)
+        # Nasłuch obejmuje lokalny demon - kontener o tej nazwie na innym węźle to nie ta strona
+        if site is None or site['hosting_mode'] == 'shared' or site['node'] != docker_client.LOCAL_NODE:
+            return
+        print(f"♻️  Kontener {name} został usunięty - odtwarzam")
+        threading.Thread(
+            target=reconcile_site, args=(inventory.get_inventory(site['node']), site),
+            name=f"reconcile-{name}", daemon=True
+        ).start()
+
+    def on_oom(name, state, event):
+        print(f"💥 Kontener {name} zabity przez OOM (łącznie: {state['oom_kills']})")
+
+    events.subscribe('destroy', on_destroy)
+    events.subscribe('oom', on_oom)
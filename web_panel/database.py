@@ -1,17 +1,126 @@
 import sqlite3
 import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
 
-DB_PATH = '/app/database' 
+from core_engine import instrumentation
+
+DB_PATH = os.environ.get("DB_PATH", "/app/database")
 DB_NAME = os.path.join(DB_PATH, "hosting.db")
 
+# Poziomy szeregów czasowych metryk: (tabela, szerokość kubełka w s, retencja w s)
+METRICS_TIERS = [
+    ('metrics_raw', 0, int(os.environ.get("METRICS_RETENTION_RAW", str(24 * 3600)))),
+    ('metrics_1m', 60, int(os.environ.get("METRICS_RETENTION_1M", str(7 * 24 * 3600)))),
+    ('metrics_1h', 3600, int(os.environ.get("METRICS_RETENTION_1H", str(90 * 24 * 3600)))),
+    ('metrics_1d', 86400, int(os.environ.get("METRICS_RETENTION_1D", str(730 * 24 * 3600)))),
+]
+# Ile wierszy usuwamy w jednym kroku czyszczenia (krótkie blokady zapisu)
+METRICS_PRUNE_BATCH = int(os.environ.get("METRICS_PRUNE_BATCH", "5000"))
+# Ile ms czekamy na zwolnienie blokady zapisu przez inny wątek / proces
+BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+# Ile przygotowanych zapytań pamięta każde połączenie
+STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "256"))
 
-def get_connection():
-    """Tworzy połączenie z bazą danych."""
-    conn = sqlite3.connect(DB_NAME)
+
+_local = threading.local()
+
+
+def get_data_version():
+    """Bieżąca wersja danych stron; rośnie przy każdej zmianie strony lub limitów.
+
+    Wersja leży w bazie (tabela ``data_version``), więc wszystkie procesy panelu
+    widzą tę samą wartość (klucz pamięci podręcznej i ETag API). Wiersz czytamy
+    ponownie tylko wtedy, gdy ``PRAGMA data_version`` pokaże zapis innego połączenia.
+    """
+    conn = get_connection()
+    marker = conn.execute("PRAGMA data_version").fetchone()[0]
+    cached = getattr(_local, 'data_version', None)
+    if cached is not None and cached[0] is conn and cached[1] == marker:
+        return cached[2]
+    version = conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()[0]
+    _local.data_version = (conn, marker, version)
+    return version
+
+
+def bump_data_version():
+    """Oznacza dane stron jako zmienione (unieważnia odpowiedzi API we wszystkich procesach).
+
+    Wywoływane w transakcji zapisu zmiany - wersja rośnie razem z nią albo wcale.
+    """
+    conn = get_connection()
+    conn.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+    # Własne zapisy nie zmieniają PRAGMA data_version tego połączenia
+    _local.data_version = None
+
+
+def _connect():
+    """Tworzy nowe, skonfigurowane połączenie z bazą danych."""
+    conn = sqlite3.connect(
+        DB_NAME,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        # Autocommit - transakcje otwieramy jawnie przez transaction()
+        isolation_level=None,
+    )
     conn.row_factory = sqlite3.Row
+    # WAL: zapisy (np. próbnika metryk) nie blokują odczytów panelu
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def get_connection():
+    """Zwraca połączenie z bazą przypisane do bieżącego wątku.
+
+    Połączenie jest tworzone raz na wątek i używane ponownie, razem z jego
+    pamięcią podręczną przygotowanych zapytań - nie należy go zamykać.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.db_name != DB_NAME:
+        conn = _local.conn = _connect()
+        _local.db_name = DB_NAME
     return conn
 
 
+def close_connection():
+    """Zamyka połączenie bieżącego wątku (np. przy kończeniu wątku)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+@contextmanager
+def transaction():
+    """Jawna transakcja zapisu; zagnieżdżone wywołania dołączają do zewnętrznej.
+
+    BEGIN IMMEDIATE od razu bierze blokadę zapisu, więc równoległy zapis
+    czeka najwyżej ``busy_timeout`` zamiast kończyć się błędem w połowie.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _add_column(cursor, table, column, definition):
+    """Dodaje kolumnę do istniejącej tabeli (bazy utworzone starszą wersją)."""
+    columns = {row['name'] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
 def init_db():
     """Tworzy tabele jeśli nie istnieją."""
     if not os.path.exists(DB_PATH):
@@ -44,11 +153,59 @@ def init_db():
             user_id INTEGER,
             site_type TEXT DEFAULT 'static',
             status TEXT DEFAULT 'active',
+            hosting_mode TEXT DEFAULT 'isolated',
+            node TEXT DEFAULT 'local',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users(id)
         )
         """
     )
+    _add_column(cursor, 'sites', 'hosting_mode', "TEXT DEFAULT 'isolated'")
+    _add_column(cursor, 'sites', 'node', "TEXT DEFAULT 'local'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sites_domain ON sites (domain)")
+
+    # Hosty Docker, na których uruchamiane są kontenery stron (docker_url NULL - lokalny)
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS nodes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            docker_url TEXT,
+            cpu_capacity INTEGER,
+            ram_capacity_mb INTEGER,
+            status TEXT DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cursor.execute("INSERT OR IGNORE INTO nodes (name) VALUES ('local')")
+
+    # Sieci stron: dedykowane (tenant NULL, jedna strona) lub współdzielone przez strony jednego tenanta
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS networks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            node TEXT NOT NULL DEFAULT 'local',
+            name TEXT NOT NULL,
+            subnet TEXT,
+            tenant TEXT,
+            capacity INTEGER NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (node, name)
+        )
+        """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_networks_tenant ON networks (node, tenant)")
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS network_assignments (
+            site_name TEXT PRIMARY KEY,
+            network_id INTEGER NOT NULL,
+            assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_network_assignments_network ON network_assignments (network_id)")
 
     cursor.execute(
         """
@@ -63,6 +220,8 @@ def init_db():
         )
         """
     )
+    # Limity ustawione ręcznie (/resize) - rebalancer ich nie zmienia
+    _add_column(cursor, 'resource_limits', 'pinned', "INTEGER DEFAULT 0")
 
     cursor.execute(
         """
@@ -71,11 +230,15 @@ def init_db():
             site_id INTEGER NOT NULL,
             backup_path TEXT NOT NULL,
             size_mb REAL,
+            stored_mb REAL DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (site_id) REFERENCES sites(id) ON DELETE CASCADE
         )
         """
     )
+    # stored_mb - nowe (niezdeduplikowane) fragmenty zapisane przez migawkę
+    _add_column(cursor, 'backups', 'stored_mb', "REAL DEFAULT 0")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_backups_site ON backups (site_id, id)")
 
     cursor.execute(
         """
@@ -88,6 +251,144 @@ def init_db():
         """
     )
 
+    # Szeregi czasowe metryk: klucz (site_id, ts) bez rowid, więc zapytanie
+    # o zakres czasu jednej strony czyta tylko ciągły fragment B-drzewa
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS metrics_raw (
+            site_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            cpu_percent REAL,
+            ram_usage_mb REAL,
+            network_rx_mb REAL,
+            network_tx_mb REAL,
+            disk_usage_mb REAL,
+            PRIMARY KEY (site_id, ts)
+        ) WITHOUT ROWID
+        """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_metrics_raw_ts ON metrics_raw (ts)")
+
+    for table, _, _ in METRICS_TIERS[1:]:
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                site_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                cpu_percent REAL,
+                cpu_max REAL,
+                ram_usage_mb REAL,
+                ram_max REAL,
+                network_rx_mb REAL,
+                network_tx_mb REAL,
+                disk_usage_mb REAL,
+                samples INTEGER NOT NULL,
+                PRIMARY KEY (site_id, ts)
+            ) WITHOUT ROWID
+            """
+        )
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (ts)")
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS disk_index (
+            site_name TEXT PRIMARY KEY,
+            file_count INTEGER NOT NULL,
+            total_bytes INTEGER NOT NULL,
+            types TEXT NOT NULL,
+            dirs TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS metrics_rollup_state (
+            tier TEXT PRIMARY KEY,
+            watermark INTEGER NOT NULL
+        )
+        """
+    )
+
+    # Kolejka zadań (zakładanie, usuwanie, restart, zmiana limitów stron)
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            site_name TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            idempotency_key TEXT UNIQUE,
+            result TEXT,
+            error TEXT,
+            run_after REAL NOT NULL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+        """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, run_after)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_site ON jobs (site_name, status)")
+
+    # Decyzje rebalancera limitów CPU/RAM
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rebalance_decisions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts REAL NOT NULL,
+            site_id INTEGER NOT NULL,
+            plan TEXT,
+            cpu_usage REAL,
+            cpu_old INTEGER,
+            cpu_new INTEGER,
+            ram_usage_mb REAL,
+            ram_old INTEGER,
+            ram_new INTEGER,
+            applied INTEGER NOT NULL,
+            reason TEXT
+        )
+        """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rebalance_site ON rebalance_decisions (site_id, ts)")
+
+    # Stan wdrożeń archiwów - widoczny dla wszystkich procesów panelu
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS deploys (
+            id TEXT PRIMARY KEY,
+            site_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            files_total INTEGER NOT NULL DEFAULT 0,
+            files_done INTEGER NOT NULL DEFAULT 0,
+            bytes_written INTEGER NOT NULL DEFAULT 0,
+            bytes_limit INTEGER NOT NULL,
+            error TEXT,
+            job_id INTEGER,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+        """
+    )
+    _add_column(cursor, 'deploys', 'idempotency_key', "TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deploys_site ON deploys (site_name, finished_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deploys_key ON deploys (idempotency_key)")
+
+    # Wersja danych stron wspólna dla wszystkich procesów panelu (ETag i pamięć podręczna API)
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        """
+    )
+    cursor.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+
     site_types_data = [
         ('static', 'Static HTML/CSS/JS hosting', 'nginx:alpine'),
         ('php', 'PHP hosting with Apache', 'php:8.2-apache'),
@@ -101,44 +402,305 @@ def init_db():
             site_type
         )
 
-    conn.commit()
-    conn.close()
     print("✅ Baza danych zainicjowana (hosting.db)")
 
 
-def add_site(name, container_id, domain, user_id=None, site_type='static'):
+def add_site(name, container_id, domain, user_id=None, site_type='static', hosting_mode='isolated', node='local'):
     """Dodaje nową stronę do bazy."""
-    conn = get_connection()
     try:
-        cursor = conn.execute(
-            "INSERT INTO sites (name, container_id, domain, user_id, site_type) VALUES (?, ?, ?, ?, ?)",
-            (name, container_id, domain, user_id, site_type),
-        )
-        conn.commit()
-        site_id = cursor.lastrowid
-        set_resource_limits(site_id)
+        with transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO sites (name, container_id, domain, user_id, site_type, hosting_mode, node) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, container_id, domain, user_id, site_type, hosting_mode, node),
+            )
+            site_id = cursor.lastrowid
+            set_resource_limits(site_id)
+            bump_data_version()
         return site_id
     except sqlite3.IntegrityError:
         print(f"⚠️ Strona {name} już istnieje w bazie")
         return None
-    finally:
-        conn.close()
 
 
 def get_all_sites():
     """Zwraca listę wszystkich stron."""
     conn = get_connection()
     sites = conn.execute("SELECT * FROM sites").fetchall()
-    conn.close()
     return sites
 
 
+# Strony razem z limitami i planem właściciela; has_limits = 0, gdy strona nie ma wiersza limitów
+SITES_WITH_LIMITS_QUERY = """
+    SELECT s.*,
+           rl.cpu_limit, rl.ram_limit_mb, rl.disk_limit_mb, rl.bandwidth_limit_mb,
+           rl.id IS NOT NULL AS has_limits,
+           COALESCE(rl.pinned, 0) AS pinned,
+           COALESCE(u.plan, 'free') AS plan
+    FROM sites s
+    LEFT JOIN resource_limits rl ON rl.site_id = s.id
+    LEFT JOIN users u ON u.id = s.user_id
+"""
+
+
+def get_all_sites_with_limits():
+    """Zwraca wszystkie strony razem z limitami zasobów jednym zapytaniem."""
+    conn = get_connection()
+    return conn.execute(SITES_WITH_LIMITS_QUERY + " ORDER BY s.id").fetchall()
+
+
+def get_sites_with_limits_page(after_id=0, limit=500):
+    """Strona wyników (keyset): strony z ``id > after_id``, najwyżej ``limit``."""
+    conn = get_connection()
+    return conn.execute(
+        SITES_WITH_LIMITS_QUERY + " WHERE s.id > ? ORDER BY s.id LIMIT ?",
+        (after_id, limit)
+    ).fetchall()
+
+
+def iter_sites_with_limits(page_size=500):
+    """Iteruje po wszystkich stronach z limitami, pobierając je porcjami."""
+    after_id = 0
+    while True:
+        page = get_sites_with_limits_page(after_id, page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        after_id = page[-1]['id']
+
+
+def get_site_with_limits(name):
+    """Pobiera stronę po nazwie razem z limitami zasobów."""
+    conn = get_connection()
+    return conn.execute(SITES_WITH_LIMITS_QUERY + " WHERE s.name = ?", (name,)).fetchone()
+
+
+def get_site(name):
+    """Pobiera stronę po nazwie."""
+    conn = get_connection()
+    site = conn.execute("SELECT * FROM sites WHERE name = ?", (name,)).fetchone()
+    return site
+
+
+def set_container_id(name, container_id):
+    """Aktualizuje ID kontenera strony."""
+    with transaction() as conn:
+        conn.execute("UPDATE sites SET container_id = ? WHERE name = ?", (container_id, name))
+        bump_data_version()
+
+
+def get_sites_by_mode(hosting_mode):
+    """Strony obsługiwane w danym trybie ('isolated' lub 'shared')."""
+    conn = get_connection()
+    return conn.execute(
+        "SELECT * FROM sites WHERE hosting_mode = ? ORDER BY id", (hosting_mode,)
+    ).fetchall()
+
+
+def set_hosting_mode(name, hosting_mode):
+    """Zmienia tryb obsługi strony."""
+    with transaction() as conn:
+        conn.execute("UPDATE sites SET hosting_mode = ? WHERE name = ?", (hosting_mode, name))
+        bump_data_version()
+
+
+def get_sites_by_status(status, hosting_mode=None):
+    """Strony o danym statusie (np. 'sleeping'), opcjonalnie tylko w danym trybie."""
+    conn = get_connection()
+    if hosting_mode is None:
+        return conn.execute("SELECT * FROM sites WHERE status = ? ORDER BY id", (status,)).fetchall()
+    return conn.execute(
+        "SELECT * FROM sites WHERE status = ? AND hosting_mode = ? ORDER BY id", (status, hosting_mode)
+    ).fetchall()
+
+
+def get_site_by_domain(domain):
+    conn = get_connection()
+    return conn.execute("SELECT * FROM sites WHERE domain = ?", (domain,)).fetchone()
+
+
+def set_site_status(name, status):
+    """Zmienia status strony ('active', 'sleeping')."""
+    with transaction() as conn:
+        conn.execute("UPDATE sites SET status = ? WHERE name = ?", (status, name))
+        bump_data_version()
+
+
+def compare_and_set_site_status(name, expected, status):
+    """Zmienia status strony tylko z ``expected``; zwraca True, jeśli zmiana zaszła.
+
+    Usypianie (lider) i budzenie (dowolny worker) rozstrzygają wyścig w bazie.
+    """
+    with transaction() as conn:
+        changed = conn.execute(
+            "UPDATE sites SET status = ? WHERE name = ? AND status = ?", (status, name, expected)
+        ).rowcount == 1
+        if changed:
+            bump_data_version()
+    return changed
+
+
+def set_site_node(name, node):
+    """Przypisuje stronę do węzła Docker."""
+    with transaction() as conn:
+        conn.execute("UPDATE sites SET node = ? WHERE name = ?", (node, name))
+        bump_data_version()
+
+
+def add_node(name, docker_url, cpu_capacity=None, ram_capacity_mb=None):
+    """Rejestruje węzeł Docker; pojemność None - odczyt z ``docker info``."""
+    try:
+        with transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO nodes (name, docker_url, cpu_capacity, ram_capacity_mb) VALUES (?, ?, ?, ?)",
+                (name, docker_url, cpu_capacity, ram_capacity_mb),
+            )
+        return cursor.lastrowid
+    except sqlite3.IntegrityError:
+        print(f"⚠️ Węzeł {name} już istnieje w bazie")
+        return None
+
+
+def get_node(name):
+    conn = get_connection()
+    return conn.execute("SELECT * FROM nodes WHERE name = ?", (name,)).fetchone()
+
+
+def get_nodes(status=None):
+    """Węzły Docker (opcjonalnie tylko o danym statusie: 'active', 'drain')."""
+    conn = get_connection()
+    if status is None:
+        return conn.execute("SELECT * FROM nodes ORDER BY id").fetchall()
+    return conn.execute("SELECT * FROM nodes WHERE status = ? ORDER BY id", (status,)).fetchall()
+
+
+def set_node_status(name, status):
+    """Zmienia status węzła ('drain' - bez nowych stron)."""
+    conn = get_connection()
+    conn.execute("UPDATE nodes SET status = ? WHERE name = ?", (status, name))
+
+
+def add_network(node, name, subnet, tenant=None, capacity=1):
+    """Zapisuje sieć stron węzła; zwraca jej id."""
+    conn = get_connection()
+    cursor = conn.execute(
+        "INSERT INTO networks (node, name, subnet, tenant, capacity) VALUES (?, ?, ?, ?, ?)",
+        (node, name, subnet, tenant, capacity)
+    )
+    return cursor.lastrowid
+
+
+def get_network(network_id):
+    conn = get_connection()
+    return conn.execute("SELECT * FROM networks WHERE id = ?", (network_id,)).fetchone()
+
+
+def get_network_by_name(node, name):
+    conn = get_connection()
+    return conn.execute("SELECT * FROM networks WHERE node = ? AND name = ?", (node, name)).fetchone()
+
+
+def get_networks(node=None):
+    """Sieci stron (opcjonalnie jednego węzła) z liczbą przypisanych stron w ``used``."""
+    conn = get_connection()
+    query = """
+        SELECT n.*, COUNT(a.site_name) AS used
+        FROM networks n
+        LEFT JOIN network_assignments a ON a.network_id = n.id
+        {where}
+        GROUP BY n.id
+        ORDER BY n.id
+    """
+    if node is None:
+        return conn.execute(query.format(where="")).fetchall()
+    return conn.execute(query.format(where="WHERE n.node = ?"), (node,)).fetchall()
+
+
+def find_network_with_room(node, tenant):
+    """Najstarsza sieć tenanta na węźle, w której jest jeszcze miejsce, lub None."""
+    conn = get_connection()
+    return conn.execute(
+        """
+        SELECT n.*, COUNT(a.site_name) AS used
+        FROM networks n
+        LEFT JOIN network_assignments a ON a.network_id = n.id
+        WHERE n.node = ? AND n.tenant = ?
+        GROUP BY n.id
+        HAVING used < n.capacity
+        ORDER BY n.id
+        LIMIT 1
+        """,
+        (node, tenant)
+    ).fetchone()
+
+
+def set_network_subnet(network_id, subnet):
+    conn = get_connection()
+    conn.execute("UPDATE networks SET subnet = ? WHERE id = ?", (subnet, network_id))
+
+
+def delete_network(network_id):
+    conn = get_connection()
+    conn.execute("DELETE FROM networks WHERE id = ?", (network_id,))
+
+
+def assign_site_network(site_name, network_id):
+    """Przypisuje stronę do sieci (zastępuje poprzednie przypisanie)."""
+    conn = get_connection()
+    conn.execute(
+        "INSERT OR REPLACE INTO network_assignments (site_name, network_id) VALUES (?, ?)",
+        (site_name, network_id)
+    )
+
+
+def get_site_network(site_name):
+    """Sieć przypisana stronie (wiersz ``networks``) lub None."""
+    conn = get_connection()
+    return conn.execute(
+        """
+        SELECT n.* FROM network_assignments a
+        JOIN networks n ON n.id = a.network_id
+        WHERE a.site_name = ?
+        """,
+        (site_name,)
+    ).fetchone()
+
+
+def get_site_network_names(node=None):
+    """Nazwy sieci przypisanych stronom {strona: sieć} (opcjonalnie jednego węzła)."""
+    conn = get_connection()
+    query = "SELECT a.site_name, n.name FROM network_assignments a JOIN networks n ON n.id = a.network_id"
+    if node is None:
+        rows = conn.execute(query).fetchall()
+    else:
+        rows = conn.execute(query + " WHERE n.node = ?", (node,)).fetchall()
+    return {row['site_name']: row['name'] for row in rows}
+
+
+def release_site_network(site_name):
+    """Zwalnia przypisanie strony; zwraca wiersz jej sieci (z ``used`` po zwolnieniu) lub None."""
+    with transaction() as conn:
+        network = get_site_network(site_name)
+        if network is None:
+            return None
+        conn.execute("DELETE FROM network_assignments WHERE site_name = ?", (site_name,))
+        return conn.execute(
+            """
+            SELECT n.*, COUNT(a.site_name) AS used
+            FROM networks n
+            LEFT JOIN network_assignments a ON a.network_id = n.id
+            WHERE n.id = ?
+            GROUP BY n.id
+            """,
+            (network['id'],)
+        ).fetchone()
+
+
 def remove_site(name):
     """Usuwa stronę z bazy."""
-    conn = get_connection()
-    conn.execute("DELETE FROM sites WHERE name = ?", (name,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("DELETE FROM sites WHERE name = ?", (name,))
+        bump_data_version()
 
 
 def create_user(email, password_hash, name=None, plan='free'):
@@ -149,13 +711,10 @@ def create_user(email, password_hash, name=None, plan='free'):
             "INSERT INTO users (email, password_hash, name, plan) VALUES (?, ?, ?, ?)",
             (email, password_hash, name, plan)
         )
-        conn.commit()
         return cursor.lastrowid
     except sqlite3.IntegrityError:
         print(f"⚠️ Użytkownik z email {email} już istnieje")
         return None
-    finally:
-        conn.close()
 
 
 def get_user(user_id=None, email=None):
@@ -167,7 +726,6 @@ def get_user(user_id=None, email=None):
         user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
     else:
         user = None
-    conn.close()
     return user
 
 
@@ -175,7 +733,6 @@ def get_all_users():
     """Zwraca listę wszystkich użytkowników."""
     conn = get_connection()
     users = conn.execute("SELECT * FROM users").fetchall()
-    conn.close()
     return users
 
 
@@ -194,24 +751,51 @@ def update_user(user_id, **kwargs):
     if updates:
         values.append(user_id)
         query = f"UPDATE users SET {', '.join(updates)} WHERE id = ?"
-        conn.execute(query, values)
-        conn.commit()
-    conn.close()
+        with transaction():
+            conn.execute(query, values)
+            if 'plan' in kwargs:
+                bump_data_version()
 
 
 def delete_user(user_id):
     """Usuwa użytkownika."""
     conn = get_connection()
     conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
-    conn.commit()
-    conn.close()
 
 
-def set_resource_limits(site_id, cpu_limit=50, ram_limit_mb=512, disk_limit_mb=1024, bandwidth_limit_mb=10240):
-    """Ustawia limity zasobów dla strony."""
-    conn = get_connection()
-    try:
+def set_resource_limits(site_id, cpu_limit=50, ram_limit_mb=512, disk_limit_mb=1024, bandwidth_limit_mb=10240,
+                        pinned=None):
+    """Ustawia limity zasobów dla strony.
+
+    ``pinned`` przypina limity (rebalancer ich nie zmienia) lub je odpina;
+    None zostawia dotychczasowe ustawienie.
+    """
+    pinned = None if pinned is None else int(bool(pinned))
+    with transaction() as conn:
         conn.execute(
+            """
+            INSERT INTO resource_limits (site_id, cpu_limit, ram_limit_mb, disk_limit_mb, bandwidth_limit_mb, pinned)
+            VALUES (?, ?, ?, ?, ?, COALESCE(?, 0))
+            ON CONFLICT(site_id) DO UPDATE SET
+                cpu_limit = excluded.cpu_limit,
+                ram_limit_mb = excluded.ram_limit_mb,
+                disk_limit_mb = excluded.disk_limit_mb,
+                bandwidth_limit_mb = excluded.bandwidth_limit_mb,
+                pinned = COALESCE(?, resource_limits.pinned)
+            """,
+            (site_id, cpu_limit, ram_limit_mb, disk_limit_mb, bandwidth_limit_mb, pinned, pinned)
+        )
+        bump_data_version()
+
+
+def set_resource_limits_bulk(limits):
+    """Ustawia limity wielu stron w jednej transakcji.
+
+    ``limits`` to krotki (site_id, cpu_limit, ram_limit_mb, disk_limit_mb,
+    bandwidth_limit_mb).
+    """
+    with transaction() as conn:
+        conn.executemany(
             """
             INSERT INTO resource_limits (site_id, cpu_limit, ram_limit_mb, disk_limit_mb, bandwidth_limit_mb)
             VALUES (?, ?, ?, ?, ?)
@@ -221,31 +805,26 @@ def set_resource_limits(site_id, cpu_limit=50, ram_limit_mb=512, disk_limit_mb=1
                 disk_limit_mb = excluded.disk_limit_mb,
                 bandwidth_limit_mb = excluded.bandwidth_limit_mb
             """,
-            (site_id, cpu_limit, ram_limit_mb, disk_limit_mb, bandwidth_limit_mb)
+            limits
         )
-        conn.commit()
-    finally:
-        conn.close()
+        bump_data_version()
 
 
 def get_resource_limits(site_id):
     """Pobiera limity zasobów dla strony."""
     conn = get_connection()
     limits = conn.execute("SELECT * FROM resource_limits WHERE site_id = ?", (site_id,)).fetchone()
-    conn.close()
     return limits
 
 
-def create_backup(site_id, backup_path, size_mb=0):
+def create_backup(site_id, backup_path, size_mb=0, stored_mb=0):
     """Tworzy wpis o kopii zapasowej."""
     conn = get_connection()
     cursor = conn.execute(
-        "INSERT INTO backups (site_id, backup_path, size_mb) VALUES (?, ?, ?)",
-        (site_id, backup_path, size_mb)
+        "INSERT INTO backups (site_id, backup_path, size_mb, stored_mb) VALUES (?, ?, ?, ?)",
+        (site_id, backup_path, size_mb, stored_mb)
     )
-    conn.commit()
     backup_id = cursor.lastrowid
-    conn.close()
     return backup_id
 
 
@@ -253,26 +832,84 @@ def list_backups(site_id=None):
     """Zwraca listę kopii zapasowych."""
     conn = get_connection()
     if site_id:
-        backups = conn.execute("SELECT * FROM backups WHERE site_id = ? ORDER BY created_at DESC", (site_id,)).fetchall()
+        backups = conn.execute("SELECT * FROM backups WHERE site_id = ? ORDER BY created_at DESC, id DESC", (site_id,)).fetchall()
     else:
-        backups = conn.execute("SELECT * FROM backups ORDER BY created_at DESC").fetchall()
-    conn.close()
+        backups = conn.execute("SELECT * FROM backups ORDER BY created_at DESC, id DESC").fetchall()
     return backups
 
 
+def get_backup(backup_id):
+    conn = get_connection()
+    return conn.execute("SELECT * FROM backups WHERE id = ?", (backup_id,)).fetchone()
+
+
+def get_latest_backup(site_id):
+    """Ostatnia kopia zapasowa strony lub None."""
+    conn = get_connection()
+    return conn.execute(
+        "SELECT * FROM backups WHERE site_id = ? ORDER BY id DESC LIMIT 1", (site_id,)
+    ).fetchone()
+
+
+def get_orphaned_backups():
+    """Kopie usuniętych stron (klucze obce są wyłączone, więc ON DELETE CASCADE nie działa)."""
+    conn = get_connection()
+    return conn.execute(
+        "SELECT * FROM backups WHERE site_id NOT IN (SELECT id FROM sites) ORDER BY id"
+    ).fetchall()
+
+
 def delete_backup(backup_id):
     """Usuwa wpis o kopii zapasowej."""
     conn = get_connection()
     conn.execute("DELETE FROM backups WHERE id = ?", (backup_id,))
-    conn.commit()
-    conn.close()
+
+
+def save_deploy(deploy):
+    """Zapisuje stan wdrożenia (słownik jak ``DeployJob.to_dict``)."""
+    conn = get_connection()
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO deploys
+            (id, site_name, status, files_total, files_done, bytes_written, bytes_limit,
+             error, job_id, created_at, finished_at, idempotency_key)
+        VALUES (:id, :site, :status, :files_total, :files_done, :bytes_written, :bytes_limit,
+                :error, :job_id, :created_at, :finished_at, :idempotency_key)
+        """,
+        deploy
+    )
+
+
+def get_deploy(deploy_id):
+    conn = get_connection()
+    return conn.execute("SELECT * FROM deploys WHERE id = ?", (deploy_id,)).fetchone()
+
+
+def get_deploy_by_key(idempotency_key):
+    conn = get_connection()
+    return conn.execute(
+        "SELECT * FROM deploys WHERE idempotency_key = ? ORDER BY created_at DESC LIMIT 1", (idempotency_key,)
+    ).fetchone()
+
+
+def get_running_deploys(site_name, since):
+    """Niezakończone wdrożenia strony rozpoczęte po ``since``."""
+    conn = get_connection()
+    return conn.execute(
+        "SELECT * FROM deploys WHERE site_name = ? AND finished_at IS NULL AND created_at > ?",
+        (site_name, since)
+    ).fetchall()
+
+
+def prune_deploys(older_than):
+    conn = get_connection()
+    conn.execute("DELETE FROM deploys WHERE created_at < ?", (older_than,))
 
 
 def get_site_types():
     """Zwraca wszystkie dostępne typy hostingu."""
     conn = get_connection()
     types = conn.execute("SELECT * FROM site_types").fetchall()
-    conn.close()
     return types
 
 
@@ -280,5 +917,304 @@ def get_site_type(name):
     """Pobiera informacje o typie hostingu."""
     conn = get_connection()
     site_type = conn.execute("SELECT * FROM site_types WHERE name = ?", (name,)).fetchone()
-    conn.close()
-    return site_type
\ No newline at end of file
+    return site_type
+
+
+def save_disk_index(site_name, file_count, total_bytes, types_json, dirs_json):
+    """Zapisuje indeks zajętości dysku strony."""
+    conn = get_connection()
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO disk_index (site_name, file_count, total_bytes, types, dirs, updated_at)
+        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """,
+        (site_name, file_count, total_bytes, types_json, dirs_json)
+    )
+
+
+def load_disk_indexes():
+    """Zwraca zapisane indeksy zajętości dysku wszystkich stron."""
+    conn = get_connection()
+    return conn.execute("SELECT * FROM disk_index").fetchall()
+
+
+def get_disk_index_summaries():
+    """Podsumowania indeksów dysku (bez drzewa katalogów)."""
+    conn = get_connection()
+    return conn.execute("SELECT site_name, file_count, total_bytes, types FROM disk_index").fetchall()
+
+
+def delete_disk_index(site_name):
+    """Usuwa indeks zajętości dysku strony."""
+    conn = get_connection()
+    conn.execute("DELETE FROM disk_index WHERE site_name = ?", (site_name,))
+
+
+def enqueue_job(kind, site_name, payload='{}', idempotency_key=None, max_attempts=3):
+    """Dodaje zadanie do kolejki i zwraca jego wiersz.
+
+    Przy powtórzonym ``idempotency_key`` zwraca istniejące zadanie zamiast
+    dodawać nowe.
+    """
+    now = time.time()
+    with transaction() as conn:
+        if idempotency_key is not None:
+            job = conn.execute("SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+            if job is not None:
+                return job
+        cursor = conn.execute(
+            """
+            INSERT INTO jobs (kind, site_name, payload, idempotency_key, max_attempts, run_after, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (kind, site_name, payload, idempotency_key, max_attempts, now, now)
+        )
+        return conn.execute("SELECT * FROM jobs WHERE id = ?", (cursor.lastrowid,)).fetchone()
+
+
+def claim_job(now=None):
+    """Pobiera najstarsze gotowe zadanie i oznacza je jako 'running'.
+
+    Zadania jednej strony wykonywane są po kolei: bierzemy tylko najstarsze
+    oczekujące zadanie strony i tylko wtedy, gdy żadne inne dla niej nie trwa.
+    """
+    now = time.time() if now is None else now
+    with transaction() as conn:
+        job = conn.execute(
+            """
+            SELECT * FROM jobs j
+            WHERE j.status = 'queued' AND j.run_after <= ?
+              AND j.id = (SELECT MIN(id) FROM jobs WHERE site_name = j.site_name AND status = 'queued')
+              AND NOT EXISTS (SELECT 1 FROM jobs WHERE site_name = j.site_name AND status = 'running')
+            ORDER BY j.run_after, j.id
+            LIMIT 1
+            """,
+            (now,)
+        ).fetchone()
+        if job is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+            (now, job['id'])
+        )
+        return conn.execute("SELECT * FROM jobs WHERE id = ?", (job['id'],)).fetchone()
+
+
+def finish_job(job_id, result=None):
+    """Oznacza zadanie jako wykonane."""
+    conn = get_connection()
+    conn.execute(
+        "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ? WHERE id = ?",
+        (result, time.time(), job_id)
+    )
+
+
+def fail_job(job_id, error, retry_at=None):
+    """Zapisuje błąd zadania; przy ``retry_at`` zadanie wraca do kolejki."""
+    conn = get_connection()
+    if retry_at is not None:
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', error = ?, run_after = ? WHERE id = ?",
+            (error, retry_at, job_id)
+        )
+    else:
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+            (error, time.time(), job_id)
+        )
+
+
+def requeue_running_jobs():
+    """Przywraca do kolejki zadania przerwane restartem panelu."""
+    conn = get_connection()
+    return conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'").rowcount
+
+
+def get_job(job_id):
+    conn = get_connection()
+    return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def get_job_by_key(idempotency_key):
+    conn = get_connection()
+    return conn.execute("SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+
+
+def get_pending_jobs(site_name=None):
+    """Zadania oczekujące lub trwające (opcjonalnie tylko jednej strony)."""
+    conn = get_connection()
+    if site_name is None:
+        return conn.execute(
+            "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY id"
+        ).fetchall()
+    return conn.execute(
+        "SELECT * FROM jobs WHERE site_name = ? AND status IN ('queued', 'running') ORDER BY id",
+        (site_name,)
+    ).fetchall()
+
+
+def prune_jobs(older_than):
+    """Usuwa zakończone zadania starsze niż ``older_than`` (timestamp)."""
+    conn = get_connection()
+    return conn.execute(
+        "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (older_than,)
+    ).rowcount
+
+
+def insert_rebalance_decisions(rows):
+    """Zapisuje decyzje rebalancera.
+
+    ``rows`` to krotki (ts, site_id, plan, cpu_usage, cpu_old, cpu_new,
+    ram_usage_mb, ram_old, ram_new, applied, reason).
+    """
+    with transaction() as conn:
+        conn.executemany(
+            """
+            INSERT INTO rebalance_decisions
+                (ts, site_id, plan, cpu_usage, cpu_old, cpu_new, ram_usage_mb, ram_old, ram_new, applied, reason)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
+
+
+def get_rebalance_decisions(site_id=None, limit=100):
+    """Ostatnie decyzje rebalancera (opcjonalnie jednej strony), od najnowszej."""
+    conn = get_connection()
+    if site_id is None:
+        return conn.execute(
+            "SELECT * FROM rebalance_decisions ORDER BY ts DESC LIMIT ?", (limit,)
+        ).fetchall()
+    return conn.execute(
+        "SELECT * FROM rebalance_decisions WHERE site_id = ? ORDER BY ts DESC LIMIT ?",
+        (site_id, limit)
+    ).fetchall()
+
+
+def insert_metrics_batch(rows):
+    """Zapisuje paczkę próbek metryk jednym executemany.
+
+    ``rows`` to krotki (site_id, ts, cpu_percent, ram_usage_mb,
+    network_rx_mb, network_tx_mb, disk_usage_mb).
+    """
+    if not rows:
+        return
+    conn = get_connection()
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO metrics_raw
+            (site_id, ts, cpu_percent, ram_usage_mb, network_rx_mb, network_tx_mb, disk_usage_mb)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows
+    )
+
+
+def rollup_metrics():
+    """Przelicza agregaty 1m/1h/1d od ostatniego przetworzonego kubełka.
+
+    Ostatni (niepełny) kubełek każdego poziomu jest liczony ponownie przy
+    następnym wywołaniu, więc agregaty zawsze doganiają dane źródłowe.
+    """
+    for (source, _, _), (target, bucket, _) in zip(METRICS_TIERS, METRICS_TIERS[1:]):
+        with transaction() as conn:
+            row = conn.execute(
+                "SELECT watermark FROM metrics_rollup_state WHERE tier = ?", (target,)
+            ).fetchone()
+            watermark = row['watermark'] if row else 0
+
+            if source == 'metrics_raw':
+                aggregates = """
+                    AVG(cpu_percent), MAX(cpu_percent),
+                    AVG(ram_usage_mb), MAX(ram_usage_mb),
+                    MAX(network_rx_mb), MAX(network_tx_mb),
+                    AVG(disk_usage_mb), COUNT(*)
+                """
+            else:
+                aggregates = """
+                    SUM(cpu_percent * samples) / SUM(samples), MAX(cpu_max),
+                    SUM(ram_usage_mb * samples) / SUM(samples), MAX(ram_max),
+                    MAX(network_rx_mb), MAX(network_tx_mb),
+                    SUM(disk_usage_mb * samples) / SUM(samples), SUM(samples)
+                """
+
+            conn.execute(
+                f"""
+                INSERT OR REPLACE INTO {target}
+                    (site_id, ts, cpu_percent, cpu_max, ram_usage_mb, ram_max,
+                     network_rx_mb, network_tx_mb, disk_usage_mb, samples)
+                SELECT site_id, (ts / {bucket}) * {bucket} AS bucket, {aggregates}
+                FROM {source}
+                WHERE ts >= ?
+                GROUP BY site_id, bucket
+                """,
+                (watermark,)
+            )
+            latest = conn.execute(f"SELECT MAX(ts) AS ts FROM {source} WHERE ts >= ?", (watermark,)).fetchone()
+            if latest['ts'] is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO metrics_rollup_state (tier, watermark) VALUES (?, ?)",
+                    (target, (latest['ts'] // bucket) * bucket)
+                )
+
+
+def prune_metrics(now=None, batch_size=METRICS_PRUNE_BATCH):
+    """Usuwa przeterminowane próbki małymi porcjami.
+
+    Każdy poziom traci najwyżej ``batch_size`` wierszy na wywołanie, więc
+    czyszczenie rozkłada się na kolejne rundy zamiast blokować bazę.
+    Zwraca liczbę usuniętych wierszy.
+    """
+    now = int(now or time.time())
+    deleted = 0
+    conn = get_connection()
+    for table, _, retention in METRICS_TIERS:
+        # Każda porcja to osobna, krótka transakcja (tryb autocommit)
+        cursor = conn.execute(
+            f"""
+            DELETE FROM {table} WHERE (site_id, ts) IN (
+                SELECT site_id, ts FROM {table} WHERE ts < ? LIMIT ?
+            )
+            """,
+            (now - retention, batch_size)
+        )
+        deleted += cursor.rowcount
+    return deleted
+
+
+def get_latest_metrics_round():
+    """Ostatnia zapisana runda próbnika: (ts, wiersze) albo (None, [])."""
+    conn = get_connection()
+    ts = conn.execute("SELECT MAX(ts) FROM metrics_raw").fetchone()[0]
+    if ts is None:
+        return None, []
+    return ts, conn.execute("SELECT * FROM metrics_raw WHERE ts = ?", (ts,)).fetchall()
+
+
+def get_metrics_history(site_id, start, end=None, tier=None):
+    """Zwraca próbki strony z zakresu [start, end].
+
+    Bez podanego ``tier`` wybierany jest najdokładniejszy poziom, który
+    jeszcze przechowuje dane z początku zakresu.
+    """
+    end = int(end or time.time())
+    start = int(start)
+    if tier is None:
+        age = time.time() - start
+        tier = next((t for t, _, retention in METRICS_TIERS if age <= retention), METRICS_TIERS[-1][0])
+    if tier not in {t for t, _, _ in METRICS_TIERS}:
+        raise ValueError(f"Nieznany poziom metryk: {tier}")
+
+    conn = get_connection()
+    rows = conn.execute(
+        f"SELECT * FROM {tier} WHERE site_id = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+        (site_id, start, end)
+    ).fetchall()
+    return tier, rows
+
+
+# Pomiar czasu funkcji bazy; pomijamy obsługę połączeń i licznik wersji (zbyt tanie)
+instrumentation.instrument_module(
+    sys.modules[__name__], instrumentation.DB_CALLS,
+    skip={'get_connection', 'close_connection', 'transaction', 'get_data_version', 'bump_data_version'},
+)
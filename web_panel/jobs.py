@@ -0,0 +1,152 @@
+"""Trwała kolejka zadań panelu (w SQLite) obsługiwana przez pulę wątków."""
+import json
+import os
+import threading
+import time
+
+from web_panel import database
+
+# Ile zadań wykonujemy równolegle (różne strony; jedna strona - po kolei)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+# Co ile sekund pracownik sprawdza kolejkę, gdy nikt go nie obudził
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "2"))
+# Opóźnienie pierwszej ponownej próby (kolejne rosną dwukrotnie)
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", "5"))
+# Ile prób ma zadanie
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# Po ilu sekundach usuwamy zakończone zadania
+JOB_RETENTION = float(os.environ.get("JOB_RETENTION", str(7 * 24 * 3600)))
+
+
+class JobFailed(Exception):
+    """Błąd, którego ponowienie nic nie da (np. strona nie istnieje)."""
+
+
+_handlers = {}
+_failure_handlers = {}
+_wake = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def register(kind, handler, on_failure=None):
+    """Rejestruje ``handler(site_name, payload)`` dla zadań rodzaju ``kind``.
+
+    Handler powinien być idempotentny - po restarcie panelu przerwane
+    zadanie wykonuje się ponownie. Zwracany słownik trafia do ``result``.
+    ``on_failure(site_name, payload, error)`` sprząta po zadaniu, które
+    nie powiodło się ostatecznie (bez kolejnych prób).
+    """
+    _handlers[kind] = handler
+    if on_failure is not None:
+        _failure_handlers[kind] = on_failure
+
+
+def submit(kind, site_name, payload=None, idempotency_key=None):
+    """Dodaje zadanie do kolejki i zwraca je jako słownik."""
+    if kind not in _handlers:
+        raise ValueError(f"Nieznany rodzaj zadania: {kind}")
+    row = database.enqueue_job(
+        kind, site_name, json.dumps(payload or {}),
+        idempotency_key=idempotency_key, max_attempts=JOB_MAX_ATTEMPTS
+    )
+    _wake.set()
+    return to_dict(row)
+
+
+def to_dict(row):
+    return {
+        'id': row['id'],
+        'kind': row['kind'],
+        'site': row['site_name'],
+        'status': row['status'],
+        'attempts': row['attempts'],
+        'max_attempts': row['max_attempts'],
+        'result': json.loads(row['result']) if row['result'] else None,
+        'error': row['error'],
+        'created_at': row['created_at'],
+        'started_at': row['started_at'],
+        'finished_at': row['finished_at'],
+    }
+
+
+def get_job(job_id):
+    row = database.get_job(job_id)
+    return to_dict(row) if row else None
+
+
+def find(idempotency_key):
+    """Zadanie dodane wcześniej z tym samym kluczem idempotencji lub None."""
+    row = database.get_job_by_key(idempotency_key) if idempotency_key else None
+    return to_dict(row) if row else None
+
+
+def is_pending(site_name):
+    """Czy strona ma zadania w kolejce lub w trakcie."""
+    return bool(database.get_pending_jobs(site_name))
+
+
+def run_job(job):
+    """Wykonuje jedno pobrane zadanie i zapisuje wynik lub błąd."""
+    handler = _handlers.get(job['kind'])
+    try:
+        if handler is None:
+            raise JobFailed(f"Brak obsługi zadania {job['kind']}")
+        result = handler(job['site_name'], json.loads(job['payload']))
+    except Exception as e:
+        retry = not isinstance(e, JobFailed) and job['attempts'] < job['max_attempts']
+        retry_at = time.time() + JOB_RETRY_DELAY * 2 ** (job['attempts'] - 1) if retry else None
+        database.fail_job(job['id'], str(e), retry_at)
+        suffix = f" - ponowienie za {retry_at - time.time():.0f}s" if retry else ""
+        print(f"❌ Zadanie {job['kind']} #{job['id']} ({job['site_name']}): {e}{suffix}")
+        if not retry:
+            _failed(job, e)
+        return False
+    database.finish_job(job['id'], json.dumps(result) if result is not None else None)
+    print(f"✅ Zadanie {job['kind']} #{job['id']} ({job['site_name']}) wykonane")
+    return True
+
+
+def _failed(job, error):
+    """Wywołuje sprzątanie po ostatecznie nieudanym zadaniu."""
+    on_failure = _failure_handlers.get(job['kind'])
+    if on_failure is None:
+        return
+    try:
+        on_failure(job['site_name'], json.loads(job['payload']), error)
+    except Exception as e:
+        print(f"⚠️  Sprzątanie po zadaniu {job['kind']} #{job['id']} nieudane: {e}")
+
+
+def _work(stop_event):
+    while not stop_event.is_set():
+        try:
+            job = database.claim_job()
+        except Exception as e:
+            print(f"⚠️  Błąd kolejki zadań: {e}")
+            job = None
+        if job is None:
+            _wake.wait(JOB_POLL_INTERVAL)
+            _wake.clear()
+            continue
+        run_job(job)
+        # Zakończenie zadania może odblokować kolejne zadanie tej strony
+        _wake.set()
+
+
+def start_workers(workers=None):
+    """Uruchamia (jednokrotnie) pulę wątków obsługujących kolejkę."""
+    with _workers_lock:
+        if _workers:
+            return _workers
+        requeued = database.requeue_running_jobs()
+        if requeued:
+            print(f"🔁 Wznawiam {requeued} przerwanych zadań")
+        database.prune_jobs(time.time() - JOB_RETENTION)
+        stop_event = threading.Event()
+        for i in range(workers or JOB_WORKERS):
+            thread = threading.Thread(target=_work, args=(stop_event,), name=f"jobs-{i}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+        print(f"🧵 Kolejka zadań: {len(_workers)} wątków")
+    return _workers
@@ -0,0 +1,120 @@
+"""Wybór procesu lidera, który jako jedyny wykonuje zadania sterujące panelu."""
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from core_engine import instrumentation
+from web_panel import database
+
+# Katalog plików blokad (wspólny dla wszystkich workerów - ten sam co baza)
+LOCK_DIR = os.environ.get("LEADER_LOCK_DIR", database.DB_PATH)
+LEADER_LOCK_NAME = "control-plane.lock"
+INIT_LOCK_NAME = "init.lock"
+# Co ile sekund lider ponawia nieudane kroki startu (np. Docker chwilowo niedostępny)
+STEP_RETRY_INTERVAL = float(os.environ.get("CONTROL_PLANE_RETRY_INTERVAL", "30"))
+
+# Nazwy kroków startu, które jeszcze się nie powiodły
+_pending_steps = []
+
+
+def lock_path(name):
+    return os.path.join(LOCK_DIR, name)
+
+
+@contextmanager
+def exclusive(name):
+    """Krótka blokada na czas bloku (np. migracji bazy przy starcie kilku workerów naraz)."""
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    with open(lock_path(name), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class LeaderElection(threading.Thread):
+    """Wątek czekający na blokadę lidera; po jej zdobyciu uruchamia ``on_elected``.
+
+    Blokada (flock) jest trzymana do końca procesu - gdy lider padnie, jądro
+    ją zwalnia i przejmuje ją kolejny czekający worker.
+    """
+
+    def __init__(self, on_elected):
+        super().__init__(name="leader-election", daemon=True)
+        self.on_elected = on_elected
+        self.elected = threading.Event()
+        self._file = None
+
+    def run(self):
+        os.makedirs(LOCK_DIR, exist_ok=True)
+        self._file = open(lock_path(LEADER_LOCK_NAME), 'a')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        self.elected.set()
+        print(f"👑 Proces {os.getpid()} przejmuje zadania sterujące")
+        started = time.perf_counter()
+        try:
+            self.on_elected()
+        except Exception as e:
+            print(f"🔥 Błąd uruchamiania zadań sterujących: {e}")
+        elapsed = time.perf_counter() - started
+        instrumentation.record_startup('control_plane', elapsed)
+        print(f"👑 Zadania sterujące uruchomione w {elapsed:.2f}s")
+
+
+def _attempt(steps):
+    """Wykonuje kroki po kolei; błąd jednego nie zatrzymuje kolejnych. Zwraca nieudane."""
+    failed = []
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            print(f"🔥 Krok startu {name} nieudany: {e}")
+            failed.append((name, step))
+    _pending_steps[:] = [name for name, _ in failed]
+    return failed
+
+
+def _retry(failed, interval):
+    while failed:
+        time.sleep(interval)
+        failed = _attempt(failed)
+    print("👑 Wszystkie zadania sterujące działają")
+
+
+def run_steps(steps, retry_interval=None):
+    """Uruchamia kroki ``(nazwa, funkcja)`` niezależnie; nieudane ponawia w tle do skutku.
+
+    Kroki muszą być idempotentne. Zwraca nazwy kroków, które się nie powiodły.
+    """
+    failed = _attempt(steps)
+    if failed:
+        threading.Thread(
+            target=_retry, args=(failed, retry_interval or STEP_RETRY_INTERVAL),
+            name="control-plane-retry", daemon=True
+        ).start()
+    return [name for name, _ in failed]
+
+
+def get_pending_steps():
+    return list(_pending_steps)
+
+
+_election = None
+_election_lock = threading.Lock()
+
+
+def start_election(on_elected):
+    """Uruchamia (jednokrotnie) ubieganie się procesu o rolę lidera."""
+    global _election
+    with _election_lock:
+        if _election is None:
+            _election = LeaderElection(on_elected)
+            _election.start()
+    return _election
+
+
+def is_leader():
+    return _election is not None and _election.elected.is_set()
@@ -0,0 +1,33 @@
+"""Produkcyjny punkt wejścia WSGI panelu (``gunicorn -c gunicorn.conf.py``).
+
+Każdy worker tylko importuje aplikację i sprawdza bazę; uzgodnienie
+kontenerów, próbnik, kolejka zadań i pozostałe wątki sterujące działają
+w jednym procesie - tym, który zdobędzie blokadę lidera. Gdy lider padnie,
+rolę przejmuje kolejny worker.
+"""
+import os
+import time
+
+_started = time.perf_counter()
+
+from core_engine import instrumentation  # noqa: E402
+from web_panel import app as panel  # noqa: E402
+from web_panel import leader  # noqa: E402
+
+instrumentation.record_startup('import', time.perf_counter() - _started)
+
+_init_started = time.perf_counter()
+# Migracje bazy po kolei - workery startują równocześnie
+with leader.exclusive(leader.INIT_LOCK_NAME):
+    panel.init_worker()
+instrumentation.record_startup('init', time.perf_counter() - _init_started)
+
+leader.start_election(panel.start_control_plane)
+# Histogramy workera trafiają do katalogu wspólnego - /metrics/prometheus sumuje wszystkie procesy
+instrumentation.start_flusher()
+
+_cold_start = time.perf_counter() - _started
+instrumentation.record_startup('worker', _cold_start)
+print(f"⚡ Worker {os.getpid()} gotowy w {_cold_start:.3f}s")
+
+app = panel.app